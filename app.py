@@ -3,6 +3,7 @@ from discord.ext import commands
 import os
 from dotenv import load_dotenv
 import asyncio
+import aiohttp
 import database # Import the database file
 
 # --- SETUP ---
@@ -22,6 +23,13 @@ class MyBot(commands.Bot):
         super().__init__(command_prefix="/", intents=intents)
         # Attach the database manager to the bot instance
         self.db = database.DatabaseManager(self)
+        # One pooled HTTP session for outside APIs (Tenor etc.), opened in setup_hook
+        self.http_session = None
+
+    async def setup_hook(self):
+        """Starts the database background tasks and the shared HTTP session once the event loop is running."""
+        await self.db.start()
+        self.http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
 
     async def on_ready(self):
         """Event that runs when the bot is online and all cogs are loaded."""
@@ -34,6 +42,13 @@ class MyBot(commands.Bot):
         except Exception as e:
             print(f"Failed to sync commands: {e}")
 
+    async def close(self):
+        """Releases the HTTP session and database connections before the bot shuts down."""
+        if self.http_session is not None:
+            await self.http_session.close()
+        await self.db.close()
+        await super().close()
+
 bot = MyBot()
 
 # --- MAIN FUNCTION ---
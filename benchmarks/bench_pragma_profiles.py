@@ -0,0 +1,66 @@
+# benchmarks/bench_pragma_profiles.py
+#
+# Measures update_user_data throughput under each PRAGMA profile:
+#   direct      the _sync method called in a loop, one transaction (and sync) per write
+#   sequential  awaited one at a time; each write also waits out the writer's batch window
+#   concurrent  many writes in flight, which the group-commit writer batches
+# Each profile gets a fresh database.
+# Run from the repository root:  python benchmarks/bench_pragma_profiles.py
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+DIRECT_WRITES = 5000
+SEQUENTIAL_WRITES = 2000
+CONCURRENT_WRITES = 20000
+CONCURRENCY = 200
+GUILD_ID = 1
+
+async def direct(db):
+    def run():
+        for user_id in range(DIRECT_WRITES):
+            db._update_user_data_sync(user_id, GUILD_ID, {"xp": user_id, "level": 1})
+    await asyncio.get_running_loop().run_in_executor(None, run)
+    return DIRECT_WRITES
+
+async def sequential(db):
+    for user_id in range(SEQUENTIAL_WRITES):
+        await db.update_user_data(user_id, GUILD_ID, {"xp": user_id, "level": 2})
+    return SEQUENTIAL_WRITES
+
+async def concurrent(db):
+    for start in range(0, CONCURRENT_WRITES, CONCURRENCY):
+        await asyncio.gather(*[
+            db.update_user_data(user_id % 5000, GUILD_ID, {"xp": user_id, "level": 3})
+            for user_id in range(start, start + CONCURRENCY)
+        ])
+    return CONCURRENT_WRITES
+
+async def run_profile(profile: str):
+    os.chdir(tempfile.mkdtemp())
+    db = database.DatabaseManager(bot=None, economy_profile=profile, shop_profile=profile)
+    results = []
+    for label, workload in (("direct", direct), ("sequential", sequential), ("concurrent", concurrent)):
+        start = time.perf_counter()
+        writes = await workload(db)
+        results.append((label, writes / (time.perf_counter() - start)))
+    await db.close()
+    return results
+
+def main():
+    rows = []
+    for profile in database.PRAGMA_PROFILES:
+        for label, rate in asyncio.run(run_profile(profile)):
+            rows.append((profile, label, rate))
+    print(f"\n{'profile':<10} {'workload':<12} {'writes/s':>10}")
+    for profile, label, rate in rows:
+        print(f"{profile:<10} {label:<12} {rate:>10,.0f}")
+
+if __name__ == "__main__":
+    main()
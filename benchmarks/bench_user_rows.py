@@ -0,0 +1,66 @@
+# benchmarks/bench_user_rows.py
+#
+# Measures get_user_data latency for existing users (hit) and first-time users (miss).
+# A miss used to insert the row; it now returns a default record without writing.
+# Run from the repository root:  python benchmarks/bench_user_rows.py
+
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+ROUNDS = 5000
+GUILD_ID = 1
+
+def legacy_get_user_data(con: sqlite3.Connection, user_id: int, guild_id: int):
+    """The previous implementation: SELECT, then INSERT + commit + SELECT on a miss."""
+    cur = con.cursor()
+    cur.execute("SELECT * FROM users WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
+    user_data = cur.fetchone()
+    if not user_data:
+        cur.execute("INSERT INTO users (user_id, guild_id) VALUES (?, ?)", (user_id, guild_id))
+        con.commit()
+        cur.execute("SELECT * FROM users WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
+        user_data = cur.fetchone()
+    return dict(user_data)
+
+def timed(label: str, func, user_ids):
+    start = time.perf_counter()
+    for user_id in user_ids:
+        func(user_id)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / len(user_ids) * 1e6:8.1f} µs/call")
+
+def main():
+    os.chdir(tempfile.mkdtemp())
+    db = database.DatabaseManager(bot=None)
+    legacy_con = sqlite3.connect(db.economy_db_path)
+    legacy_con.row_factory = sqlite3.Row
+
+    def legacy_fresh_connection(user_id):
+        # What every call used to pay before connections were pooled.
+        with sqlite3.connect(db.economy_db_path) as con:
+            con.row_factory = sqlite3.Row
+            return legacy_get_user_data(con, user_id, GUILD_ID)
+
+    print(f"\n{ROUNDS} calls each, economy.db in {os.getcwd()}\n")
+    # Misses: every call sees a brand-new user id.
+    timed("miss  before, new conn", legacy_fresh_connection, range(0, ROUNDS))
+    timed("miss  before, pooled", lambda u: legacy_get_user_data(legacy_con, u, GUILD_ID), range(ROUNDS, 2 * ROUNDS))
+    timed("miss  after  (no write)", lambda u: db._get_user_data_sync(u, GUILD_ID), range(2 * ROUNDS, 3 * ROUNDS))
+    # Hits: the same users again, with their rows now in place.
+    for user_id in range(2 * ROUNDS, 3 * ROUNDS):
+        db._update_user_data_sync(user_id, GUILD_ID, {"xp": 1})
+    timed("hit   before, new conn", legacy_fresh_connection, range(0, ROUNDS))
+    timed("hit   before, pooled", lambda u: legacy_get_user_data(legacy_con, u, GUILD_ID), range(ROUNDS, 2 * ROUNDS))
+    timed("hit   after", lambda u: db._get_user_data_sync(u, GUILD_ID), range(2 * ROUNDS, 3 * ROUNDS))
+
+    legacy_con.close()
+    db._writer.stop()
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from .channel_config import get_guild_settings, save_all_settings, get_all_settings, is_owner_or_has_admin_role, PERKS
+from .channel_config import get_guild_settings, set_guild_setting, is_owner_or_has_admin_role, PERKS
 import asyncio
 import time
+import json
+import io
 
 class AdminCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -136,9 +138,7 @@ class AdminCog(commands.Cog):
         if amount <= 0:
             await interaction.followup.send("Please provide a positive number of coins to remove.", ephemeral=True)
             return
-        player = await self.bot.db.get_user_data(user.id, interaction.guild.id)
-        new_balance = max(0, player['balance'] - amount)
-        await self.bot.db.update_user_data(user.id, interaction.guild.id, {"balance": new_balance})
+        new_balance = await self.bot.db.add_balance(user.id, interaction.guild.id, -amount, clamp=True, reason="admin", ref=f"admin:{interaction.user.id}")
         await interaction.followup.send(f"✅ Removed **{amount:,}** coins from {user.mention}. Their new balance is **{new_balance:,}**.")
 
     adminrole_group = app_commands.Group(name="adminrole", description="Manage which roles have admin access.")
@@ -146,30 +146,23 @@ class AdminCog(commands.Cog):
     @adminrole_group.command(name="add", description="[Admin] Grant a role admin command access.")
     @app_commands.checks.has_permissions(administrator=True)
     async def add_admin_role(self, interaction: discord.Interaction, role: discord.Role):
-        all_settings = get_all_settings()
-        guild_id_str = str(interaction.guild.id)
-        if guild_id_str not in all_settings: all_settings[guild_id_str] = {}
-        admin_roles = all_settings[guild_id_str].get("ADMIN_ROLES", [])
+        admin_roles = list(get_guild_settings(interaction.guild.id).get("ADMIN_ROLES", []))
         if role.id in admin_roles:
             await interaction.response.send_message(f"❌ {role.mention} is already an admin role.", ephemeral=True)
             return
         admin_roles.append(role.id)
-        all_settings[guild_id_str]["ADMIN_ROLES"] = admin_roles
-        save_all_settings(all_settings)
+        await set_guild_setting(interaction.guild.id, "ADMIN_ROLES", admin_roles)
         await interaction.response.send_message(f"✅ Granted admin access to {role.mention}.", ephemeral=True)
 
     @adminrole_group.command(name="remove", description="[Admin] Revoke a role's admin command access.")
     @app_commands.checks.has_permissions(administrator=True)
     async def remove_admin_role(self, interaction: discord.Interaction, role: discord.Role):
-        all_settings = get_all_settings()
-        guild_id_str = str(interaction.guild.id)
-        admin_roles = all_settings.get(guild_id_str, {}).get("ADMIN_ROLES", [])
+        admin_roles = list(get_guild_settings(interaction.guild.id).get("ADMIN_ROLES", []))
         if role.id not in admin_roles:
             await interaction.response.send_message(f"❌ {role.mention} is not an admin role.", ephemeral=True)
             return
         admin_roles.remove(role.id)
-        all_settings[guild_id_str]["ADMIN_ROLES"] = admin_roles
-        save_all_settings(all_settings)
+        await set_guild_setting(interaction.guild.id, "ADMIN_ROLES", admin_roles)
         await interaction.response.send_message(f"✅ Revoked admin access from {role.mention}.", ephemeral=True)
 
     @adminrole_group.command(name="list", description="[Admin] List all roles with admin command access.")
@@ -189,11 +182,44 @@ class AdminCog(commands.Cog):
     @app_commands.check(is_owner_or_has_admin_role)
     async def givecoins(self, interaction: discord.Interaction, user: discord.User, amount: int):
         await interaction.response.defer()
-        player = await self.bot.db.get_user_data(user.id, interaction.guild.id)
-        new_balance = player['balance'] + amount
-        await self.bot.db.update_user_data(user.id, interaction.guild.id, {"balance": new_balance})
+        new_balance = await self.bot.db.add_balance(user.id, interaction.guild.id, amount, reason="admin", ref=f"admin:{interaction.user.id}")
         await interaction.followup.send(f"✅ Gave **{amount:,}** coins to {user.mention}. Their new balance is **{new_balance:,}**.")
 
+    @app_commands.command(name="history", description="[Admin] Show a user's recent coin transactions.")
+    @app_commands.check(is_owner_or_has_admin_role)
+    @app_commands.describe(user="The user whose transactions to show.", page="Page number, newest first (15 per page).")
+    async def history(self, interaction: discord.Interaction, user: discord.User, page: app_commands.Range[int, 1] = 1):
+        await interaction.response.defer(ephemeral=True)
+        entries = await self.bot.db.get_ledger(user.id, interaction.guild.id, limit=15, offset=(page - 1) * 15)
+        if not entries:
+            await interaction.followup.send(f"No coin transactions found for {user.mention} on page {page}.", ephemeral=True)
+            return
+        lines = []
+        for entry in entries:
+            line = f"<t:{int(entry['ts'])}:f> **{entry['delta']:+,}** · {entry['reason']}"
+            if entry['ref']:
+                line += f" · `{entry['ref']}`"
+            lines.append(line)
+        embed = discord.Embed(title=f"🧾 Coin History for {user.display_name}", description="\n".join(lines), color=discord.Color.blurple())
+        player = await self.bot.db.get_user_data(user.id, interaction.guild.id)
+        embed.set_footer(text=f"Page {page} · Current balance: {player['balance']:,}")
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="rebuildbalances", description="[Admin] Check (or fix) balances against the coin ledger.")
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.describe(apply="Overwrite the balances that disagree with the ledger (default: only report them).")
+    async def rebuildbalances(self, interaction: discord.Interaction, apply: bool = False):
+        await interaction.response.defer(ephemeral=True)
+        drift = await self.bot.db.rebuild_balances(interaction.guild.id, apply=apply)
+        if not drift:
+            await interaction.followup.send("✅ Every balance matches the ledger.", ephemeral=True)
+            return
+        lines = [f"<@{row['user_id']}>: {row['snapshot']:,} → {row['rebuilt']:,}" for row in drift[:20]]
+        if len(drift) > 20:
+            lines.append(f"...and {len(drift) - 20} more")
+        action = "Fixed" if apply else "Found"
+        await interaction.followup.send(f"{action} **{len(drift)}** balances that disagree with the ledger:\n" + "\n".join(lines), ephemeral=True)
+
     @app_commands.command(name="removeitem", description="[Admin] Remove an item from the shop.")
     @app_commands.check(is_owner_or_has_admin_role)
     async def removeitem(self, interaction: discord.Interaction, item_id: int):
@@ -207,6 +233,9 @@ class AdminCog(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         if user:
             await self.bot.db.update_user_data(user.id, interaction.guild.id, {"level": 1, "xp": 0})
+            economy_cog = self.bot.get_cog("EconomyCog")
+            if economy_cog:
+                economy_cog.leaderboard_cache.invalidate(interaction.guild.id)
             await interaction.followup.send(f"✅ Reset level and XP for {user.mention}.")
         else:
             all_users = await self.bot.db.get_all_users_in_guild(interaction.guild.id)
@@ -215,6 +244,9 @@ class AdminCog(commands.Cog):
                 if user_data['level'] > 11:
                     await self.bot.db.update_user_data(user_data['user_id'], interaction.guild.id, {"level": 9, "xp": 0})
                     updated_count += 1
+            economy_cog = self.bot.get_cog("EconomyCog")
+            if economy_cog:
+                economy_cog.leaderboard_cache.invalidate(interaction.guild.id)
             await interaction.followup.send(f"✅ Level reset complete! Affected **{updated_count}** players.")
 
     @app_commands.command(name="featureitem", description="[Admin] Feature an item in the new shop view.")
@@ -229,6 +261,96 @@ class AdminCog(commands.Cog):
         await self.bot.db.set_featured_item(item_id, interaction.guild.id)
         await interaction.followup.send(f"✅ **{item['item_name']}** is now the featured item in the shop!")
 
+    @app_commands.command(name="dbstats", description="[Admin] Show database query statistics.")
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.describe(dump="Also write the full statistics to a JSON file and attach it.")
+    async def dbstats(self, interaction: discord.Interaction, dump: bool = False):
+        await interaction.response.defer(ephemeral=True)
+        stats = self.bot.db.get_all_stats()
+        queries = stats["queries"]
+        executor = stats["executor"]
+
+        embed = discord.Embed(title="🗄️ Database Statistics", color=discord.Color.dark_teal())
+        # The methods that cost the most time overall come first.
+        top_methods = sorted(queries["methods"].items(), key=lambda item: item[1]["total_ms"], reverse=True)[:10]
+        lines = []
+        for name, method in top_methods:
+            p95 = f"{method['p95_ms']}ms" if method['p95_ms'] is not None else ">1s"
+            lines.append(
+                f"`{name}` {method['calls']:,} calls · avg {method['avg_ms']:.2f}ms · p95 ≤{p95} · "
+                f"max {method['max_ms']:.1f}ms · {method['rows']:,} rows" + (f" · **{method['errors']} errors**" if method['errors'] else "")
+            )
+        embed.description = "\n".join(lines) or "No database calls recorded yet."
+        embed.add_field(
+            name="Queues",
+            value=f"Reads: {executor['reads']['queued']} queued, {executor['reads']['in_flight']} running\n"
+                  f"Writes: {executor['writes']['queued']} queued, {executor['writes']['in_flight']} running\n"
+                  f"Shop writes: {executor['shop_writes']['queued']} queued, {executor['shop_writes']['in_flight']} running",
+            inline=True
+        )
+        slow_queries = queries["slow_queries"]
+        slow_text = f"{len(slow_queries)} logged (> {queries['slow_query_ms']:g}ms)"
+        if slow_queries:
+            slow_text += f"\nLatest: `{slow_queries[-1]['method']}` {slow_queries[-1]['ms']:.1f}ms"
+        embed.add_field(name="Slow Queries", value=slow_text, inline=True)
+        retries = stats["retries"]
+        retry_text = (
+            f"{sum(r['retries'] for r in retries.values()):,} retries · "
+            f"{sum(r['recovered'] for r in retries.values()):,} recovered · "
+            f"{sum(r['give_ups'] for r in retries.values()):,} gave up"
+        )
+        embed.add_field(name="Lock Retries", value=retry_text, inline=True)
+        pool_text = "\n".join(
+            f"{name}: {pool['size']} open · connect avg {pool['avg_connect_ms']:.1f}ms, max {pool['max_connect_ms']:.1f}ms"
+            for name, pool in stats["pools"].items()
+        )
+        embed.add_field(name="Connections", value=pool_text or "None opened yet.", inline=False)
+        economy_cog = self.bot.get_cog("EconomyCog")
+        if economy_cog:
+            board = stats["leaderboard_cache"] = economy_cog.leaderboard_cache.stats()
+            embed.add_field(
+                name="Leaderboard Cache",
+                value=f"{board['hit_rate']:.0%} hit rate ({board['hits']:,} hits, {board['misses']:,} misses)\n"
+                      f"{board['invalidations']:,} invalidations · {board['guilds']} pages cached",
+                inline=True
+            )
+        channel_config_cog = self.bot.get_cog("ChannelConfigCog")
+        if channel_config_cog:
+            joins = stats["joins"] = channel_config_cog.joins.stats()
+            embed.add_field(
+                name="Join Queue",
+                value=f"{joins['role_queue_depth']} roles queued · {joins['pending_welcomes']} welcomes pending\n"
+                      f"Role lag avg {joins['avg_role_lag']:.1f}s, max {joins['max_role_lag']:.1f}s\n"
+                      f"Welcome lag avg {joins['avg_welcome_lag']:.1f}s, max {joins['max_welcome_lag']:.1f}s\n"
+                      f"{joins['role_failures']:,} role failures · {joins['rate_limited']:,} rate limited",
+                inline=True
+            )
+
+        if not dump:
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
+        filename = f"dbstats-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        data = json.dumps(stats, indent=2)
+        with open(filename, "w") as f:
+            f.write(data)
+        embed.set_footer(text=f"Full statistics written to {filename}")
+        await interaction.followup.send(embed=embed, file=discord.File(io.BytesIO(data.encode()), filename=filename), ephemeral=True)
+
+    @app_commands.command(name="dbvacuum", description="[Owner] Rewrite the database files once so they can be vacuumed incrementally.")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def dbvacuum(self, interaction: discord.Interaction):
+        # The files are shared by every server, and the VACUUM blocks all writes while it runs.
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message("❌ Only the bot owner can run this command.", ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        report = await self.bot.db.enable_incremental_vacuum()
+        if not report:
+            await interaction.followup.send("✅ Incremental vacuum is already enabled on every database file.", ephemeral=True)
+            return
+        lines = [f"`{entry['database']}`: {entry['step']} in {entry['ms'] / 1000:.1f}s" for entry in report]
+        await interaction.followup.send("✅ Converted:\n" + "\n".join(lines), ephemeral=True)
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(AdminCog(bot))
 
@@ -3,18 +3,42 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import json
 import os
+import time
+import copy
 import typing
+from types import MappingProxyType
+from collections import OrderedDict, deque
 import random # --- ADDED ---
+import asyncio
+import io
+from urllib.parse import urlparse, parse_qs
 import aiohttp # --- ADDED ---
 
 # --- ADDED: Load the Tenor API Key ---
 from dotenv import load_dotenv
 load_dotenv()
 TENOR_API_KEY = os.getenv("TENOR_API_KEY")
-
-CONFIG_FILE = "channel_config.json"
+# Overridable so lookups can be pointed at a local stand-in server.
+TENOR_BASE_URL = os.getenv("TENOR_BASE_URL", "https://tenor.googleapis.com/v2")
+GIF_CACHE_TTL = 3600 # Seconds a search term's results are served before being refreshed
+GIF_LOOKUP_TIMEOUT = 3.0 # Seconds a handler waits for Tenor before using the fallback GIF
+GIF_NEGATIVE_TTL = 60 # Seconds a failed or empty lookup is remembered, so an outage costs one timeout, not one per call
+FALLBACK_GIF = "https://i.imgur.com/gJ3s2T3.gif" # A default GIF if the API fails
+
+WELCOME_GIF_PATH = "cogs/welcome.gif"
+WELCOME_GIF_EXPIRY_MARGIN = 3600 # Re-upload this many seconds before Discord's signed CDN link expires
+WELCOME_GIF_VERIFY_INTERVAL = 600 # Seconds between checks that the remembered CDN link still loads
+
+# Join bursts: once a guild sees JOIN_BURST_THRESHOLD joins within JOIN_BURST_WINDOW
+# seconds, welcomes are held for WELCOME_BATCH_DELAY seconds and sent as one message.
+JOIN_BURST_THRESHOLD = 5
+JOIN_BURST_WINDOW = 10.0
+WELCOME_BATCH_DELAY = 5.0
+WELCOME_BATCH_MAX = 25 # Members mentioned per combined welcome message
+JOIN_ROLE_MAX_ATTEMPTS = 3
+
+SETTINGS_RECHECK_INTERVAL = 2.0 # Seconds between checks for settings changed outside this process
 
 # --- Perk Definitions (unchanged) ---
 PERKS = {
@@ -24,30 +48,200 @@ PERKS = {
     "supreme": {"multiplier": 2.0, "daily_bonus": 2000, "shop_discount": 0.10, "pay_limit": 25000, "flair": "👑"}
 }
 
-# --- Helper functions (get_all_settings, save_all_settings, etc. are unchanged) ---
+# --- Settings cache ---
+# Guild settings live in the guild_settings table of economy.db (see database.py).
+# They are held in memory here and readers get frozen per-guild snapshots.
+
+def _freeze(value):
+    """Read-only copy of a JSON value: dicts become mapping proxies, lists become tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+EMPTY_SETTINGS = MappingProxyType({})
+
+class SettingsCache:
+    """Holds every guild's settings in memory and hands out frozen per-guild snapshots.
+
+    Reads never touch the database. Everything is loaded once when the cog is
+    set up. Writes made through this module are applied once they have
+    committed. Changes from anywhere else are picked up by a background poll
+    of the database's settings_version, every SETTINGS_RECHECK_INTERVAL
+    seconds, on the database reader threads.
+    """
+    def __init__(self):
+        self.db = None
+        self._settings = {} # guild_id -> {key: value}
+        self._snapshots = {} # guild_id -> frozen settings
+        self._version = None # settings_version the cached rows match
+        self._committed = 0 # Newest version written through apply(); older loads are stale
+        self._poll_task = None
+        self.loads = 0
+
+    async def bind(self, db):
+        self.db = db
+        self._version = None
+        await self.refresh()
+
+    async def refresh(self):
+        """Reloads everything if settings_version moved since the last load."""
+        if self.db is None:
+            return
+        if self._version is not None and await self.db.get_settings_version() == self._version:
+            return
+        version, all_settings = await self.db.load_guild_settings()
+        # A write may have committed (and been applied) while this load was in flight.
+        if version < self._committed or (self._version is not None and version < self._version):
+            return
+        self._version, self._settings = version, all_settings
+        self._snapshots = {}
+        self.loads += 1
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(SETTINGS_RECHECK_INTERVAL)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Failed to refresh guild settings: {e}")
+
+    def start(self):
+        if self._poll_task is None:
+            self._poll_task = asyncio.create_task(self._poll())
+
+    def stop(self):
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+
+    def all(self) -> dict:
+        return {str(guild_id): copy.deepcopy(settings) for guild_id, settings in self._settings.items()}
+
+    def guild(self, guild_id: int):
+        snapshot = self._snapshots.get(guild_id)
+        if snapshot is None:
+            guild_settings = self._settings.get(guild_id)
+            snapshot = _freeze(guild_settings) if guild_settings else EMPTY_SETTINGS
+            self._snapshots[guild_id] = snapshot
+        return snapshot
+
+    async def apply(self, changes: list):
+        """Writes (guild_id, key, value) changes, then applies them to the cache once committed."""
+        changes = [(guild_id, key, copy.deepcopy(value)) for guild_id, key, value in changes]
+        try:
+            previous_version, version = await self.db.write_guild_settings(changes)
+        except Exception as e:
+            print(f"Failed to save guild settings: {e}")
+            raise
+        if self._version is not None and self._version >= version:
+            return # A reload already picked this write up
+        for guild_id, key, value in changes:
+            guild_settings = self._settings.setdefault(guild_id, {})
+            if value is None:
+                guild_settings.pop(key, None)
+            else:
+                guild_settings[key] = value
+            self._snapshots.pop(guild_id, None)
+        self._committed = max(self._committed, version)
+        # Only skip the next reload if nothing else changed since the rows we hold.
+        if self._version == previous_version:
+            self._version = version
+
+_settings_cache = SettingsCache()
+
+async def bind_settings_store(db):
+    """Points the settings helpers at the bot's DatabaseManager and loads them. Called from setup()."""
+    await _settings_cache.bind(db)
+
+# --- Helper functions ---
 def get_all_settings():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as f:
-            try: return json.load(f)
-            except json.JSONDecodeError: return {}
-    return {}
+    """Returns a private, mutable copy of every guild's settings, keyed by guild id string."""
+    return _settings_cache.all()
 
 def save_all_settings(settings: dict):
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(settings, f, indent=4)
-
-def get_guild_settings(guild_id: int) -> dict:
-    all_settings = get_all_settings()
-    return all_settings.get(str(guild_id), {})
+    """Writes the keys that differ from the stored settings; unchanged guilds and keys aren't touched."""
+    current = _settings_cache.all()
+    changes = []
+    for guild_id_str in settings.keys() | current.keys():
+        new, old = settings.get(guild_id_str, {}), current.get(guild_id_str, {})
+        for key in new.keys() | old.keys():
+            if new.get(key) != old.get(key):
+                changes.append((int(guild_id_str), key, new.get(key)))
+    if changes:
+        return asyncio.ensure_future(_settings_cache.apply(changes))
+
+async def set_guild_setting(guild_id: int, key: str, value):
+    """Sets (or with value=None, removes) a single setting; only that row is written."""
+    await _settings_cache.apply([(guild_id, key, value)])
+
+def get_guild_settings(guild_id: int):
+    """Returns a read-only snapshot of one guild's settings (lists come back as tuples)."""
+    return _settings_cache.guild(guild_id)
+
+# --- Perk resolution ---
+# Highest tier first: a role configured for several tiers grants the best one.
+RANK_TIERS = (("SUPREME_ROLE_ID", "supreme"), ("MASTER_ROLE_ID", "master"), ("ELITE_ROLE_ID", "elite"))
+TIER_PRIORITY = {perk_key: priority for priority, (_, perk_key) in enumerate(RANK_TIERS)}
+
+class PerkResolver:
+    """Resolves a member's perks with a per-guild role_id -> tier map and a member LRU.
+
+    Both are tied to the guild's settings snapshot: a config write produces a
+    new snapshot, so anything built from the old one is simply not used again.
+    Role changes are handled by forget(), called from on_member_update.
+    """
+    def __init__(self, max_members: int = 5000):
+        self.max_members = max_members
+        self._tier_maps = {} # guild_id -> (settings snapshot, {role_id: perk_key})
+        self._members = OrderedDict() # (guild_id, member_id) -> (settings snapshot, perks)
+        self.hits = 0
+        self.misses = 0
+
+    def _tier_map(self, guild_id: int, guild_settings) -> dict:
+        cached = self._tier_maps.get(guild_id)
+        if cached and cached[0] is guild_settings:
+            return cached[1]
+        tier_map = {}
+        for setting_key, perk_key in reversed(RANK_TIERS):
+            role_id = guild_settings.get(setting_key)
+            if role_id:
+                tier_map[role_id] = perk_key
+        self._tier_maps[guild_id] = (guild_settings, tier_map)
+        return tier_map
+
+    def resolve(self, member: discord.Member) -> dict:
+        guild_settings = get_guild_settings(member.guild.id)
+        key = (member.guild.id, member.id)
+        cached = self._members.get(key)
+        if cached and cached[0] is guild_settings:
+            self._members.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        tier_map = self._tier_map(member.guild.id, guild_settings)
+        best = None
+        if tier_map:
+            for role in member.roles:
+                perk_key = tier_map.get(role.id)
+                if perk_key and (best is None or TIER_PRIORITY[perk_key] < TIER_PRIORITY[best]):
+                    best = perk_key
+        perks = PERKS[best or "default"]
+        self._members[key] = (guild_settings, perks)
+        self._members.move_to_end(key)
+        if len(self._members) > self.max_members:
+            self._members.popitem(last=False)
+        return perks
+
+    def forget(self, guild_id: int, member_id: int):
+        self._members.pop((guild_id, member_id), None)
+
+_perk_resolver = PerkResolver()
 
 def get_member_perks(member: discord.Member) -> dict:
     if not member or not isinstance(member, discord.Member): return PERKS["default"]
-    guild_settings = get_guild_settings(member.guild.id)
-    role_ids = {role.id for role in member.roles}
-    if guild_settings.get("SUPREME_ROLE_ID") in role_ids: return PERKS["supreme"]
-    if guild_settings.get("MASTER_ROLE_ID") in role_ids: return PERKS["master"]
-    if guild_settings.get("ELITE_ROLE_ID") in role_ids: return PERKS["elite"]
-    return PERKS["default"]
+    return _perk_resolver.resolve(member)
 
 def is_owner_or_has_admin_role(interaction: discord.Interaction) -> bool:
     if interaction.user.id == interaction.guild.owner_id: return True
@@ -57,86 +251,368 @@ def is_owner_or_has_admin_role(interaction: discord.Interaction) -> bool:
     user_role_ids = {role.id for role in interaction.user.roles}
     return not user_role_ids.isdisjoint(admin_role_ids)
 
-# --- NEW: Function to get a random GIF from Tenor ---
-async def get_random_gif(search_term: str) -> str:
-    """Fetches a random GIF URL from Tenor based on a search term."""
-    fallback_gif = "https://i.imgur.com/gJ3s2T3.gif" # A default GIF if the API fails
+# --- Tenor GIF lookups ---
+class GifCache:
+    """Caches Tenor search results per search term and picks random GIFs from them.
+
+    A fresh entry is served straight from memory. An expired one is still
+    served while a single background task refreshes it, so only the very
+    first lookup for a term waits on Tenor, and never longer than `timeout`.
+    A lookup that fails or finds nothing is remembered for `negative_ttl`;
+    until then the term gets None (the fallback GIF) without asking Tenor.
+    """
+    def __init__(self, ttl: float = GIF_CACHE_TTL, timeout: float = GIF_LOOKUP_TIMEOUT, negative_ttl: float = GIF_NEGATIVE_TTL):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.negative_ttl = negative_ttl
+        self._entries = {} # search term -> (fetched_at, [gif urls])
+        self._failed = {} # search term -> when its last lookup failed or came back empty
+        self._refreshing = {} # search term -> background refresh task
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def _fetch(self, session: aiohttp.ClientSession, search_term: str) -> list:
+        params = {"q": search_term, "key": TENOR_API_KEY, "limit": 20, "media_filter": "minimal"}
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with session.get(f"{TENOR_BASE_URL}/search", params=params, timeout=timeout) as response:
+            response.raise_for_status()
+            data = await response.json()
+        urls = [gif["media_formats"]["gif"]["url"] for gif in data.get("results", [])]
+        if urls:
+            self._entries[search_term] = (time.monotonic(), urls)
+            self._failed.pop(search_term, None)
+        else:
+            self._failed[search_term] = time.monotonic()
+        return urls
+
+    def _recently_failed(self, search_term: str) -> bool:
+        failed_at = self._failed.get(search_term)
+        return failed_at is not None and time.monotonic() - failed_at < self.negative_ttl
+
+    async def _refresh(self, session: aiohttp.ClientSession, search_term: str):
+        try:
+            await self._fetch(session, search_term)
+        except Exception as e:
+            self.errors += 1
+            self._failed[search_term] = time.monotonic()
+            print(f"Error refreshing GIFs for '{search_term}' from Tenor: {e!r}")
+        finally:
+            self._refreshing.pop(search_term, None)
+
+    async def get(self, session: aiohttp.ClientSession, search_term: str):
+        entry = self._entries.get(search_term)
+        if entry:
+            self.hits += 1
+            fetched_at, urls = entry
+            if (time.monotonic() - fetched_at > self.ttl and search_term not in self._refreshing
+                    and not self._recently_failed(search_term)):
+                self._refreshing[search_term] = asyncio.create_task(self._refresh(session, search_term))
+            return random.choice(urls)
+        self.misses += 1
+        if self._recently_failed(search_term):
+            return None
+        try:
+            urls = await self._fetch(session, search_term)
+        except Exception as e:
+            self.errors += 1
+            self._failed[search_term] = time.monotonic()
+            print(f"Error fetching GIF from Tenor: {e!r}")
+            return None
+        return random.choice(urls) if urls else None
+
+_gif_cache = GifCache()
+
+async def get_random_gif(session: aiohttp.ClientSession, search_term: str) -> str:
+    """Returns a random GIF URL for a search term, using the bot's shared HTTP session."""
     if not TENOR_API_KEY:
         print("Warning: TENOR_API_KEY is not set. Using fallback GIF.")
-        return fallback_gif
-
-    try:
-        url = f"https://tenor.googleapis.com/v2/search?q={search_term}&key={TENOR_API_KEY}&limit=20&media_filter=minimal"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get("results"):
-                        gif = random.choice(data["results"])
-                        return gif["media_formats"]["gif"]["url"]
-    except Exception as e:
-        print(f"Error fetching GIF from Tenor: {e}")
-
-    return fallback_gif # Return the fallback if anything goes wrong
+        return FALLBACK_GIF
+    return await _gif_cache.get(session, search_term) or FALLBACK_GIF # Fallback if anything goes wrong
+
+# --- Welcome image ---
+class WelcomeImage:
+    """The welcome GIF, read from disk once and uploaded to Discord as rarely as possible.
+
+    After the first upload the attachment's CDN URL is remembered and later
+    welcome embeds just link to it. Discord signs those links with an `ex`
+    (expiry) parameter, so the URL is dropped shortly before it expires, when
+    a periodic HEAD check says it no longer loads, or when a send using it fails;
+    the next welcome then uploads the bytes again.
+    """
+    filename = "welcome.gif"
+
+    def __init__(self, path: str = WELCOME_GIF_PATH):
+        self.path = path
+        self.data = None
+        self.url = None
+        self.expires_at = 0.0
+        self.verified_at = 0.0
+        self.uploads = 0
+        self.reuses = 0
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                self.data = f.read()
+        except OSError as e:
+            print(f"Could not load welcome image {self.path}: {e}")
+
+    def file(self) -> discord.File:
+        self.uploads += 1
+        return discord.File(io.BytesIO(self.data), filename=self.filename)
+
+    def forget(self):
+        self.url = None
+
+    def remember(self, message: discord.Message):
+        """Keeps the CDN URL Discord assigned to the uploaded GIF."""
+        url = None
+        if message.embeds and message.embeds[0].image and message.embeds[0].image.url:
+            url = message.embeds[0].image.url
+        elif message.attachments:
+            url = message.attachments[0].url
+        if not url or not url.startswith("http"):
+            return
+        expiry = parse_qs(urlparse(url).query).get("ex")
+        try:
+            # Unsigned (old style) links don't expire; treat them as good for a day.
+            self.expires_at = int(expiry[0], 16) if expiry else time.time() + 86400
+        except ValueError:
+            return
+        self.url = url
+        self.verified_at = time.time()
+
+    async def usable_url(self, session: aiohttp.ClientSession):
+        if not self.url or time.time() > self.expires_at - WELCOME_GIF_EXPIRY_MARGIN:
+            return None
+        if session is not None and time.time() - self.verified_at > WELCOME_GIF_VERIFY_INTERVAL:
+            try:
+                async with session.head(self.url, timeout=aiohttp.ClientTimeout(total=GIF_LOOKUP_TIMEOUT)) as response:
+                    ok = response.status == 200
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                ok = False
+            if not ok:
+                self.forget()
+                return None
+            self.verified_at = time.time()
+        self.reuses += 1
+        return self.url
+
+# --- Join pipeline ---
+def build_welcome_embed(guild: discord.Guild, members: list) -> discord.Embed:
+    mentions = ", ".join(member.mention for member in members)
+    embed = discord.Embed(
+        title=f"Welcome to {guild.name}!",
+        description=f"Welcome, {mentions}! We're glad you're here.\n\n"
+                    "• Make sure to read the <#1386665353916186655>.\n"
+                    "• Check out our <#1402656692398719026> and consider Buying From them!",
+        color=discord.Color.from_str("#2b2d31")
+    )
+    if guild.icon:
+        embed.set_thumbnail(url=guild.icon.url)
+    embed.set_footer(text=f"We are now at {guild.member_count} members!")
+    return embed
+
+class GuildJoinState:
+    def __init__(self):
+        self.role_queue = asyncio.Queue()
+        self.role_worker = None
+        self.recent_joins = deque() # monotonic join times inside JOIN_BURST_WINDOW
+        self.pending_welcomes = [] # (member, monotonic join time)
+        self.welcome_task = None
+
+class JoinPipeline:
+    """Queues member joins per guild instead of handling each one inline.
+
+    Join roles are handed out by one worker per guild, one request at a time,
+    backing off when Discord reports a rate limit. Welcomes go out right away
+    while joins are sparse; during a burst they are collected for
+    WELCOME_BATCH_DELAY seconds and sent as a single message mentioning
+    everyone who joined.
+    """
+    def __init__(self, cog):
+        self.cog = cog
+        self._guilds = {} # guild_id -> GuildJoinState
+        self.joins = 0
+        self.roles_assigned = 0
+        self.role_failures = 0
+        self.rate_limited = 0
+        self.welcome_messages = 0
+        self.members_welcomed = 0
+        self._lag_total = 0.0
+        self._lag_max = 0.0
+        self._welcome_lag_total = 0.0
+        self._welcome_lag_max = 0.0
+
+    def _state(self, guild_id: int) -> GuildJoinState:
+        state = self._guilds.get(guild_id)
+        if state is None:
+            state = self._guilds[guild_id] = GuildJoinState()
+        return state
+
+    def submit(self, member: discord.Member):
+        guild_settings = get_guild_settings(member.guild.id)
+        state = self._state(member.guild.id)
+        now = time.monotonic()
+        self.joins += 1
+        state.recent_joins.append(now)
+        while state.recent_joins and now - state.recent_joins[0] > JOIN_BURST_WINDOW:
+            state.recent_joins.popleft()
+
+        if guild_settings.get("JOIN_ROLE_ID"):
+            state.role_queue.put_nowait((member, now))
+            if state.role_worker is None or state.role_worker.done():
+                state.role_worker = asyncio.create_task(self._assign_join_roles(state))
+
+        if guild_settings.get("WELCOME_CHANNEL_ID"):
+            state.pending_welcomes.append((member, now))
+            if state.welcome_task is None:
+                delay = WELCOME_BATCH_DELAY if len(state.recent_joins) >= JOIN_BURST_THRESHOLD else 0
+                state.welcome_task = asyncio.create_task(self._send_welcomes(member.guild, state, delay))
+
+    async def _assign_join_roles(self, state: GuildJoinState):
+        while not state.role_queue.empty():
+            member, joined_at = state.role_queue.get_nowait()
+            try:
+                await self._assign_join_role(member, joined_at)
+            except Exception as e:
+                self.role_failures += 1
+                print(f"Failed to assign join role in {member.guild.name}: {e}")
+
+    async def _assign_join_role(self, member: discord.Member, joined_at: float):
+        role = member.guild.get_role(get_guild_settings(member.guild.id).get("JOIN_ROLE_ID"))
+        # Skip members who left while queued or already got the role some other way.
+        if not role or member.guild.get_member(member.id) is None or role in member.roles:
+            return
+        for attempt in range(JOIN_ROLE_MAX_ATTEMPTS):
+            try:
+                await member.add_roles(role, reason="Automatic role assignment on join.")
+            except discord.RateLimited as e:
+                self.rate_limited += 1
+                await asyncio.sleep(e.retry_after)
+                continue
+            except discord.Forbidden as e:
+                self.role_failures += 1
+                print(f"Failed to assign join role in {member.guild.name}: {e}")
+                return
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    self.role_failures += 1
+                    print(f"Failed to assign join role in {member.guild.name}: {e}")
+                    return
+                self.rate_limited += 1
+                await asyncio.sleep(2 ** attempt)
+                continue
+            lag = time.monotonic() - joined_at
+            self.roles_assigned += 1
+            self._lag_total += lag
+            self._lag_max = max(self._lag_max, lag)
+            return
+        self.role_failures += 1
+        print(f"Gave up assigning the join role to {member} in {member.guild.name} after {JOIN_ROLE_MAX_ATTEMPTS} rate-limited attempts.")
+
+    async def _send_welcomes(self, guild: discord.Guild, state: GuildJoinState, delay: float):
+        await asyncio.sleep(delay)
+        # Joins from here on start a new batch.
+        members, state.pending_welcomes = state.pending_welcomes, []
+        state.welcome_task = None
+        channel = guild.get_channel(get_guild_settings(guild.id).get("WELCOME_CHANNEL_ID"))
+        if not channel:
+            return
+        for start in range(0, len(members), WELCOME_BATCH_MAX):
+            batch = members[start:start + WELCOME_BATCH_MAX]
+            try:
+                await self.cog.send_welcome(channel, build_welcome_embed(guild, [member for member, _ in batch]))
+                sent_at = time.monotonic()
+                self.welcome_messages += 1
+                self.members_welcomed += len(batch)
+                for _, joined_at in batch:
+                    self._welcome_lag_total += sent_at - joined_at
+                # The first member in a batch waited longest.
+                self._welcome_lag_max = max(self._welcome_lag_max, sent_at - batch[0][1])
+            except (discord.Forbidden, discord.HTTPException) as e:
+                print(f"Failed to send welcome message in {guild.name}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "joins": self.joins,
+            "role_queue_depth": sum(state.role_queue.qsize() for state in self._guilds.values()),
+            "pending_welcomes": sum(len(state.pending_welcomes) for state in self._guilds.values()),
+            "roles_assigned": self.roles_assigned,
+            "role_failures": self.role_failures,
+            "rate_limited": self.rate_limited,
+            "avg_role_lag": self._lag_total / self.roles_assigned if self.roles_assigned else 0.0,
+            "max_role_lag": self._lag_max,
+            "welcome_messages": self.welcome_messages,
+            "members_welcomed": self.members_welcomed,
+            "avg_welcome_lag": self._welcome_lag_total / self.members_welcomed if self.members_welcomed else 0.0,
+            "max_welcome_lag": self._welcome_lag_max,
+        }
+
+    def stop(self):
+        for state in self._guilds.values():
+            for task in (state.role_worker, state.welcome_task):
+                if task is not None:
+                    task.cancel()
 
 class ChannelConfigCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.welcome_image = WelcomeImage()
+        self.joins = JoinPipeline(self)
+
+    async def cog_load(self):
+        self.welcome_image.load()
+        _settings_cache.start()
+
+    async def cog_unload(self):
+        self.joins.stop()
+        _settings_cache.stop()
+
+    async def send_welcome(self, channel: discord.TextChannel, embed: discord.Embed):
+        """Sends a welcome embed, linking the cached GIF URL or uploading the GIF once more."""
+        image = self.welcome_image
+        url = await image.usable_url(getattr(self.bot, "http_session", None))
+        if url:
+            embed.set_image(url=url)
+            try:
+                return await channel.send(embed=embed)
+            except discord.Forbidden:
+                raise
+            except discord.HTTPException:
+                image.forget()
+        if image.data is None:
+            embed.set_image(url=None)
+            return await channel.send(embed=embed)
+        # Tell the embed to use the attached file
+        embed.set_image(url=f"attachment://{image.filename}")
+        message = await channel.send(file=image.file(), embed=embed)
+        image.remember(message)
+        return message
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
         if member.bot: return
-        guild_settings = get_guild_settings(member.guild.id)
-        
-        # Auto-role logic
-        join_role_id = guild_settings.get("JOIN_ROLE_ID")
-        if join_role_id:
-            role = member.guild.get_role(join_role_id)
-            if role:
-                try:
-                    await member.add_roles(role, reason="Automatic role assignment on join.")
-                except (discord.Forbidden, discord.HTTPException) as e:
-                    print(f"Failed to assign join role in {member.guild.name}: {e}")
-
-        # --- Welcome Message Logic ---
-        welcome_channel_id = guild_settings.get("WELCOME_CHANNEL_ID")
-        if welcome_channel_id:
-            welcome_channel = member.guild.get_channel(welcome_channel_id)
-            if welcome_channel:
-                
-                # 1. Load the local GIF file
-                file = discord.File("cogs/welcome.gif", filename="welcome.gif")
-
-                # Create the main embed
-                embed = discord.Embed(
-                    title=f"Welcome to {member.guild.name}!",
-                    description=f"Welcome, {member.mention}! We're glad you're here.\n\n"
-                                "• Make sure to read the <#1386665353916186655>.\n"
-                                "• Check out our <#1402656692398719026> and consider Buying From them!",
-                    color=discord.Color.from_str("#2b2d31")
-                )
-                
-                if member.guild.icon:
-                    embed.set_thumbnail(url=member.guild.icon.url)
-                
-                # 2. Tell the embed to use the attached file
-                embed.set_image(url="attachment://welcome.gif")
-                
-                embed.set_footer(text=f"We are now at {member.guild.member_count} members!")
-
-                try:
-                    # 3. Send the embed AND the file together
-                    await welcome_channel.send(file=file, embed=embed)
-                except (discord.Forbidden, discord.HTTPException) as e:
-                    print(f"Failed to send welcome message in {member.guild.name}: {e}")
+        # Join role and welcome message are handled by the per-guild join pipeline.
+        self.joins.submit(member)
 
     # (The rest of the file, including on_member_remove, setup_channels, etc., remains the same as the previous version)
 
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if before.roles != after.roles:
+            _perk_resolver.forget(after.guild.id, after.id)
+
     @commands.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
+        _perk_resolver.forget(member.guild.id, member.id)
         if member.bot: return
         try:
             await self.bot.db.delete_user_data(member.id, member.guild.id)
+            economy_cog = self.bot.get_cog("EconomyCog")
+            if economy_cog:
+                economy_cog.leaderboard_cache.xp_changed(member.guild.id, member.id, 0)
             print(f"Removed data for former member {member.display_name} from {member.guild.name}.")
         except Exception as e:
             print(f"An error occurred while cleaning up data for member {member.id}: {e}")
@@ -155,9 +631,7 @@ class ChannelConfigCog(commands.Cog):
         new_item_log_channel: typing.Optional[discord.TextChannel] = None, database_view_channel: typing.Optional[discord.TextChannel] = None,
         level_up_channel: typing.Optional[discord.TextChannel] = None, welcome_channel: typing.Optional[discord.TextChannel] = None):
         await interaction.response.defer()
-        all_settings = get_all_settings()
-        guild_id_str = str(interaction.guild.id)
-        if guild_id_str not in all_settings: all_settings[guild_id_str] = {}
+        changes = []
         updated_channels = []
         channels_to_set = {
             "SHOP_CHANNEL_ID": shop_channel, "PURCHASE_LOG_CHANNEL_ID": purchase_log_channel, "ADMIN_LOG_CHANNEL_ID": admin_log_channel,
@@ -167,55 +641,43 @@ class ChannelConfigCog(commands.Cog):
         }
         for key, channel in channels_to_set.items():
             if channel is not None:
-                all_settings[guild_id_str][key] = channel.id
+                changes.append((interaction.guild.id, key, channel.id))
                 updated_channels.append(f"**{key.replace('_ID', '')}** → {channel.mention}")
-        save_all_settings(all_settings)
         if not updated_channels:
             await interaction.followup.send("You didn't specify any channels to update.", ephemeral=True)
             return
+        await _settings_cache.apply(changes)
         embed = discord.Embed(title=f"✅ Bot Channels Updated", description="\n".join(updated_channels), color=discord.Color.green())
         await interaction.followup.send(embed=embed)
 
     @config_group.command(name="addcreatorrole", description="Add a role to the list of roles that can upload items.")
     @app_commands.checks.has_permissions(administrator=True)
     async def add_creator_role(self, interaction: discord.Interaction, role: discord.Role):
-        all_settings = get_all_settings()
-        guild_id_str = str(interaction.guild.id)
-        if guild_id_str not in all_settings: all_settings[guild_id_str] = {}
-        creator_roles = all_settings[guild_id_str].get("CREATOR_ROLE_IDS", [])
+        creator_roles = list(get_guild_settings(interaction.guild.id).get("CREATOR_ROLE_IDS", []))
         if role.id in creator_roles:
             await interaction.response.send_message(f"❌ {role.mention} is already a creator role.", ephemeral=True)
             return
         creator_roles.append(role.id)
-        all_settings[guild_id_str]["CREATOR_ROLE_IDS"] = creator_roles
-        save_all_settings(all_settings)
+        await set_guild_setting(interaction.guild.id, "CREATOR_ROLE_IDS", creator_roles)
         embed = discord.Embed(title="✅ Creator Role Added", description=f"Members with the {role.mention} role can now use the `/upd` command.", color=discord.Color.green())
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @config_group.command(name="removecreatorrole", description="Remove a role from the list of roles that can upload items.")
     @app_commands.checks.has_permissions(administrator=True)
     async def remove_creator_role(self, interaction: discord.Interaction, role: discord.Role):
-        all_settings = get_all_settings()
-        guild_id_str = str(interaction.guild.id)
-        if guild_id_str not in all_settings: all_settings[guild_id_str] = {}
-        creator_roles = all_settings[guild_id_str].get("CREATOR_ROLE_IDS", [])
+        creator_roles = list(get_guild_settings(interaction.guild.id).get("CREATOR_ROLE_IDS", []))
         if role.id not in creator_roles:
             await interaction.response.send_message(f"❌ {role.mention} is not a creator role.", ephemeral=True)
             return
         creator_roles.remove(role.id)
-        all_settings[guild_id_str]["CREATOR_ROLE_IDS"] = creator_roles
-        save_all_settings(all_settings)
+        await set_guild_setting(interaction.guild.id, "CREATOR_ROLE_IDS", creator_roles)
         embed = discord.Embed(title="✅ Creator Role Removed", description=f"Members with the {role.mention} role can no longer use the `/upd` command.", color=discord.Color.red())
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @config_group.command(name="setjoinrole", description="Set the role to be automatically given to new members.")
     @app_commands.checks.has_permissions(administrator=True)
     async def set_join_role(self, interaction: discord.Interaction, role: discord.Role):
-        all_settings = get_all_settings()
-        guild_id_str = str(interaction.guild.id)
-        if guild_id_str not in all_settings: all_settings[guild_id_str] = {}
-        all_settings[guild_id_str]["JOIN_ROLE_ID"] = role.id
-        save_all_settings(all_settings)
+        await set_guild_setting(interaction.guild.id, "JOIN_ROLE_ID", role.id)
         embed = discord.Embed(title="✅ Join Role Set", description=f"New members will now automatically receive the {role.mention} role when they join.", color=discord.Color.green())
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
@@ -223,29 +685,17 @@ class ChannelConfigCog(commands.Cog):
 
     @setrankrole_group.command(name="elite", description="Set the role for Elite Members (Level 50+).")
     async def set_elite_role(self, interaction: discord.Interaction, role: discord.Role):
-        all_settings = get_all_settings()
-        guild_id_str = str(interaction.guild.id)
-        if guild_id_str not in all_settings: all_settings[guild_id_str] = {}
-        all_settings[guild_id_str]["ELITE_ROLE_ID"] = role.id
-        save_all_settings(all_settings)
+        await set_guild_setting(interaction.guild.id, "ELITE_ROLE_ID", role.id)
         await interaction.response.send_message(f"✅ Set **Elite Member** role to {role.mention}. Perks will apply automatically.", ephemeral=True)
 
     @setrankrole_group.command(name="master", description="Set the role for Master Members (Level 75+).")
     async def set_master_role(self, interaction: discord.Interaction, role: discord.Role):
-        all_settings = get_all_settings()
-        guild_id_str = str(interaction.guild.id)
-        if guild_id_str not in all_settings: all_settings[guild_id_str] = {}
-        all_settings[guild_id_str]["MASTER_ROLE_ID"] = role.id
-        save_all_settings(all_settings)
+        await set_guild_setting(interaction.guild.id, "MASTER_ROLE_ID", role.id)
         await interaction.response.send_message(f"✅ Set **Master Member** role to {role.mention}. Perks will apply automatically.", ephemeral=True)
 
     @setrankrole_group.command(name="supreme", description="Set the role for Supreme Members (Level 100+).")
     async def set_supreme_role(self, interaction: discord.Interaction, role: discord.Role):
-        all_settings = get_all_settings()
-        guild_id_str = str(interaction.guild.id)
-        if guild_id_str not in all_settings: all_settings[guild_id_str] = {}
-        all_settings[guild_id_str]["SUPREME_ROLE_ID"] = role.id
-        save_all_settings(all_settings)
+        await set_guild_setting(interaction.guild.id, "SUPREME_ROLE_ID", role.id)
         await interaction.response.send_message(f"✅ Set **Supreme Member** role to {role.mention}. Perks will apply automatically.", ephemeral=True)
 
     @config_group.command(name="view", description="View all configured bot channels and roles for this server.")
@@ -280,4 +730,5 @@ class ChannelConfigCog(commands.Cog):
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
 async def setup(bot: commands.Bot):
+    await bind_settings_store(bot.db)
     await bot.add_cog(ChannelConfigCog(bot))
\ No newline at end of file
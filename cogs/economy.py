@@ -3,11 +3,113 @@ from discord.ext import commands
 from discord import app_commands
 import time
 import random
+from collections import OrderedDict
 from .channel_config import get_guild_settings, get_member_perks, PERKS # Import PERKS dictionary
+from database import total_xp
+
+COIN_COOLDOWN = 25 # Seconds between coin rewards for chatting
+XP_COOLDOWN = 20 # Seconds between XP rewards for chatting
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_CACHE_TTL = 300 # Seconds a rendered first page is reused without any invalidation
+
+class CooldownIndex:
+    """Remembers recent reward claims so cooldown-blocked messages skip the database.
+
+    Entries are kept in the order they were last recorded. Idle entries (both
+    cooldowns over) tell us nothing, so they are evicted from the front first,
+    and the index never holds more than `max_entries` users.
+    """
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # (guild_id, user_id) -> (last_coin_claim, last_xp_claim)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _is_idle(claims: tuple, now: float) -> bool:
+        last_coin_claim, last_xp_claim = claims
+        return now - last_coin_claim > COIN_COOLDOWN and now - last_xp_claim > XP_COOLDOWN
+
+    def is_blocked(self, guild_id: int, user_id: int, now: float) -> bool:
+        """True if both cooldowns are still running, i.e. the message can earn nothing."""
+        claims = self._entries.get((guild_id, user_id))
+        if claims is None:
+            return False
+        last_coin_claim, last_xp_claim = claims
+        return now - last_coin_claim <= COIN_COOLDOWN and now - last_xp_claim <= XP_COOLDOWN
+
+    def record(self, guild_id: int, user_id: int, last_coin_claim: float, last_xp_claim: float, now: float):
+        key = (guild_id, user_id)
+        self._entries[key] = (last_coin_claim, last_xp_claim)
+        self._entries.move_to_end(key)
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if len(self._entries) <= self.max_entries and not self._is_idle(oldest, now):
+                break
+            self._entries.popitem(last=False)
+
+class LeaderboardCache:
+    """Keeps the first leaderboard page of each guild, rows and rendered text.
+
+    An entry is dropped when a change could move someone into or within the
+    top N, and otherwise expires after `ttl` seconds (which also picks up
+    renamed members and changed perk flair). Chat XP reaches the database
+    only on the next reward flush, so invalidate() can take a `settle`
+    window during which rebuilt pages are served but not stored.
+    """
+    def __init__(self, top_n: int = LEADERBOARD_PAGE_SIZE, ttl: float = LEADERBOARD_CACHE_TTL):
+        self.top_n = top_n
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = {} # guild_id -> (built_at, rows, description)
+        self._not_before = {} # guild_id -> time before which rebuilt pages aren't stored
+
+    def get(self, guild_id: int, now: float):
+        entry = self._entries.get(guild_id)
+        if entry and now - entry[0] < self.ttl:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, guild_id: int, rows: list, description: str, now: float):
+        if now >= self._not_before.get(guild_id, 0):
+            self._entries[guild_id] = (now, rows, description)
+
+    def invalidate(self, guild_id: int, settle: float = 0):
+        if self._entries.pop(guild_id, None):
+            self.invalidations += 1
+        if settle:
+            self._not_before[guild_id] = time.time() + settle
+
+    def xp_changed(self, guild_id: int, user_id: int, new_total_xp: int, settle: float = 0):
+        """Invalidates the guild's page if this user's new total XP could change it."""
+        entry = self._entries.get(guild_id)
+        # Without a cached page the settle window still matters: a page built
+        # before the next reward flush would miss this XP and be kept for the TTL.
+        if entry is None:
+            self.invalidate(guild_id, settle)
+            return
+        rows = entry[1]
+        if (len(rows) < self.top_n or new_total_xp >= rows[-1]['total_xp']
+                or any(row['user_id'] == user_id for row in rows)):
+            self.invalidate(guild_id, settle)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "guilds": len(self._entries), "hits": self.hits, "misses": self.misses,
+            "invalidations": self.invalidations, "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
 
 class EconomyCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.cooldowns = CooldownIndex()
+        self.leaderboard_cache = LeaderboardCache()
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -21,19 +123,23 @@ class EconomyCog(commands.Cog):
         user_id = message.author.id
         guild_id = message.guild.id
         current_time = time.time()
+
+        # Both rewards are on cooldown: nothing to earn, so don't even load the player.
+        if self.cooldowns.is_blocked(guild_id, user_id, current_time):
+            return
         
         try:
             player = await self.bot.db.get_user_data(user_id, guild_id)
             perks = get_member_perks(message.author)
             data_to_update = {}
             
-            if current_time - player['last_coin_claim'] > 25:
+            if current_time - player['last_coin_claim'] > COIN_COOLDOWN:
                 base_coins = random.randint(5, 20)
                 coins_earned = int(base_coins * perks["multiplier"])
-                data_to_update['balance'] = player['balance'] + coins_earned
+                data_to_update['balance'] = coins_earned
                 data_to_update['last_coin_claim'] = current_time
 
-            if current_time - player['last_xp_claim'] > 20:
+            if current_time - player['last_xp_claim'] > XP_COOLDOWN:
                 base_xp = random.randint(10, 25)
                 xp_earned = int(base_xp * perks["multiplier"])
                 new_xp = player['xp'] + xp_earned
@@ -94,9 +200,19 @@ class EconomyCog(commands.Cog):
                     data_to_update['xp'] = new_xp
                 
                 data_to_update['last_xp_claim'] = current_time
+                self.leaderboard_cache.xp_changed(
+                    guild_id, user_id, total_xp(current_level, new_xp), settle=self.bot.db.reward_flush_interval
+                )
 
             if data_to_update:
-                await self.bot.db.update_user_data(user_id, guild_id, data_to_update)
+                # Buffered and written in bulk; 'balance' here is the coins earned, not the new total.
+                self.bot.db.queue_chat_reward(user_id, guild_id, **data_to_update)
+            self.cooldowns.record(
+                guild_id, user_id,
+                data_to_update.get('last_coin_claim', player['last_coin_claim']),
+                data_to_update.get('last_xp_claim', player['last_xp_claim']),
+                current_time
+            )
         except Exception as e:
             print(f"Error in on_message economy processing for {message.author.name}: {e}")
 
@@ -157,18 +273,14 @@ class EconomyCog(commands.Cog):
         if recipient.id == interaction.user.id or recipient.bot:
             await interaction.followup.send("❌ You cannot send coins to yourself or a bot.", ephemeral=True); return
 
-        sender_data = await self.bot.db.get_user_data(interaction.user.id, interaction.guild.id)
         sender_perks = get_member_perks(interaction.user)
         
         if amount > sender_perks['pay_limit']:
             await interaction.followup.send(f"❌ Your rank's pay limit is **{sender_perks['pay_limit']:,}** coins.", ephemeral=True); return
-        if sender_data['balance'] < amount:
-            await interaction.followup.send(f"❌ You don't have enough coins!", ephemeral=True); return
 
-        recipient_data = await self.bot.db.get_user_data(recipient.id, interaction.guild.id)
-        
-        await self.bot.db.update_user_data(interaction.user.id, interaction.guild.id, {"balance": sender_data['balance'] - amount})
-        await self.bot.db.update_user_data(recipient.id, interaction.guild.id, {"balance": recipient_data['balance'] + amount})
+        # The balance check and both updates happen in a single transaction.
+        if await self.bot.db.transfer(interaction.user.id, recipient.id, interaction.guild.id, amount) is None:
+            await interaction.followup.send(f"❌ You don't have enough coins!", ephemeral=True); return
 
         embed = discord.Embed(title="💸 Transaction Successful", description=f"{interaction.user.mention} sent **{amount:,}** coins to {recipient.mention}.", color=discord.Color.green())
         await interaction.followup.send(embed=embed, ephemeral=False)
@@ -184,19 +296,45 @@ class EconomyCog(commands.Cog):
         embed.set_footer(text="Increase your rank by leveling up to improve your rewards!")
         await interaction.followup.send(embed=embed)
     
+    @app_commands.command(name="rank", description="See where you (or another user) stand on the leaderboard.")
+    @app_commands.describe(user="The user whose rank you want to see (optional).")
+    async def rank(self, interaction: discord.Interaction, user: discord.Member = None):
+        target_user = user or interaction.user
+        await interaction.response.defer(ephemeral=False)
+        rank, player = await self.bot.db.get_user_rank(target_user.id, interaction.guild.id)
+        ranked_users = await self.bot.db.count_ranked_users(interaction.guild.id)
+        embed = discord.Embed(title=f"🏅 Rank for {target_user.display_name}", color=discord.Color.gold())
+        embed.set_thumbnail(url=target_user.display_avatar.url)
+        embed.add_field(name="Rank", value=f"**#{rank:,}** of {max(ranked_users, rank):,}", inline=True)
+        embed.add_field(name="Level", value=f"**{player['level']}**", inline=True)
+        embed.add_field(name="Total XP", value=f"**{player['total_xp']:,}**", inline=True)
+        embed.set_footer(text=f"Use /leaderboard page:{(rank - 1) // LEADERBOARD_PAGE_SIZE + 1} to see who is around you.")
+        await interaction.followup.send(embed=embed)
+
     @app_commands.command(name="leaderboard", description="View the server's top members by level.")
-    async def leaderboard(self, interaction: discord.Interaction):
+    @app_commands.describe(page="Which page of the leaderboard to show (10 members per page).")
+    async def leaderboard(self, interaction: discord.Interaction, page: app_commands.Range[int, 1] = 1):
         await interaction.response.defer(ephemeral=False)
-        top_users = await self.bot.db.get_leaderboard(interaction.guild.id, limit=10)
+        embed = discord.Embed(title=f"🏆 Leaderboard for {interaction.guild.name}", color=discord.Color.gold())
+        embed.set_footer(text=f"Page {page}")
+        now = time.time()
+        cached = self.leaderboard_cache.get(interaction.guild.id, now) if page == 1 else None
+        if cached:
+            embed.description = cached[2]
+            await interaction.followup.send(embed=embed); return
+
+        offset = (page - 1) * LEADERBOARD_PAGE_SIZE
+        top_users = await self.bot.db.get_leaderboard(interaction.guild.id, limit=LEADERBOARD_PAGE_SIZE, offset=offset)
 
         if not top_users:
+            if page > 1:
+                await interaction.followup.send(f"Page {page} of the leaderboard is empty."); return
             await interaction.followup.send("There are no users to rank on the leaderboard yet!"); return
 
-        embed = discord.Embed(title=f"🏆 Leaderboard for {interaction.guild.name}", color=discord.Color.gold())
         leaderboard_text = ""
         rank_emojis = {1: "🥇", 2: "🥈", 3: "🥉"}
 
-        for i, user_data in enumerate(top_users, 1):
+        for i, user_data in enumerate(top_users, offset + 1):
             member = interaction.guild.get_member(user_data['user_id'])
             if member:
                 perks = get_member_perks(member)
@@ -208,6 +346,8 @@ class EconomyCog(commands.Cog):
             leaderboard_text += f"{rank} {user_name} - **Level {user_data['level']}**\n"
 
         embed.description = leaderboard_text
+        if page == 1:
+            self.leaderboard_cache.put(interaction.guild.id, top_users, leaderboard_text, now)
         await interaction.followup.send(embed=embed)
 
 async def setup(bot: commands.Bot):
@@ -8,12 +8,15 @@ import asyncio
 
 # --- New Blackjack Game View ---
 class BlackjackView(discord.ui.View):
-    def __init__(self, bot, author, player_data, bet):
+    # The bet is held as an open stake when the game starts; the view settles it
+    # at the end, and a restart in between refunds it.
+    def __init__(self, bot, author, bet, stake_id):
         super().__init__(timeout=120)
         self.bot = bot
         self.author = author
-        self.player_data = player_data
         self.bet = bet
+        self.stake_id = stake_id
+        self.finished = False
 
         self.deck = [2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11] * 4
         random.shuffle(self.deck)
@@ -53,27 +56,37 @@ class BlackjackView(discord.ui.View):
 
         await interaction.edit_original_response(embed=embed, view=self)
 
+    async def on_timeout(self):
+        # Walking away from an unfinished game gives the bet back.
+        if not self.finished:
+            self.finished = True
+            await self.bot.db.settle_stake(self.stake_id, self.author.id, self.author.guild.id, self.bet, reason="blackjack refund")
+
     async def handle_game_end(self, interaction, result):
+        if self.finished: return
+        self.finished = True
         dealer_score = self.calculate_hand_value(self.dealer_hand)
         
         if result == "win":
-            new_balance = self.player_data['balance'] + self.bet
+            payout = self.bet * 2
             title = "🎉 You Won! 🎉"
             desc = f"You won **{self.bet*2:,}** coins!"
         elif result == "blackjack":
-            new_balance = self.player_data['balance'] + int(self.bet * 1.5)
+            payout = self.bet + int(self.bet * 1.5)
             title = "✨ BLACKJACK! ✨"
             desc = f"You won **{int(self.bet * 2.5):,}** coins!"
         elif result == "push":
-            new_balance = self.player_data['balance']
+            payout = self.bet
             title = "🤝 Push 🤝"
             desc = "It's a tie! Your bet has been returned."
         else: # loss
-            new_balance = self.player_data['balance'] - self.bet
+            payout = 0
             title = "💔 You Lost 💔"
             desc = f"The dealer won. You lost **{self.bet:,}** coins."
             
-        await self.bot.db.update_user_data(self.author.id, self.author.guild.id, {"balance": new_balance})
+        new_balance = await self.bot.db.settle_stake(self.stake_id, self.author.id, self.author.guild.id, payout, reason="blackjack")
+        if new_balance is None: # Already settled, e.g. refunded after a restart
+            new_balance = (await self.bot.db.get_user_data(self.author.id, self.author.guild.id))['balance']
         
         embed = discord.Embed(title=title, description=desc, color=discord.Color.blue())
         embed.add_field(name="Your Hand", value=f"{' '.join(map(str, self.player_hand))} (**{self.calculate_hand_value(self.player_hand)}**)", inline=True)
@@ -120,18 +133,29 @@ class GamesCog(commands.Cog):
     async def on_ready(self):
         print(f'{self.__class__.__name__} cog has been loaded.')
 
+    async def place_bet(self, interaction: discord.Interaction, bet: int, payout: int = 0, game: str = "bet", stake_id: str = None):
+        """Takes the bet and pays `payout` in one atomic update; `game` is the ledger reason.
+
+        With a stake_id the bet is held as an open stake for the game to settle later.
+        Returns the new balance, or None after telling the user they can't afford it.
+        """
+        if stake_id is None:
+            new_balance = await self.bot.db.debit_if_sufficient(interaction.user.id, interaction.guild.id, bet, credit=payout, reason=game)
+        else:
+            new_balance = await self.bot.db.open_stake(interaction.user.id, interaction.guild.id, bet, game, stake_id)
+        if new_balance is None:
+            player = await self.bot.db.get_user_data(interaction.user.id, interaction.guild.id)
+            await interaction.followup.send(f"❌ You don't have enough coins! Your balance is **{player['balance']:,}**.", ephemeral=True)
+        return new_balance
+
     # --- REBALANCED SLOT MACHINE COMMAND ---
     @app_commands.command(name="slots", description="Play the slot machine for a chance to win big!")
     @app_commands.describe(bet="The amount of coins you want to bet.")
     async def slots(self, interaction: discord.Interaction, bet: int):
         await interaction.response.defer()
         
-        player = await self.bot.db.get_user_data(interaction.user.id, interaction.guild.id)
-        
         if bet <= 0:
             await interaction.followup.send("❌ You must bet a positive amount of coins.", ephemeral=True); return
-        if player['balance'] < bet:
-            await interaction.followup.send(f"❌ You don't have enough coins! Your balance is **{player['balance']:,}**.", ephemeral=True); return
 
         # --- Rebalanced Game Logic ---
         emojis = ["🍒", "🍊", "🔔", "💎", "💰"] # Reduced to 5 symbols for a higher win rate
@@ -149,8 +173,8 @@ class GamesCog(commands.Cog):
         elif reels[0] == reels[2]: # Two of a kind (corners) - NEW
             payout = bet # Return the bet
 
-        new_balance = player['balance'] - bet + payout
-        await self.bot.db.update_user_data(interaction.user.id, interaction.guild.id, {"balance": new_balance})
+        new_balance = await self.place_bet(interaction, bet, payout, "slots")
+        if new_balance is None: return
 
         embed = discord.Embed(title="🎰 Slot Machine 🎰", color=discord.Color.gold())
         embed.set_author(name=f"{interaction.user.display_name}'s game")
@@ -179,27 +203,25 @@ class GamesCog(commands.Cog):
     ])
     async def coinflip(self, interaction: discord.Interaction, bet: int, choice: str):
         await interaction.response.defer()
-        player = await self.bot.db.get_user_data(interaction.user.id, interaction.guild.id)
         if bet <= 0:
             await interaction.followup.send("❌ You must bet a positive amount of coins.", ephemeral=True); return
-        if player['balance'] < bet:
-            await interaction.followup.send(f"❌ You don't have enough coins! Your balance is **{player['balance']:,}**.", ephemeral=True); return
 
         outcome = random.choice(["heads", "tails"])
         won = (choice.lower() == outcome)
         
         if won:
-            new_balance = player['balance'] + bet
+            payout = bet * 2
             title = "🎉 You Won! 🎉"
             color = discord.Color.green()
             description = f"The coin landed on **{outcome.title()}**. You won **{bet*2:,}** coins!"
         else:
-            new_balance = player['balance'] - bet
+            payout = 0
             title = "💔 You Lost 💔"
             color = discord.Color.red()
             description = f"The coin landed on **{outcome.title()}**. You lost **{bet:,}** coins."
             
-        await self.bot.db.update_user_data(interaction.user.id, interaction.guild.id, {"balance": new_balance})
+        new_balance = await self.place_bet(interaction, bet, payout, "coinflip")
+        if new_balance is None: return
         embed = discord.Embed(title=title, description=description, color=color)
         embed.set_author(name=f"{interaction.user.display_name}'s coin flip")
         embed.set_footer(text=f"New Balance: {new_balance:,}")
@@ -211,13 +233,12 @@ class GamesCog(commands.Cog):
     @app_commands.describe(bet="The amount of coins to bet.")
     async def blackjack(self, interaction: discord.Interaction, bet: int):
         await interaction.response.defer()
-        player = await self.bot.db.get_user_data(interaction.user.id, interaction.guild.id)
         if bet <= 0:
             await interaction.followup.send("❌ You must bet a positive amount of coins.", ephemeral=True); return
-        if player['balance'] < bet:
-            await interaction.followup.send(f"❌ You don't have enough coins! Your balance is **{player['balance']:,}**.", ephemeral=True); return
+        stake_id = f"blackjack:{interaction.id}"
+        if await self.place_bet(interaction, bet, game="blackjack", stake_id=stake_id) is None: return
 
-        view = BlackjackView(self.bot, interaction.user, player, bet)
+        view = BlackjackView(self.bot, interaction.user, bet, stake_id)
         player_score = view.calculate_hand_value(view.player_hand)
         
         # Initial Embed
@@ -237,11 +258,8 @@ class GamesCog(commands.Cog):
     @app_commands.describe(bet="The amount to bet.", space="The space to bet on (e.g., 'red', 'black', 'even', 'odd', or a number 0-36).")
     async def roulette(self, interaction: discord.Interaction, bet: int, space: str):
         await interaction.response.defer()
-        player = await self.bot.db.get_user_data(interaction.user.id, interaction.guild.id)
         if bet <= 0:
             await interaction.followup.send("❌ You must bet a positive amount of coins.", ephemeral=True); return
-        if player['balance'] < bet:
-            await interaction.followup.send(f"❌ You don't have enough coins! Your balance is **{player['balance']:,}**.", ephemeral=True); return
         
         space = space.lower()
         
@@ -275,14 +293,15 @@ class GamesCog(commands.Cog):
         result_color = "Red" if winning_number in red_numbers else ("Green" if winning_number == 0 else "Black")
         embed = discord.Embed(title="🎡 Roulette 🎡", description=f"The ball landed on **{winning_number} ({result_color})**", color=discord.Color.dark_magenta())
         
+        # A winning bet is returned along with the payout.
+        new_balance = await self.place_bet(interaction, bet, bet + payout if won else 0, "roulette")
+        if new_balance is None: return
+
         if won:
-            new_balance = player['balance'] + payout
             embed.add_field(name="🎉 You Won! 🎉", value=f"Your bet on **{space.title()}** won! You get **{payout:,}** coins!")
         else:
-            new_balance = player['balance'] - bet
             embed.add_field(name="💔 You Lost 💔", value=f"Your bet on **{space.title()}** lost. You lose **{bet:,}** coins.")
             
-        await self.bot.db.update_user_data(interaction.user.id, interaction.guild.id, {"balance": new_balance})
         embed.set_footer(text=f"New Balance: {new_balance:,}")
         await interaction.followup.send(embed=embed)
 
@@ -297,11 +316,8 @@ class GamesCog(commands.Cog):
     ])
     async def rps(self, interaction: discord.Interaction, bet: int, choice: str):
         await interaction.response.defer()
-        player = await self.bot.db.get_user_data(interaction.user.id, interaction.guild.id)
         if bet <= 0:
             await interaction.followup.send("❌ You must bet a positive amount of coins.", ephemeral=True); return
-        if player['balance'] < bet:
-            await interaction.followup.send(f"❌ You don't have enough coins! Your balance is **{player['balance']:,}**.", ephemeral=True); return
         
         bot_choice = random.choice(["rock", "paper", "scissors"])
         
@@ -316,16 +332,17 @@ class GamesCog(commands.Cog):
             winner = False
 
         if winner is True:
-            new_balance = player['balance'] + bet
+            payout = bet * 2
             result_text = f"You won! You chose **{choice.title()}** and I chose **{bot_choice.title()}**."
         elif winner is False:
-            new_balance = player['balance'] - bet
+            payout = 0
             result_text = f"You lost! You chose **{choice.title()}** and I chose **{bot_choice.title()}**."
         else:
-            new_balance = player['balance']
+            payout = bet
             result_text = f"It's a tie! We both chose **{choice.title()}**."
             
-        await self.bot.db.update_user_data(interaction.user.id, interaction.guild.id, {"balance": new_balance})
+        new_balance = await self.place_bet(interaction, bet, payout, "rps")
+        if new_balance is None: return
         embed = discord.Embed(title="✊ Rock, Paper, Scissors ✌️", description=result_text, color=discord.Color.orange())
         embed.set_footer(text=f"New Balance: {new_balance:,}")
         await interaction.followup.send(embed=embed)
@@ -20,23 +20,23 @@ class PurchaseView(ui.View):
     async def buy_button(self, interaction: discord.Interaction, button: ui.Button):
         await interaction.response.defer(thinking=True, ephemeral=True)
         try:
-            item = await self.bot.db.get_item_details(self.item_id, interaction.guild.id)
-            player = await self.bot.db.get_user_data(interaction.user.id, interaction.guild.id)
+            commission_amount = int(self.original_price * COMMISSION_RATE)
+            # Item lookup, payment, commission and purchase count commit together, across both databases.
+            async with self.bot.db.transaction() as tx:
+                found = tx.get_item_details(self.item_id, interaction.guild.id, required=True)
+                # Only charges the buyer if they can afford it, in a single atomic update.
+                paid = tx.debit_if_sufficient(
+                    interaction.user.id, interaction.guild.id, self.final_price, reason="purchase", ref=f"item:{self.item_id}", required=True
+                )
+                tx.add_balance(found["creator_id"], interaction.guild.id, commission_amount, reason="commission", ref=f"item:{self.item_id}")
+                tx.increment_purchase_count(self.item_id, interaction.guild.id)
 
+            item = found.value
             if not item:
                 return await interaction.followup.send("❌ This item seems to have been removed from the shop.", ephemeral=True)
-            if player['balance'] < self.final_price:
+            if paid.value is None:
                 return await interaction.followup.send(f"❌ You don't have enough coins! You need **{self.final_price:,}** coins.", ephemeral=True)
 
-            commission_amount = int(self.original_price * COMMISSION_RATE)
-            new_balance_buyer = player['balance'] - self.final_price
-            await self.bot.db.update_user_data(interaction.user.id, interaction.guild.id, {"balance": new_balance_buyer})
-            
-            creator_data = await self.bot.db.get_user_data(item['creator_id'], interaction.guild.id)
-            new_balance_creator = creator_data['balance'] + commission_amount
-            await self.bot.db.update_user_data(item['creator_id'], interaction.guild.id, {"balance": new_balance_creator})
-            await self.bot.db.increment_purchase_count(self.item_id, interaction.guild.id)
-            
             # ... (Purchase Log is unchanged)
             dm_desc = f"Thank you for purchasing **{item['item_name']}**."
             if self.discount > 0:
@@ -80,6 +80,9 @@ class SearchResultsView(ui.View):
         if item.get('screenshot_link'): embed.set_image(url=item['screenshot_link'])
         await interaction.followup.send(embed=embed, view=PurchaseView(self.bot, item_id, item['price'], final_price, perks['shop_discount']), ephemeral=True)
 
+# Which keyset order each list tab pages through.
+TAB_ORDERS = {"new": "new", "all_items": "name"}
+
 class ShopView(ui.View):
     # ... (This class is mostly unchanged)
     def __init__(self, bot: commands.Bot, author_id: int, guild_id: int):
@@ -91,6 +94,18 @@ class ShopView(ui.View):
         self.current_items = []
         self.selected_index = 0
         self.items_in_view = 10
+        # Items are loaded a page at a time; next_key is None once the list is exhausted.
+        self.page_size = 25
+        self.next_key = None
+        self.total_items = 0
+
+    async def load_more_items(self):
+        """Fetches pages until the window around selected_index is loaded."""
+        order = TAB_ORDERS.get(self.current_tab)
+        needed = self.selected_index + self.items_in_view
+        while order and self.next_key is not None and len(self.current_items) < needed:
+            page, self.next_key = await self.bot.db.get_items_page(self.guild_id, order, self.next_key, self.page_size)
+            self.current_items.extend(page)
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
         if self.author_id and interaction.user.id != self.author_id:
@@ -172,10 +187,11 @@ class ShopView(ui.View):
                     prefix = "➤" if i == self.selected_index else "•"
                     list_str += f"{prefix} `{item['item_name']}` - **{item.get('price', 0):,}** coins\n"
                 content_description += list_str
-                embed.set_footer(text=f"Showing item {self.selected_index + 1} of {len(self.current_items)}")
-                if len(self.current_items) > 1:
+                total = max(self.total_items, len(self.current_items))
+                embed.set_footer(text=f"Showing item {self.selected_index + 1} of {total}")
+                if total > 1:
                     self.scroll_up_button.disabled = self.selected_index == 0
-                    self.scroll_down_button.disabled = self.selected_index == len(self.current_items) - 1
+                    self.scroll_down_button.disabled = self.selected_index == len(self.current_items) - 1 and self.next_key is None
                     self.add_item(self.scroll_up_button)
                     self.add_item(self.scroll_down_button)
                 self.add_item(self.select_item_button)
@@ -192,9 +208,13 @@ class ShopView(ui.View):
     async def handle_tab_switch(self, interaction: discord.Interaction, tab_name: str):
         self.current_tab = tab_name
         self.selected_index = 0
-        if self.current_tab == "new": self.current_items = await self.bot.db.get_new_arrivals(self.guild_id, limit=None)
-        elif self.current_tab == "all_items": self.current_items = await self.bot.db.get_all_items(self.guild_id)
-        else: self.current_items = []
+        self.current_items = []
+        self.next_key = None
+        self.total_items = 0
+        if self.current_tab in TAB_ORDERS:
+            order = TAB_ORDERS[self.current_tab]
+            self.current_items, self.next_key = await self.bot.db.get_items_page(self.guild_id, order, None, self.page_size)
+            self.total_items = await self.bot.db.count_items(self.guild_id)
         self.featured_button.style = discord.ButtonStyle.primary if tab_name == "featured" else discord.ButtonStyle.secondary
         self.new_button.style = discord.ButtonStyle.primary if tab_name == "new" else discord.ButtonStyle.secondary
         self.all_items_button.style = discord.ButtonStyle.primary if tab_name == "all_items" else discord.ButtonStyle.secondary
@@ -223,6 +243,7 @@ class ShopView(ui.View):
         if self.selected_index < len(self.current_items) - 1:
             self.selected_index += 1
             await interaction.response.defer()
+            await self.load_more_items()
             await self.update_view(interaction)
 
 class ShopCog(commands.Cog):
@@ -256,6 +277,12 @@ class ShopCog(commands.Cog):
         embed = discord.Embed(title=f"🔎 Search Results for `{query}`", description=f"Found **{len(results)}** item(s). Please select one to view details.", color=discord.Color.from_str("#5865F2"))
         await interaction.followup.send(embed=embed, view=SearchResultsView(self.bot, results), ephemeral=True)
 
+    @search.autocomplete("query")
+    async def search_autocomplete(self, interaction: discord.Interaction, current: str):
+        if len(current) < 2: return []
+        results = await self.bot.db.search_items(interaction.guild.id, current, limit=25)
+        return [app_commands.Choice(name=item['item_name'][:100], value=item['item_name'][:100]) for item in results]
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(ShopCog(bot))
 
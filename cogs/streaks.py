@@ -79,18 +79,22 @@ class StreaksCog(commands.Cog):
             # Calculate reward
             level_bonus = (player['level'] // 50) * 50
             total_reward = min(50 + level_bonus, 500)
-            new_balance = player['balance'] + total_reward
             
-            # Prepare data for database update
+            # Prepare data for database update (the reward is credited in the same transaction)
             data_to_update = {
-                "balance": new_balance,
                 "daily_streak": new_streak,
                 # --- NEW: Store the full ISO format timestamp ---
                 "last_daily": current_time_utc.isoformat(),
                 "daily_spam_count": 0
             }
             
-            await self.bot.db.update_user_data(interaction.user.id, interaction.guild.id, data_to_update)
+            # Only applies if last_daily is still what we read, so a double-clicked /daily pays once.
+            new_balance = await self.bot.db.update_user_data_if(
+                interaction.user.id, interaction.guild.id, {"last_daily": last_claim_str}, data_to_update, credit=total_reward, reason="daily"
+            )
+            if new_balance is None:
+                await interaction.followup.send("You have already claimed your daily reward.", ephemeral=True)
+                return
 
             # Send confirmation message
             embed = discord.Embed(
@@ -13,6 +13,7 @@ class StreamingCog(commands.Cog):
         self.XP_PER_MINUTE = 40
         self.DAILY_COIN_LIMIT = 500 # Max coins a user can earn from streaming per day
         self.MINIMUM_STREAM_MINUTES = 1 # User must stream for at least this many minutes to get rewards
+        self.CLAIM_ATTEMPTS = 3 # Re-reads allowed when another write changed the user's row first
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -46,32 +47,46 @@ class StreamingCog(commands.Cog):
                 return
 
             try:
-                # Get user data from the database
-                player = await self.bot.db.get_user_data(member.id, member.guild.id)
-                
-                # Check and reset daily limit if it's a new day
-                today = datetime.date.today().isoformat()
-                last_daily_str = player.get('last_daily')
-                if last_daily_str != today:
-                    player['daily_stream_coins'] = 0
-                
-                # Calculate rewards
-                xp_earned = duration_minutes * self.XP_PER_MINUTE
-                
-                # Calculate coins earned, respecting the daily limit
-                remaining_coins_for_day = self.DAILY_COIN_LIMIT - player.get('daily_stream_coins', 0)
-                potential_coins = duration_minutes * self.COINS_PER_MINUTE
-                coins_earned = max(0, min(potential_coins, remaining_coins_for_day))
-
-                # Prepare data for database update
-                data_to_update = {
-                    "xp": player["xp"] + xp_earned,
-                    "balance": player["balance"] + coins_earned,
-                    "daily_stream_coins": player.get('daily_stream_coins', 0) + coins_earned,
-                    "last_daily": today # Update the 'last_daily' field to mark the activity day
-                }
-
-                await self.bot.db.update_user_data(member.id, member.guild.id, data_to_update)
+                # The write only lands if last_daily and daily_stream_coins are still what we
+                # read, so the daily coin limit holds against concurrent writes; re-read and retry otherwise.
+                for _ in range(self.CLAIM_ATTEMPTS):
+                    # Get user data from the database
+                    player = await self.bot.db.get_user_data(member.id, member.guild.id)
+                    stored = {"last_daily": player.get('last_daily'), "daily_stream_coins": player.get('daily_stream_coins', 0)}
+
+                    # Check and reset daily limit if it's a new day
+                    today = datetime.date.today().isoformat()
+                    last_daily_str = player.get('last_daily')
+                    if last_daily_str != today:
+                        player['daily_stream_coins'] = 0
+
+                    # Calculate rewards
+                    xp_earned = duration_minutes * self.XP_PER_MINUTE
+
+                    # Calculate coins earned, respecting the daily limit
+                    remaining_coins_for_day = self.DAILY_COIN_LIMIT - player.get('daily_stream_coins', 0)
+                    potential_coins = duration_minutes * self.COINS_PER_MINUTE
+                    coins_earned = max(0, min(potential_coins, remaining_coins_for_day))
+
+                    # Prepare data for database update (coins are credited in the same transaction)
+                    data_to_update = {
+                        "xp": player["xp"] + xp_earned,
+                        "daily_stream_coins": player.get('daily_stream_coins', 0) + coins_earned,
+                        "last_daily": today # Update the 'last_daily' field to mark the activity day
+                    }
+
+                    new_balance = await self.bot.db.update_user_data_if(
+                        member.id, member.guild.id, stored, data_to_update, credit=coins_earned, reason="streaming"
+                    )
+                    if new_balance is not None:
+                        break
+                else:
+                    print(f"Gave up recording streaming rewards for {member.name} after {self.CLAIM_ATTEMPTS} conflicting writes.")
+                    return
+
+                economy_cog = self.bot.get_cog("EconomyCog")
+                if economy_cog:
+                    economy_cog.leaderboard_cache.xp_changed(member.guild.id, member.id, player["total_xp"] + xp_earned)
                 
                 # This log message is commented out to prevent console spam.
                 # print(f"{member.name} streamed for {duration_minutes} minutes and earned {xp_earned} XP and {coins_earned} coins.")
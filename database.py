@@ -1,113 +1,1817 @@
 import sqlite3
-import functools
+import re
+import contextlib
+import threading
+import queue
+import asyncio
+import concurrent.futures
 from discord.ext import commands
 import time
 import os
+import json
+import random
+import itertools
+from collections import deque
+
+# Group commit tuning for the writer thread.
+WRITE_BATCH_SIZE = 64       # Max writes committed in one transaction
+WRITE_MAX_LATENCY = 0.005   # Max seconds the first write in a batch waits for company
+
+# Reader thread pool. Callers wait (backpressure) once DB_MAX_PENDING_READS jobs
+# are queued or running.
+DB_READ_WORKERS = 4
+DB_MAX_PENDING_READS = 256
+# Writers wait the same way once DB_MAX_PENDING_WRITES writes (economy.db and
+# shop.db together) are queued or running.
+DB_MAX_PENDING_WRITES = 1024
+
+# --- PRAGMA profiles ---
+# Applied to every pooled connection. With WAL, synchronous=NORMAL can lose the
+# last commits on power loss (never on a crash of the bot itself) but never
+# corrupts the file; OFF can also lose them if the OS crashes.
+# Pick one per database with ECONOMY_DB_PROFILE / SHOP_DB_PROFILE, or for both
+# with DB_PROFILE.
+PRAGMA_PROFILES = {
+    "durable": {
+        "synchronous": "FULL", "cache_size": -8000, "mmap_size": 0,
+        "temp_store": "DEFAULT", "busy_timeout": 5000, "wal_autocheckpoint": 1000,
+    },
+    "balanced": {
+        "synchronous": "NORMAL", "cache_size": -32000, "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY", "busy_timeout": 5000, "wal_autocheckpoint": 1000,
+    },
+    "fast": {
+        "synchronous": "OFF", "cache_size": -64000, "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY", "busy_timeout": 2000, "wal_autocheckpoint": 4000,
+    },
+}
+DEFAULT_PRAGMA_PROFILE = "balanced"
+
+def pragma_profile(env_var: str) -> str:
+    """The profile named by `env_var`, else DB_PROFILE, else the default."""
+    name = os.getenv(env_var) or os.getenv("DB_PROFILE") or DEFAULT_PRAGMA_PROFILE
+    if name not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown database profile {name!r} in {env_var}; expected one of {', '.join(PRAGMA_PROFILES)}")
+    return name
+
+# SQLITE_BUSY / SQLITE_LOCKED handling: busy_timeout (see the profiles) waits
+# inside SQLite first; past that, calls are retried with jittered backoff.
+DB_RETRY_ATTEMPTS = 5
+DB_RETRY_BASE_DELAY = 0.01 # Seconds; doubles every attempt, randomised ("full jitter")
+DB_RETRY_MAX_DELAY = 0.5
+
+# Query instrumentation. Calls slower than DB_SLOW_QUERY_MS (0 disables the slow
+# query log) are printed with the EXPLAIN QUERY PLAN of the statements they ran.
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_SIZE = 50
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Background maintenance, checked every MAINTENANCE_INTERVAL seconds.
+MAINTENANCE_INTERVAL = 60
+WAL_CHECKPOINT_BYTES = 4 * 1024 * 1024    # PASSIVE checkpoint once the WAL is this big
+WAL_TRUNCATE_BYTES = 64 * 1024 * 1024     # TRUNCATE checkpoint (waits for readers) past this
+OPTIMIZE_INTERVAL = 6 * 3600              # Seconds between PRAGMA optimize runs
+LOW_TRAFFIC_CALLS_PER_MINUTE = 120        # Vacuum only runs while DB traffic is below this
+VACUUM_MIN_FREE_PAGES = 256               # Free pages needed before an incremental vacuum is worth it
+VACUUM_PAGES_PER_STEP = 2048              # Pages released per incremental vacuum step
+
+# How often buffered chat rewards are written to economy.db.
+REWARD_FLUSH_INTERVAL = 5.0
+
+# Guild configuration used to live in this file; it is imported once by migration 6.
+LEGACY_SETTINGS_FILE = "channel_config.json"
+
+@contextlib.contextmanager
+def transaction(con: sqlite3.Connection, mode: str = ""):
+    """Runs the block in a transaction, or in a savepoint if one is already open."""
+    if con.in_transaction:
+        con.execute("SAVEPOINT nested")
+        try:
+            yield con
+        except BaseException:
+            # Some errors (SQLITE_FULL, ON CONFLICT ROLLBACK) end the whole transaction, savepoints included.
+            if con.in_transaction:
+                con.execute("ROLLBACK TO nested")
+                con.execute("RELEASE nested")
+            raise
+        con.execute("RELEASE nested")
+    else:
+        con.execute(f"BEGIN {mode}")
+        try:
+            yield con
+            con.commit()
+        except BaseException:
+            # Also covers a failed COMMIT (e.g. SQLITE_BUSY), so a retry starts clean.
+            if con.in_transaction:
+                con.rollback()
+            raise
+
+# --- Schema migrations ---
+# Each database's schema version lives in PRAGMA user_version. A migration is
+# (version, description, steps); a step is either SQL or a callable taking the
+# connection. Every pending migration runs in its own transaction together with
+# the version bump, so a failed step leaves the database at the previous version.
+
+def column_defaults(con: sqlite3.Connection, table: str) -> dict:
+    """Returns {column: default value} for a table, typed according to the column."""
+    defaults = {}
+    for column in con.execute(f"PRAGMA table_info({table})").fetchall():
+        _, name, column_type, _, value, _ = column
+        if value is not None:
+            column_type = column_type.upper()
+            if column_type == "INTEGER":
+                value = int(value)
+            elif column_type == "REAL":
+                value = float(value)
+            else:
+                value = value.strip("'")
+        defaults[name] = value
+    return defaults
+
+def add_column(table: str, column: str, definition: str):
+    """A migration step that adds a column unless an older build already did."""
+    def step(con: sqlite3.Connection):
+        existing = {row[1] for row in con.execute(f"PRAGMA table_xinfo({table})")}
+        if column not in existing:
+            con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+def prune_default_users(con: sqlite3.Connection):
+    """Deletes user rows that were created by reads in the past and never written to."""
+    defaults = column_defaults(con, "users")
+    columns = [column for column in defaults if column not in ("user_id", "guild_id")]
+    where_clause = " AND ".join(f"{column} IS ?" for column in columns)
+    con.execute(f"DELETE FROM users WHERE {where_clause}", [defaults[column] for column in columns])
+
+def fts5_available(con: sqlite3.Connection) -> bool:
+    try:
+        con.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        con.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def create_items_search_index(con: sqlite3.Connection):
+    """Full-text index over item name, application and category, kept in sync by triggers.
+
+    guild_id is indexed as well, so a `guild_id : "<id>"` column filter narrows a
+    search to one guild inside FTS rather than after ranking every guild's matches.
+    Skipped when SQLite was built without FTS5; ensure_items_search_index creates
+    it on a later start once FTS5 is available.
+    """
+    if not fts5_available(con):
+        return
+    con.execute("DROP TRIGGER IF EXISTS items_fts_insert")
+    con.execute("DROP TRIGGER IF EXISTS items_fts_delete")
+    con.execute("DROP TRIGGER IF EXISTS items_fts_update")
+    con.execute("DROP TABLE IF EXISTS items_fts")
+    con.execute("""
+        CREATE VIRTUAL TABLE items_fts USING fts5(
+            item_name, application, category, guild_id,
+            content='items', content_rowid='item_id', tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    con.execute("""
+        CREATE TRIGGER items_fts_insert AFTER INSERT ON items BEGIN
+            INSERT INTO items_fts (rowid, item_name, application, category, guild_id)
+            VALUES (new.item_id, new.item_name, new.application, new.category, new.guild_id);
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER items_fts_delete AFTER DELETE ON items BEGIN
+            INSERT INTO items_fts (items_fts, rowid, item_name, application, category, guild_id)
+            VALUES ('delete', old.item_id, old.item_name, old.application, old.category, old.guild_id);
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER items_fts_update AFTER UPDATE OF item_name, application, category, guild_id ON items BEGIN
+            INSERT INTO items_fts (items_fts, rowid, item_name, application, category, guild_id)
+            VALUES ('delete', old.item_id, old.item_name, old.application, old.category, old.guild_id);
+            INSERT INTO items_fts (rowid, item_name, application, category, guild_id)
+            VALUES (new.item_id, new.item_name, new.application, new.category, new.guild_id);
+        END
+    """)
+    con.execute("INSERT INTO items_fts (items_fts) VALUES ('rebuild')")
+
+def has_items_search_index(con: sqlite3.Connection) -> bool:
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = 'items_fts'").fetchone() is not None
+
+def ensure_items_search_index(con: sqlite3.Connection) -> bool:
+    """Creates the search index if its migration ran on a SQLite without FTS5.
+
+    The migration still counts as applied, so this check runs on every start.
+    Returns whether the index exists.
+    """
+    if has_items_search_index(con):
+        return True
+    if not fts5_available(con):
+        print("Warning: SQLite has no FTS5 support, shop search will use slow LIKE matching.")
+        return False
+    with transaction(con, "IMMEDIATE"):
+        create_items_search_index(con)
+    print("  Created the shop search index, which an earlier start skipped for lack of FTS5.")
+    return True
+
+def create_guild_settings(con: sqlite3.Connection):
+    """One row per guild and setting, values stored as JSON.
+
+    settings_version is bumped by triggers on every change, so a reader can
+    tell whether its cached copy is stale with a single-row lookup.
+    """
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS guild_settings (
+            guild_id INTEGER NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,
+            PRIMARY KEY (guild_id, key)
+        ) WITHOUT ROWID
+    """)
+    con.execute("CREATE TABLE IF NOT EXISTS settings_version (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)")
+    con.execute("INSERT OR IGNORE INTO settings_version (id, version) VALUES (0, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        con.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS guild_settings_{event.lower()} AFTER {event} ON guild_settings BEGIN
+                UPDATE settings_version SET version = version + 1 WHERE id = 0;
+            END
+        """)
+
+def import_legacy_settings(con: sqlite3.Connection):
+    """Copies channel_config.json into guild_settings. The file itself is left in place."""
+    if not os.path.exists(LEGACY_SETTINGS_FILE):
+        return
+    with open(LEGACY_SETTINGS_FILE, "r") as f:
+        try: all_settings = json.load(f)
+        except json.JSONDecodeError: all_settings = {}
+    rows = [
+        (int(guild_id), key, json.dumps(value))
+        for guild_id, guild_settings in all_settings.items()
+        for key, value in guild_settings.items()
+    ]
+    con.executemany("INSERT OR REPLACE INTO guild_settings (guild_id, key, value) VALUES (?, ?, ?)", rows)
+    print(f"  Imported {len(rows)} settings for {len(all_settings)} guilds from {LEGACY_SETTINGS_FILE}; the file is no longer read.")
+
+def create_ledger(con: sqlite3.Connection):
+    """Append-only record of every balance change, opened with each user's current balance.
+
+    users.balance stays the snapshot that reads use; it equals the column
+    default (0) plus the sum of the user's ledger deltas.
+    """
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS ledger (
+            entry_id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL, reason TEXT NOT NULL, ref TEXT, ts REAL NOT NULL
+        )
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_ledger_guild_user_ts ON ledger (guild_id, user_id, ts)")
+    for event in ("UPDATE", "DELETE"):
+        con.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS ledger_no_{event.lower()} BEFORE {event} ON ledger BEGIN
+                SELECT RAISE(ABORT, 'ledger is append-only');
+            END
+        """)
+    con.execute(
+        "INSERT INTO ledger (guild_id, user_id, delta, reason, ts) SELECT guild_id, user_id, balance, 'opening', ? FROM users WHERE balance != 0",
+        (time.time(),)
+    )
+
+LEDGER_INSERT_SQL = "INSERT INTO ledger (guild_id, user_id, delta, reason, ref, ts) VALUES (?, ?, ?, ?, ?, ?)"
+
+def record_ledger(con: sqlite3.Connection, entries):
+    """Appends (guild_id, user_id, delta, reason, ref) entries, stamped with the current time."""
+    now = time.time()
+    con.executemany(LEDGER_INSERT_SQL, ((*entry, now) for entry in entries if entry[2]))
+
+def fts_prefix_query(text: str):
+    """Turns free text into an FTS5 query where every word must match as a prefix."""
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words) if words else None
+
+# Cumulative XP: every level L costs 100 + 50 * L XP, so reaching `level` from
+# level 1 took 100 * (level - 1) + 25 * level * (level - 1) XP, plus the current xp.
+TOTAL_XP_SQL = "100 * (level - 1) + 25 * level * (level - 1) + xp"
+
+def total_xp(level: int, xp: int) -> int:
+    return 100 * (level - 1) + 25 * level * (level - 1) + xp
+
+ECONOMY_MIGRATIONS = [
+    (1, "create users table", ["""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL,
+            balance INTEGER DEFAULT 0, xp INTEGER DEFAULT 0, level INTEGER DEFAULT 1,
+            last_daily TEXT, daily_streak INTEGER DEFAULT 0,
+            last_coin_claim REAL DEFAULT 0, last_xp_claim REAL DEFAULT 0,
+            daily_spam_count INTEGER DEFAULT 0,
+            daily_stream_coins INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, guild_id)
+        )
+    """]),
+    (2, "add users.last_bump_timestamp", [add_column("users", "last_bump_timestamp", "REAL DEFAULT 0")]),
+    (3, "remove default-only user rows", [prune_default_users]),
+    (4, "index users by guild, level and xp", [
+        "CREATE INDEX IF NOT EXISTS idx_users_guild_level_xp ON users (guild_id, level, xp)",
+    ]),
+    (5, "add generated users.total_xp and rank index", [
+        add_column("users", "total_xp", f"INTEGER GENERATED ALWAYS AS ({TOTAL_XP_SQL}) VIRTUAL"),
+        "CREATE INDEX IF NOT EXISTS idx_users_guild_total_xp ON users (guild_id, total_xp, user_id)",
+        "DROP INDEX IF EXISTS idx_users_guild_level_xp",
+    ]),
+    (6, "move guild settings into guild_settings", [create_guild_settings, import_legacy_settings]),
+    (7, "create the coin ledger with opening balances", [create_ledger]),
+    (8, "create open_stakes for bets held across a game", ["""
+        CREATE TABLE IF NOT EXISTS open_stakes (
+            stake_id TEXT PRIMARY KEY, guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL, game TEXT NOT NULL, ts REAL NOT NULL
+        )
+    """]),
+]
+
+SHOP_MIGRATIONS = [
+    (1, "create items table", ["""
+        CREATE TABLE IF NOT EXISTS items (
+            item_id INTEGER PRIMARY KEY AUTOINCREMENT, creator_id INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL, item_name TEXT NOT NULL, application TEXT NOT NULL,
+            category TEXT NOT NULL, price INTEGER NOT NULL, product_link TEXT NOT NULL,
+            screenshot_link TEXT, screenshot_link_2 TEXT, screenshot_link_3 TEXT
+        )
+    """]),
+    (2, "add items.purchase_count, upload_timestamp and is_featured", [
+        add_column("items", "purchase_count", "INTEGER DEFAULT 0"),
+        add_column("items", "upload_timestamp", "REAL DEFAULT 0"),
+        add_column("items", "is_featured", "INTEGER DEFAULT 0"),
+    ]),
+    (3, "index items for listings and creator lookups", [
+        "CREATE INDEX IF NOT EXISTS idx_items_guild_upload ON items (guild_id, upload_timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_items_guild_purchases ON items (guild_id, purchase_count)",
+        "CREATE INDEX IF NOT EXISTS idx_items_creator_guild ON items (creator_id, guild_id)",
+    ]),
+    (4, "full-text search index for items", [create_items_search_index]),
+    (5, "index items by guild and name", [
+        "CREATE INDEX IF NOT EXISTS idx_items_guild_name ON items (guild_id, item_name)",
+    ]),
+    (6, "add guild_id to the search index", [create_items_search_index]),
+]
+
+# Sort orders for keyset pagination: order name -> (column, direction). Ties are
+# broken by item_id in the same direction, which every (guild_id, column) index
+# already carries as its implicit rowid suffix.
+ITEM_PAGE_ORDERS = {
+    "new": ("upload_timestamp", "DESC"),
+    "name": ("item_name", "ASC"),
+    "popular": ("purchase_count", "DESC"),
+}
+
+def migrate(con: sqlite3.Connection, migrations: list) -> list:
+    """Applies every migration newer than the database's user_version.
+
+    Returns (version, description, seconds) for each migration that ran.
+    """
+    current_version = con.execute("PRAGMA user_version").fetchone()[0]
+    applied = []
+    for version, description, steps in migrations:
+        if version <= current_version:
+            continue
+        started = time.perf_counter()
+        with transaction(con, "IMMEDIATE"):
+            for step in steps:
+                if callable(step):
+                    step(con)
+                else:
+                    con.execute(step)
+            con.execute(f"PRAGMA user_version = {version}")
+        applied.append((version, description, time.perf_counter() - started))
+    return applied
+
+class ConnectionPool:
+    """Keeps one long-lived connection per thread for a single database file.
+
+    Executor threads are reused, so after warm-up every query runs on an already
+    open connection instead of paying for connect + schema parsing each time.
+    Connections are opened in autocommit mode; use `transaction()` for writes.
+    Handing out a connection never blocks, so the only latency worth reporting
+    is opening one; time spent waiting for a thread shows up in JobMetrics.
+    """
+    def __init__(self, path: str, profile: str = DEFAULT_PRAGMA_PROFILE, trace_callback=None):
+        self.path = path
+        self.profile = profile
+        self.trace_callback = trace_callback # Called with (pool, sql) for every statement
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._acquired = 0
+        self._opened = 0
+        self._in_use = 0
+        self._connect_total = 0.0
+        self._connect_max = 0.0
+
+    def _open(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        con.row_factory = sqlite3.Row
+        for pragma, value in PRAGMA_PROFILES[self.profile].items():
+            con.execute(f"PRAGMA {pragma} = {value}")
+        if self.trace_callback is not None:
+            con.set_trace_callback(lambda sql: self.trace_callback(self, sql))
+        return con
+
+    def current(self):
+        """The calling thread's connection, or None if it hasn't opened one."""
+        return getattr(self._local, "con", None)
+
+    @contextlib.contextmanager
+    def connection(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            start = time.perf_counter()
+            con = self._open()
+            connect_time = time.perf_counter() - start
+            self._local.con = con
+            with self._lock:
+                self._connections.append(con)
+                self._opened += 1
+                self._connect_total += connect_time
+                self._connect_max = max(self._connect_max, connect_time)
+        with self._lock:
+            self._acquired += 1
+            self._in_use += 1
+        try:
+            yield con
+        finally:
+            with self._lock:
+                self._in_use -= 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "profile": self.profile,
+                "size": len(self._connections),
+                "in_use": self._in_use,
+                "opened": self._opened,
+                "acquired": self._acquired,
+                "avg_connect_ms": (self._connect_total / self._opened * 1000) if self._opened else 0.0,
+                "max_connect_ms": self._connect_max * 1000,
+            }
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for con in connections:
+            con.close()
+        # Threads that touch the pool again will transparently reconnect.
+        self._local = threading.local()
+
+def job_name(func) -> str:
+    """`_get_user_data_sync` -> `get_user_data`, the name metrics are kept under."""
+    name = getattr(func, "__name__", repr(func)).lstrip("_")
+    return name[:-len("_sync")] if name.endswith("_sync") else name
+
+class JobMetrics:
+    """Per-method queue and timing counters for jobs handed to database threads.
+
+    `wait` is the time from submission until a thread picked the job up, `exec`
+    the time it then ran for. Updated from several threads, hence the lock.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    def _method(self, name: str) -> dict:
+        method = self._methods.get(name)
+        if method is None:
+            method = self._methods[name] = {
+                "calls": 0, "queued": 0, "in_flight": 0,
+                "wait_total": 0.0, "wait_max": 0.0, "exec_total": 0.0, "exec_max": 0.0,
+            }
+        return method
+
+    def queued(self, name: str):
+        with self._lock:
+            self._method(name)["queued"] += 1
+
+    def dropped(self, name: str):
+        """A queued job that was cancelled before it started."""
+        with self._lock:
+            self._method(name)["queued"] -= 1
+
+    def started(self, name: str, waited: float):
+        with self._lock:
+            method = self._method(name)
+            method["queued"] -= 1
+            method["in_flight"] += 1
+            method["wait_total"] += waited
+            method["wait_max"] = max(method["wait_max"], waited)
+
+    def finished(self, name: str, seconds: float):
+        with self._lock:
+            method = self._method(name)
+            method["in_flight"] -= 1
+            method["calls"] += 1
+            method["exec_total"] += seconds
+            method["exec_max"] = max(method["exec_max"], seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            methods = {}
+            for name, method in self._methods.items():
+                calls = method["calls"]
+                methods[name] = {
+                    "calls": calls, "queued": method["queued"], "in_flight": method["in_flight"],
+                    "avg_wait_ms": method["wait_total"] / calls * 1000 if calls else 0.0,
+                    "max_wait_ms": method["wait_max"] * 1000,
+                    "avg_exec_ms": method["exec_total"] / calls * 1000 if calls else 0.0,
+                    "max_exec_ms": method["exec_max"] * 1000,
+                }
+        return {
+            "queued": sum(method["queued"] for method in methods.values()),
+            "in_flight": sum(method["in_flight"] for method in methods.values()),
+            "methods": methods,
+        }
+
+def rows_in(result) -> int:
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple):
+        return sum(rows_in(part) for part in result)
+    if isinstance(result, (dict, sqlite3.Row)):
+        return 1
+    return 0
+
+class QueryStats:
+    """Latency histograms, row counts and errors per `_*_sync` method, plus a slow query log.
+
+    `call()` wraps one method call on a database thread. Rows are the rows
+    the method returned plus the rows its statements changed. While a call
+    runs, the statements it executes are collected through the connections'
+    trace callback. If the call is slower than `slow_query_ms`, they are
+    printed and kept with their EXPLAIN QUERY PLAN.
+    """
+    _IGNORED_STATEMENTS = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA", "EXPLAIN")
+
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS, slow_log_size: int = SLOW_QUERY_LOG_SIZE):
+        self.slow_query_ms = slow_query_ms
+        self.pools = []
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._local = threading.local()
+
+    def trace(self, pool: ConnectionPool, sql: str):
+        statements = getattr(self._local, "statements", None)
+        if statements is not None and not sql.lstrip().upper().startswith(self._IGNORED_STATEMENTS):
+            statements.append((pool, sql))
+
+    def _total_changes(self) -> int:
+        return sum(con.total_changes for con in (pool.current() for pool in self.pools) if con is not None)
+
+    def call(self, name: str, func, args, kwargs):
+        self._local.statements = [] if self.slow_query_ms > 0 else None
+        changes_before = self._total_changes()
+        result = None
+        failed = True
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            statements, self._local.statements = self._local.statements, None
+            rows = rows_in(result) + self._total_changes() - changes_before
+            self._record(name, elapsed, rows, failed)
+            if statements is not None and elapsed * 1000 >= self.slow_query_ms:
+                self._log_slow(name, elapsed, statements)
+
+    def _record(self, name: str, elapsed: float, rows: int, failed: bool):
+        elapsed_ms = elapsed * 1000
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound), len(LATENCY_BUCKETS_MS))
+        with self._lock:
+            method = self._methods.get(name)
+            if method is None:
+                method = self._methods[name] = {
+                    "calls": 0, "errors": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+            method["calls"] += 1
+            method["errors"] += failed
+            method["rows"] += rows
+            method["total_ms"] += elapsed_ms
+            method["max_ms"] = max(method["max_ms"], elapsed_ms)
+            method["histogram"][bucket] += 1
+
+    def _log_slow(self, name: str, elapsed: float, statements: list):
+        entry = {"method": name, "ms": round(elapsed * 1000, 2), "at": time.time(), "statements": []}
+        for pool, sql in statements[:5]:
+            con = pool.current()
+            try:
+                plan = [row[3] for row in con.execute(f"EXPLAIN QUERY PLAN {sql}")]
+            except sqlite3.Error as e:
+                plan = [f"(no plan: {e})"]
+            entry["statements"].append({"database": pool.path, "sql": sql, "plan": plan})
+        entry["omitted_statements"] = max(0, len(statements) - 5)
+        self.slow_queries.append(entry)
+        print(f"Slow database call {name} took {entry['ms']:.1f} ms")
+        for statement in entry["statements"]:
+            print(f"  [{statement['database']}] {statement['sql']}")
+            for line in statement["plan"]:
+                print(f"    {line}")
+
+    @staticmethod
+    def _percentile(histogram: list, calls: int, fraction: float):
+        """Upper bound (ms) of the bucket holding the given fraction of calls; None past the last bucket."""
+        seen = 0
+        for i, count in enumerate(histogram):
+            seen += count
+            if seen >= calls * fraction:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else None
+        return None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            methods = {}
+            for name, method in self._methods.items():
+                calls = method["calls"]
+                methods[name] = {
+                    "calls": calls, "errors": method["errors"], "rows": method["rows"],
+                    "total_ms": method["total_ms"], "avg_ms": method["total_ms"] / calls if calls else 0.0,
+                    "max_ms": method["max_ms"],
+                    "p50_ms": self._percentile(method["histogram"], calls, 0.5),
+                    "p95_ms": self._percentile(method["histogram"], calls, 0.95),
+                    "histogram": dict(zip([f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"], method["histogram"])),
+                }
+        return {"slow_query_ms": self.slow_query_ms, "methods": methods, "slow_queries": list(self.slow_queries)}
+
+class RetryPolicy:
+    """Retries calls that fail with SQLITE_BUSY or SQLITE_LOCKED, backing off with jitter.
+
+    Only "database is busy/locked" errors are retried; anything else is raised
+    at once. Counts retries, calls that succeeded after retrying (recovered)
+    and calls that ran out of attempts (give_ups) per method.
+    """
+    def __init__(self, max_attempts: int = DB_RETRY_ATTEMPTS, base_delay: float = DB_RETRY_BASE_DELAY,
+                 max_delay: float = DB_RETRY_MAX_DELAY):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    @staticmethod
+    def is_busy(error: Exception) -> bool:
+        if not isinstance(error, sqlite3.OperationalError):
+            return False
+        code = getattr(error, "sqlite_errorcode", None)
+        if code is not None:
+            return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+        message = str(error).lower()
+        return "locked" in message or "busy" in message
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def count(self, name: str, counter: str):
+        with self._lock:
+            method = self._methods.setdefault(name, {"retries": 0, "recovered": 0, "give_ups": 0})
+            method[counter] += 1
+
+    def should_retry(self, name: str, error: Exception, attempt: int) -> bool:
+        """Counts the failure and says whether another attempt is allowed; `attempt` starts at 0."""
+        if not self.is_busy(error):
+            return False
+        if attempt + 1 >= self.max_attempts:
+            self.count(name, "give_ups")
+            print(f"Database call {name} gave up after {self.max_attempts} attempts: {error}")
+            return False
+        self.count(name, "retries")
+        return True
+
+    def run(self, name: str, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self.should_retry(name, e, attempt):
+                    raise
+                time.sleep(self.delay(attempt))
+                attempt += 1
+                continue
+            if attempt:
+                self.count(name, "recovered")
+            return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: dict(method) for name, method in self._methods.items()}
+
+class BatchRolledBack(Exception):
+    """A job ended the writer's batch transaction instead of just its own savepoint."""
+    def __init__(self, index: int, error: Exception):
+        super().__init__(f"job {index} rolled back its batch: {error}")
+        self.index = index
+        self.error = error
+
+class GroupCommitWriter:
+    """A single writer thread that commits queued writes in batched transactions.
+
+    Every job is a regular `_*_sync` method. The writer opens one transaction on
+    its own pooled connection and runs each job inside it; because the pool hands
+    out one connection per thread, the job's own `transaction()` becomes a
+    savepoint, so a failing job only rolls back itself. Futures are resolved
+    after the batch commits, so awaiting a write means it has committed (and,
+    under the durable profile, reached the disk).
+
+    `attach` maps schema names to other database pools. Jobs queued with
+    `submit_attached()` run in batches of their own with those files ATTACHed,
+    so they can write to them in the same transaction; every other batch only
+    locks the writer's own file. Because of WAL, a cross-file commit is atomic
+    but only durable per file: a crash during COMMIT can keep one file's half
+    and lose the other's.
+    """
+    _STOP = object()
+    _ATTACHED_PRAGMAS = ("synchronous", "cache_size", "mmap_size") # The per-schema ones
+
+    def __init__(self, pool: ConnectionPool, max_batch_size: int = WRITE_BATCH_SIZE, max_latency: float = WRITE_MAX_LATENCY,
+                 query_stats: QueryStats = None, retry: RetryPolicy = None, attach: dict = None):
+        self.pool = pool
+        self.attach = attach or {}
+        self.query_stats = query_stats
+        self.retry = retry or RetryPolicy()
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._closed = False
+        self._batches = 0
+        self._writes = 0
+        self._largest_batch = 0
+        # Batches committed so far. Readers take commit_lock to pin a snapshot
+        # together with this count; see DatabaseManager._economy_snapshot().
+        self.commits = 0
+        self.commit_lock = threading.Lock()
+        self._on_commit = []
+        self.metrics = JobMetrics()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def _enqueue(self, func, args, kwargs, attached: bool) -> concurrent.futures.Future:
+        if self._closed:
+            raise RuntimeError("The database writer has been stopped.")
+        future = concurrent.futures.Future()
+        self.metrics.queued(job_name(func))
+        self._queue.put((future, func, args, kwargs, time.perf_counter(), attached))
+        return future
+
+    def submit(self, func, *args, **kwargs) -> concurrent.futures.Future:
+        return self._enqueue(func, args, kwargs, False)
+
+    def submit_attached(self, func, *args, **kwargs) -> concurrent.futures.Future:
+        """Like submit(), but the job runs with the `attach` databases attached."""
+        return self._enqueue(func, args, kwargs, True)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is self._STOP:
+                return
+            batch = [job]
+            stopping = False
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is self._STOP:
+                    stopping = True
+                    break
+                batch.append(job)
+            # Consecutive jobs that need the attached files are committed apart from the rest, in queue order.
+            for attached, jobs in itertools.groupby(batch, key=lambda job: job[-1]):
+                self._commit_batch([job[:-1] for job in jobs], attached)
+            if stopping:
+                return
+
+    def on_commit(self, callback):
+        """Called from a job: runs callback(commit number) once its batch commits, before any future resolves."""
+        self._on_commit.append(callback)
+
+    def _run_job(self, name, func, args, kwargs):
+        if self.query_stats is not None:
+            return self.query_stats.call(name, func, args, kwargs)
+        return func(*args, **kwargs)
+
+    def _attach(self, con: sqlite3.Connection):
+        # ATTACH and DETACH are not allowed inside a transaction, so this wraps BEGIN ... COMMIT.
+        for schema, pool in self.attach.items():
+            con.execute(f"ATTACH DATABASE ? AS {schema}", (pool.path,))
+            for pragma in self._ATTACHED_PRAGMAS:
+                con.execute(f"PRAGMA {schema}.{pragma} = {PRAGMA_PROFILES[pool.profile][pragma]}")
+
+    def _detach(self, con: sqlite3.Connection):
+        for schema in self.attach:
+            if con.execute("SELECT 1 FROM pragma_database_list WHERE name = ?", (schema,)).fetchone():
+                con.execute(f"DETACH DATABASE {schema}")
+
+    def _run_batch(self, jobs, attached: bool = False):
+        """Runs every job inside one IMMEDIATE transaction and returns their outcomes."""
+        outcomes = []
+        self._on_commit = []
+        locked = False
+        with self.pool.connection() as con:
+            if attached:
+                self._attach(con)
+            try:
+                with transaction(con, "IMMEDIATE"):
+                    for future, name, func, args, kwargs in jobs:
+                        started = time.perf_counter()
+                        callbacks = len(self._on_commit)
+                        try:
+                            # A busy error inside a job only rolls back that job's savepoint.
+                            result, error = self.retry.run(name, self._run_job, name, func, args, kwargs), None
+                        except Exception as e:
+                            result, error = None, e
+                            del self._on_commit[callbacks:] # Rolled back, so nothing to report
+                        if not con.in_transaction:
+                            # Every job before this one was rolled back with it.
+                            raise BatchRolledBack(len(outcomes), error or sqlite3.OperationalError("job ended the batch transaction"))
+                        outcomes.append((future, name, result, error, time.perf_counter() - started))
+                    # Held across COMMIT (on leaving the block) until the count is bumped.
+                    self.commit_lock.acquire()
+                    locked = True
+                self.commits += 1
+                for callback in self._on_commit:
+                    callback(self.commits)
+            finally:
+                if locked:
+                    self.commit_lock.release()
+                if attached:
+                    self._detach(con)
+        return outcomes
+
+    def _commit_batch(self, batch, attached: bool = False):
+        jobs = []
+        for future, func, args, kwargs, queued_at in batch:
+            name = job_name(func)
+            if not future.set_running_or_notify_cancel():
+                self.metrics.dropped(name)
+                continue
+            self.metrics.started(name, time.perf_counter() - queued_at)
+            jobs.append((future, name, func, args, kwargs))
+        attempt = 0
+        while True:
+            try:
+                outcomes = self._run_batch(jobs, attached)
+                break
+            except BatchRolledBack as e:
+                # Fail the job that caused it and run the others again in a fresh transaction.
+                future, name, *_ = jobs.pop(e.index)
+                self.metrics.finished(name, 0.0)
+                future.set_exception(e.error)
+                if not jobs:
+                    return
+            except Exception as e:
+                # BEGIN IMMEDIATE or COMMIT failed, so nothing in this batch was written.
+                # A busy database gets the whole batch retried; anything else fails it.
+                if jobs and all(self.retry.should_retry(name, e, attempt) for _, name, *_ in jobs):
+                    time.sleep(self.retry.delay(attempt))
+                    attempt += 1
+                    continue
+                for future, name, *_ in jobs:
+                    self.metrics.finished(name, 0.0)
+                    future.set_exception(e)
+                return
+        if attempt:
+            for _, name, *_ in jobs:
+                self.retry.count(name, "recovered")
+        self._batches += 1
+        self._writes += len(outcomes)
+        self._largest_batch = max(self._largest_batch, len(outcomes))
+        for future, name, result, error, seconds in outcomes:
+            self.metrics.finished(name, seconds)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def get_stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "batches": self._batches,
+            "writes": self._writes,
+            "avg_batch_size": (self._writes / self._batches) if self._batches else 0.0,
+            "largest_batch": self._largest_batch,
+        }
+
+    def stop(self):
+        """Commits whatever is still queued and stops the thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+class RewardBuffer:
+    """Holds chat rewards in memory until they are flushed to economy.db.
+
+    The balance is kept as a delta. XP, level and the claim timestamps are
+    absolute values the caller derived from the merged view, so the newest one
+    wins.
+
+    Deltas handed to a write (a flush, or a balance write that claims them)
+    stay visible until no read can still be missing them. Each one is tagged
+    with the writer commit that applied it, and each read with the commits its
+    snapshot includes (see DatabaseManager._economy_snapshot). merge() adds a
+    delta only if the read's snapshot did not already contain it. Committed
+    deltas are pruned once every read in flight started after their commit.
+    """
+    ABSOLUTE_FIELDS = ("xp", "level", "last_coin_claim", "last_xp_claim")
+
+    def __init__(self):
+        self._pending = {}
+        self._flushes = [] # [entries, committed_at] per flush, oldest first
+        self._claimed = {} # (user_id, guild_id) -> [[delta, committed_at], ...] handed to balance writes
+        self._reads = {} # Commit count when a read in flight was queued -> number of such reads
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, user_id: int, guild_id: int, balance: int = 0, **fields):
+        entry = self._pending.setdefault((user_id, guild_id), {"balance": 0})
+        entry["balance"] += balance
+        entry.update(fields)
+
+    def begin_read(self, commits: int) -> int:
+        self._reads[commits] = self._reads.get(commits, 0) + 1
+        return commits
+
+    def end_read(self, commits: int):
+        self._reads[commits] -= 1
+        if not self._reads[commits]:
+            del self._reads[commits]
+        self.prune()
+
+    def prune(self):
+        """Drops committed deltas that every read in flight already sees in its snapshot."""
+        oldest = min(self._reads, default=None)
+
+        def settled(record):
+            return record[1] is not None and (oldest is None or record[1] <= oldest)
+
+        self._flushes = [record for record in self._flushes if not settled(record)]
+        for key in [key for key, records in self._claimed.items() if any(settled(record) for record in records)]:
+            records = [record for record in self._claimed[key] if not settled(record)]
+            if records:
+                self._claimed[key] = records
+            else:
+                del self._claimed[key]
+
+    def merge(self, row: dict, seen: int) -> dict:
+        """Adds the buffered rewards to a row read from a snapshot that includes `seen` commits."""
+        key = (row["user_id"], row["guild_id"])
+        entries = [entries.get(key) for entries, committed_at in self._flushes if committed_at is None or committed_at > seen]
+        for entry in (*entries, self._pending.get(key)):
+            if entry:
+                row["balance"] += entry["balance"]
+                row.update({field: entry[field] for field in self.ABSOLUTE_FIELDS if field in entry})
+        for delta, committed_at in self._claimed.get(key, ()):
+            if committed_at is None or committed_at > seen:
+                row["balance"] += delta
+        if "total_xp" in row:
+            row["total_xp"] = total_xp(row["level"], row["xp"])
+        return row
+
+    def claim_balance(self, user_id: int, guild_id: int) -> list:
+        """Hands the pending balance delta to a write that will apply it itself.
+
+        Returns the [delta, committed_at] record the write marks on commit, or
+        None when there is nothing to claim.
+        """
+        key = (user_id, guild_id)
+        entry = self._pending.get(key)
+        if not entry or not entry["balance"]:
+            return None
+        record = [entry["balance"], None]
+        entry["balance"] = 0
+        self._claimed.setdefault(key, []).append(record)
+        return record
+
+    def unclaim(self, user_id: int, guild_id: int, record: list):
+        """The claiming write failed: puts its delta back in the buffer."""
+        records = self._claimed.get((user_id, guild_id), [])
+        if record in records:
+            records.remove(record)
+            if not records:
+                del self._claimed[(user_id, guild_id)]
+        self.add(user_id, guild_id, record[0])
+
+    def discard(self, user_id: int, guild_id: int, fields):
+        """Forgets buffered values that an explicit write is about to replace."""
+        key = (user_id, guild_id)
+        for entry in (*(entries.get(key) for entries, _ in self._flushes), self._pending.get(key)):
+            if entry:
+                for field in fields:
+                    if field == "balance":
+                        entry["balance"] = 0
+                    else:
+                        entry.pop(field, None)
+
+    def drop(self, user_id: int, guild_id: int):
+        self._pending.pop((user_id, guild_id), None)
+        for entries, _ in self._flushes:
+            entries.pop((user_id, guild_id), None)
+
+    def take(self):
+        """Moves everything pending into a new flush; returns its upsert rows and its record."""
+        record = [self._pending, None]
+        self._flushes.append(record)
+        self._pending = {}
+        rows = [
+            {"user_id": user_id, "guild_id": guild_id, "balance": entry["balance"],
+             **{field: entry.get(field) for field in self.ABSOLUTE_FIELDS}}
+            for (user_id, guild_id), entry in record[0].items()
+        ]
+        return rows, record
+
+    def restore(self, record: list):
+        """Puts a failed flush back in front of anything buffered since."""
+        self._flushes.remove(record)
+        for (user_id, guild_id), entry in record[0].items():
+            newer = self._pending.pop((user_id, guild_id), None)
+            if newer:
+                entry["balance"] += newer.pop("balance")
+                entry.update(newer)
+            self._pending[(user_id, guild_id)] = entry
+
+class TxResult:
+    """The result of one unit-of-work step, readable through `.value` once the unit has run.
+
+    Indexing it (`item["creator_id"]`) gives a result for that field, which
+    later steps in the same unit can take as an argument.
+    """
+    _UNSET = object()
+
+    def __init__(self, source: "TxResult" = None, key=None):
+        self._value = self._UNSET
+        self._source = source
+        self._key = key
+
+    @property
+    def value(self):
+        if self._source is not None:
+            return self._source.value[self._key]
+        if self._value is self._UNSET:
+            raise RuntimeError("This step has not run; the unit of work failed or stopped before it.")
+        return self._value
+
+    def __getitem__(self, key):
+        return TxResult(self, key)
+
+class UnitOfWorkAborted(Exception):
+    """Raised inside a unit of work when a required step came back empty."""
+
+class UnitOfWork:
+    """Steps queued inside `async with db.transaction() as tx:`, run together on exit.
+
+    Nothing touches the database while the block runs. On exit all the steps go
+    to the writer as one job and run in order in one transaction, with shop.db
+    attached. If a step marked `required` returns None, the unit stops there and
+    nothing it did is kept; `committed` tells which way it went.
+    """
+    def __init__(self, db: "DatabaseManager"):
+        self.db = db
+        self.steps = []
+        self.committed = False
+
+    def _step(self, func, args, required: bool, user=None) -> TxResult:
+        result = TxResult()
+        self.steps.append((result, func, args, required, user))
+        return result
+
+    def get_item_details(self, item_id: int, guild_id: int, required: bool = False) -> TxResult:
+        return self._step(self.db._item_details, (item_id, guild_id, "shop"), required)
+
+    def increment_purchase_count(self, item_id: int, guild_id: int) -> TxResult:
+        return self._step(self.db._increment_purchase_count, (item_id, guild_id, "shop"), False)
+
+    def add_balance(self, user_id: int, guild_id: int, delta: int, clamp: bool = False, reason: str = "adjust", ref: str = None,
+                    required: bool = False) -> TxResult:
+        return self._step(self.db._add_balance, (user_id, guild_id, delta, clamp, reason, ref), required, (user_id, guild_id))
+
+    def debit_if_sufficient(self, user_id: int, guild_id: int, amount: int, credit: int = 0, reason: str = "bet", ref: str = None,
+                            required: bool = False) -> TxResult:
+        return self._step(self.db._debit_if_sufficient, (user_id, guild_id, amount, credit, reason, ref), required, (user_id, guild_id))
+
+    def run(self, con: sqlite3.Connection):
+        """Runs the steps on `con`; called on the writer thread."""
+        for result, func, args, required, user in self.steps:
+            args = [arg.value if isinstance(arg, TxResult) else arg for arg in args]
+            result._value = func(con, *args)
+            if required and result._value is None:
+                raise UnitOfWorkAborted()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None and self.steps:
+            self.committed = await self.db._run_unit_of_work(self)
+        return False
 
 class DatabaseManager:
-    def __init__(self, bot: commands.Bot):
+    def __init__(self, bot: commands.Bot, write_batch_size: int = WRITE_BATCH_SIZE, write_max_latency: float = WRITE_MAX_LATENCY,
+                 reward_flush_interval: float = REWARD_FLUSH_INTERVAL, economy_profile: str = None, shop_profile: str = None):
         self.bot = bot
         self.economy_db_path = "economy.db"
         self.shop_db_path = "shop.db"
         self._init_sync()
+        self.query_stats = QueryStats()
+        # Statements are only traced when there is a slow query log to feed.
+        trace_callback = self.query_stats.trace if self.query_stats.slow_query_ms > 0 else None
+        self._economy_pool = ConnectionPool(
+            self.economy_db_path, economy_profile or pragma_profile("ECONOMY_DB_PROFILE"), trace_callback=trace_callback
+        )
+        self._shop_pool = ConnectionPool(
+            self.shop_db_path, shop_profile or pragma_profile("SHOP_DB_PROFILE"), trace_callback=trace_callback
+        )
+        self.query_stats.pools = [self._economy_pool, self._shop_pool]
+        print(f"Database profiles: {self.economy_db_path}={self._economy_pool.profile}, {self.shop_db_path}={self._shop_pool.profile}")
+        self.retry = RetryPolicy()
+        # shop.db is attached to the writer's connection for cross-file units of work only.
+        self._writer = GroupCommitWriter(
+            self._economy_pool, write_batch_size, write_max_latency, self.query_stats, self.retry, attach={"shop": self._shop_pool}
+        )
+        # Reads get their own threads rather than the loop's default executor.
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix="db-reader")
+        self._read_slots = asyncio.Semaphore(DB_MAX_PENDING_READS)
+        self._read_metrics = JobMetrics()
+        # shop.db writes are serialised on a thread of their own; the group-commit writer only owns economy.db.
+        self._shop_writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-shop-writer")
+        self._write_slots = asyncio.Semaphore(DB_MAX_PENDING_WRITES)
+        self._shop_write_metrics = JobMetrics()
+        # Used for users that have no row yet.
+        with self._economy_pool.connection() as con:
+            self._user_defaults = column_defaults(con, "users")
+        # table_info leaves out generated columns, but SELECT * returns them.
+        self._user_defaults["total_xp"] = total_xp(self._user_defaults["level"], self._user_defaults["xp"])
+        with self._shop_pool.connection() as con:
+            self._shop_has_fts = has_items_search_index(con)
+        self._rewards = RewardBuffer()
+        self.reward_flush_interval = reward_flush_interval
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+        self._maintenance_task = None
+        self._last_optimize = {}
+        self._maintenance_calls = (time.monotonic(), 0)
+        self.maintenance_log = deque(maxlen=100)
 
-    def _run_sync(self, func, *args, **kwargs):
-        partial_func = functools.partial(func, *args, **kwargs)
-        return self.bot.loop.run_in_executor(None, partial_func)
+    async def _run_in_executor(self, executor, slots: asyncio.Semaphore, metrics: JobMetrics, func, args, kwargs):
+        name = job_name(func)
+        queued_at = time.perf_counter()
+        metrics.queued(name)
+        try:
+            await slots.acquire()
+        except BaseException:
+            metrics.dropped(name)
+            raise
 
-    def _init_sync(self):
-        with sqlite3.connect(self.economy_db_path) as con:
-            cur = con.cursor()
-            cur.execute("PRAGMA journal_mode=WAL")
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL,
-                    balance INTEGER DEFAULT 0, xp INTEGER DEFAULT 0, level INTEGER DEFAULT 1,
-                    last_daily TEXT, daily_streak INTEGER DEFAULT 0,
-                    last_coin_claim REAL DEFAULT 0, last_xp_claim REAL DEFAULT 0,
-                    daily_spam_count INTEGER DEFAULT 0,
-                    daily_stream_coins INTEGER DEFAULT 0,
-                    PRIMARY KEY (user_id, guild_id)
-                )
-            """)
-            # --- NEW: Add column for bump command cooldown ---
+        def job():
+            started = time.perf_counter()
+            metrics.started(name, started - queued_at)
             try:
-                cur.execute("ALTER TABLE users ADD COLUMN last_bump_timestamp REAL DEFAULT 0")
-            except sqlite3.OperationalError:
-                pass # Column already exists
-        print(f"Economy database initialized successfully at: {self.economy_db_path}")
+                # Latency is recorded across retries, as the caller experiences it.
+                return self.query_stats.call(name, self.retry.run, (name, func, *args), kwargs)
+            finally:
+                metrics.finished(name, time.perf_counter() - started)
 
-        with sqlite3.connect(self.shop_db_path) as con:
-            cur = con.cursor()
-            cur.execute("PRAGMA journal_mode=WAL")
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS items (
-                    item_id INTEGER PRIMARY KEY AUTOINCREMENT, creator_id INTEGER NOT NULL,
-                    guild_id INTEGER NOT NULL, item_name TEXT NOT NULL, application TEXT NOT NULL,
-                    category TEXT NOT NULL, price INTEGER NOT NULL, product_link TEXT NOT NULL,
-                    screenshot_link TEXT, screenshot_link_2 TEXT, screenshot_link_3 TEXT
-                )
-            """)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, job)
+        finally:
+            slots.release()
+
+    async def _run_sync(self, func, *args, **kwargs):
+        """Runs a `_*_sync` read on the reader pool, waiting for a free read slot first."""
+        return await self._run_in_executor(self._executor, self._read_slots, self._read_metrics, func, args, kwargs)
+
+    async def _run_shop_write(self, func, *args, **kwargs):
+        """Runs a `_*_sync` shop.db write on the shop writer thread, waiting for a free write slot first."""
+        return await self._run_in_executor(self._shop_writer, self._write_slots, self._shop_write_metrics, func, args, kwargs)
+
+    def _queue_write(self, func, args, attached: bool = False) -> asyncio.Future:
+        """Hands an economy.db write to the group-commit writer; the caller holds a write slot.
+
+        The slot is freed once the write resolves. With attached=True, shop.db
+        is attached as `shop` for the write's batch only.
+        """
+        try:
+            submit = self._writer.submit_attached if attached else self._writer.submit
+            future = asyncio.wrap_future(submit(func, *args))
+        except BaseException:
+            self._write_slots.release()
+            raise
+        future.add_done_callback(lambda _: self._write_slots.release())
+        return future
+
+    async def _run_write(self, func, *args):
+        """Queues an economy.db write on the group-commit writer thread and waits for it to commit."""
+        await self._write_slots.acquire()
+        return await self._queue_write(func, args)
+
+    def get_pool_stats(self) -> dict:
+        return {"economy": self._economy_pool.get_stats(), "shop": self._shop_pool.get_stats()}
+
+    def get_writer_stats(self) -> dict:
+        return self._writer.get_stats()
+
+    def get_executor_stats(self) -> dict:
+        """Live queue depth and per-method wait/exec times for the reader pool and the writer."""
+        reads = self._read_metrics.snapshot()
+        reads.update(workers=DB_READ_WORKERS, max_pending=DB_MAX_PENDING_READS)
+        writes = self._writer.metrics.snapshot()
+        writes.update(max_pending=DB_MAX_PENDING_WRITES)
+        return {"reads": reads, "writes": writes, "shop_writes": self._shop_write_metrics.snapshot()}
+
+    def get_query_stats(self) -> dict:
+        return self.query_stats.snapshot()
+
+    def get_all_stats(self) -> dict:
+        """Everything the DB layer measures, for /dbstats and its dump file."""
+        return {
+            "queries": self.get_query_stats(), "executor": self.get_executor_stats(),
+            "writer": self.get_writer_stats(), "pools": self.get_pool_stats(),
+            "maintenance": list(self.maintenance_log), "retries": self.retry.snapshot(),
+        }
+
+    async def start(self):
+        """Starts the background tasks. Called from the bot's setup_hook."""
+        # Games don't survive a restart, so bets they still held go back to the players.
+        refunded = await self.refund_open_stakes()
+        if refunded:
+            print(f"Refunded {refunded} bets left open by unfinished games.")
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_rewards_loop())
+        if self._maintenance_task is None:
+            self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+
+    async def close(self):
+        for task in (self._flush_task, self._maintenance_task):
+            if task is not None:
+                task.cancel()
+                # Let it unwind (and release the flush lock) before the final flush.
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+        self._flush_task = None
+        self._maintenance_task = None
+        await self.flush_rewards()
+        await asyncio.get_running_loop().run_in_executor(None, self._writer.stop)
+        self._executor.shutdown(wait=True)
+        self._shop_writer.shutdown(wait=True)
+        self._economy_pool.close_all()
+        self._shop_pool.close_all()
+
+    def _init_sync(self):
+        for path, migrations in ((self.economy_db_path, ECONOMY_MIGRATIONS), (self.shop_db_path, SHOP_MIGRATIONS)):
+            started = time.perf_counter()
+            con = sqlite3.connect(path, isolation_level=None)
             try:
-                cur.execute("ALTER TABLE items ADD COLUMN purchase_count INTEGER DEFAULT 0")
-                cur.execute("ALTER TABLE items ADD COLUMN upload_timestamp REAL DEFAULT 0")
-                cur.execute("ALTER TABLE items ADD COLUMN is_featured INTEGER DEFAULT 0")
-            except sqlite3.OperationalError:
-                pass
-        print(f"Shop database initialized successfully at: {self.shop_db_path}")
+                # Only takes effect on a new file; existing ones need enable_incremental_vacuum() once.
+                con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                con.execute("PRAGMA journal_mode=WAL")
+                applied = migrate(con, migrations)
+                if path == self.shop_db_path:
+                    ensure_items_search_index(con)
+                version = con.execute("PRAGMA user_version").fetchone()[0]
+                incremental = con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+            finally:
+                con.close()
+            for migration_version, description, seconds in applied:
+                print(f"  {path}: applied migration {migration_version} ({description}) in {seconds * 1000:.1f} ms")
+            print(f"Database {path} initialized at schema version {version} in {(time.perf_counter() - started) * 1000:.1f} ms")
+            if not incremental:
+                print(f"  {path}: incremental vacuum is off; run /dbvacuum once at a quiet time to enable it")
 
     # ... (get_user_data, update_user_data, delete_user_data, etc. are mostly unchanged)
+    def _default_user(self, user_id: int, guild_id: int) -> dict:
+        return {**self._user_defaults, "user_id": user_id, "guild_id": guild_id}
+
+    @contextlib.contextmanager
+    def _economy_snapshot(self):
+        """A read transaction on economy.db, with the number of writer commits it includes."""
+        with self._economy_pool.connection() as con, transaction(con):
+            with self._writer.commit_lock:
+                # The first read pins the WAL snapshot; no batch can commit in between.
+                con.execute("SELECT 1 FROM users LIMIT 1").fetchall()
+                seen = self._writer.commits
+            yield con, seen
+
+    async def _read_buffered(self, func, *args):
+        """Runs a users read that returns (rows, seen) and merges the buffered rewards into it."""
+        commits = self._rewards.begin_read(self._writer.commits)
+        try:
+            result, seen = await self._run_sync(func, *args)
+            if isinstance(result, list):
+                return [self._rewards.merge(row, seen) for row in result]
+            return self._rewards.merge(result, seen)
+        finally:
+            self._rewards.end_read(commits)
+
     def _get_user_data_sync(self, user_id: int, guild_id: int):
-        with sqlite3.connect(self.economy_db_path) as con:
-            con.row_factory = sqlite3.Row
+        with self._economy_snapshot() as (con, seen):
             cur = con.cursor()
             cur.execute("SELECT * FROM users WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
             user_data = cur.fetchone()
-            if not user_data:
-                cur.execute("INSERT INTO users (user_id, guild_id) VALUES (?, ?)", (user_id, guild_id))
-                con.commit()
-                cur.execute("SELECT * FROM users WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
-                user_data = cur.fetchone()
-            return dict(user_data)
+            # Unknown users get a default record; their row is only created on the first real write.
+            return (dict(user_data) if user_data else self._default_user(user_id, guild_id)), seen
 
     async def get_user_data(self, user_id: int, guild_id: int):
-        return await self._run_sync(self._get_user_data_sync, user_id, guild_id)
+        return await self._read_buffered(self._get_user_data_sync, user_id, guild_id)
+
+    def _update_user_data(self, con: sqlite3.Connection, user_id: int, guild_id: int, data: dict):
+        cur = con.cursor()
+        if "balance" in data:
+            # An absolute balance still goes into the ledger, as the difference it makes.
+            old = cur.execute("SELECT balance FROM users WHERE user_id = ? AND guild_id = ?", (user_id, guild_id)).fetchone()
+            old_balance = old["balance"] if old else self._user_defaults["balance"]
+            record_ledger(con, [(guild_id, user_id, data["balance"] - old_balance, "set", None)])
+        # Upsert, since reads no longer create the row.
+        columns = ", ".join(data.keys())
+        placeholders = ", ".join("?" for _ in data)
+        set_clause = ", ".join([f"{key} = excluded.{key}" for key in data.keys()])
+        query = f"INSERT INTO users (user_id, guild_id, {columns}) VALUES (?, ?, {placeholders}) ON CONFLICT (user_id, guild_id) DO UPDATE SET {set_clause}"
+        cur.execute(query, (user_id, guild_id, *data.values()))
 
     def _update_user_data_sync(self, user_id: int, guild_id: int, data: dict):
-        with sqlite3.connect(self.economy_db_path) as con:
-            cur = con.cursor()
-            set_clause = ", ".join([f"{key} = ?" for key in data.keys()])
-            values = list(data.values()) + [user_id, guild_id]
-            query = f"UPDATE users SET {set_clause} WHERE user_id = ? AND guild_id = ?"
-            cur.execute(query, tuple(values))
-            con.commit()
+        with self._economy_pool.connection() as con, transaction(con):
+            self._update_user_data(con, user_id, guild_id, data)
 
     async def update_user_data(self, user_id: int, guild_id: int, data: dict):
-        await self._run_sync(self._update_user_data_sync, user_id, guild_id, data)
+        self._rewards.discard(user_id, guild_id, data.keys())
+        await self._run_write(self._update_user_data_sync, user_id, guild_id, data)
+
+    def _update_user_data_if_sync(self, user_id: int, guild_id: int, expected: dict, data: dict, credit: int, reason: str, claims: dict):
+        with self._economy_pool.connection() as con, transaction(con):
+            self._apply_claimed_balances(con, claims)
+            row = con.execute("SELECT * FROM users WHERE user_id = ? AND guild_id = ?", (user_id, guild_id)).fetchone()
+            current = dict(row) if row else self._default_user(user_id, guild_id)
+            if any(current[field] != value for field, value in expected.items()):
+                return None
+            self._update_user_data(con, user_id, guild_id, data)
+            if credit:
+                return self._add_balance(con, user_id, guild_id, credit, reason=reason)
+            return current["balance"]
+
+    async def update_user_data_if(self, user_id: int, guild_id: int, expected: dict, data: dict, credit: int = 0, reason: str = "adjust"):
+        """Writes `data` and credits `credit` in one transaction, but only if the
+        stored fields still equal `expected` (the values the caller read).
+
+        Turns read-check-write claims (/daily, stream rewards) into one guarded
+        write, so two racing claims can't both pay. Returns the new balance, or
+        None if the guard failed and nothing changed.
+        """
+        self._rewards.discard(user_id, guild_id, data.keys())
+        return await self._run_balance_write(
+            [(user_id, guild_id)], self._update_user_data_if_sync, user_id, guild_id, expected, data, credit, reason
+        )
 
     def _delete_user_data_sync(self, user_id: int, guild_id: int):
-        with sqlite3.connect(self.economy_db_path) as con:
+        with self._economy_pool.connection() as con, transaction(con):
             cur = con.cursor()
-            cur.execute("DELETE FROM users WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
-            con.commit()
+            deleted = cur.execute("DELETE FROM users WHERE user_id = ? AND guild_id = ? RETURNING balance", (user_id, guild_id)).fetchone()
+            if deleted:
+                # The user is back to the default balance, and the ledger has to agree.
+                record_ledger(con, [(guild_id, user_id, self._user_defaults["balance"] - deleted["balance"], "reset", None)])
 
     async def delete_user_data(self, user_id: int, guild_id: int):
-        await self._run_sync(self._delete_user_data_sync, user_id, guild_id)
+        self._rewards.drop(user_id, guild_id)
+        await self._run_write(self._delete_user_data_sync, user_id, guild_id)
+
+    # --- Atomic balance changes ---
+    # These run as single statements on the writer thread instead of the
+    # read-then-write pattern, so concurrent changes can't overwrite each other.
+    # Any buffered chat coins for the users involved are folded into the same write.
+    # Every change is appended to the ledger in the same transaction, with a
+    # reason and an optional ref (the item, the other user, the admin...).
+    async def _run_balance_write(self, users: list, func, *args, attached: bool = False):
+        # Claimed only once a write slot is free, so a cancelled wait leaves the buffer alone.
+        await self._write_slots.acquire()
+        claims = {user: self._rewards.claim_balance(*user) for user in users}
+        claims = {user: record for user, record in claims.items() if record is not None}
+        future = self._queue_write(func, (*args, claims), attached)
+
+        def settle(done):
+            if not done.cancelled() and done.exception() is None:
+                self._rewards.prune()
+                return
+            for (user_id, guild_id), record in claims.items():
+                self._rewards.unclaim(user_id, guild_id, record)
+
+        future.add_done_callback(settle)
+        # Shielded: once queued, the write commits even if the caller is cancelled.
+        return await asyncio.shield(future)
+
+    def _mark_committed(self, records: list):
+        """Tags RewardBuffer records with the commit that applies them, on the writer thread."""
+        def mark(commit):
+            for record in records:
+                record[1] = commit
+        self._writer.on_commit(mark)
+
+    def _apply_claimed_balances(self, con: sqlite3.Connection, claims: dict):
+        """Applies claimed chat coins; `claims` maps (user_id, guild_id) to RewardBuffer claim records."""
+        for (user_id, guild_id), record in claims.items():
+            self._add_balance(con, user_id, guild_id, record[0], reason="chat")
+        if claims:
+            self._mark_committed(list(claims.values()))
+
+    def _add_balance(self, con: sqlite3.Connection, user_id: int, guild_id: int, delta: int, clamp: bool = False,
+                     reason: str = "adjust", ref: str = None) -> int:
+        if clamp:
+            # The clamp can shrink the change, so the ledger needs the balance before it.
+            old = con.execute("SELECT balance FROM users WHERE user_id = ? AND guild_id = ?", (user_id, guild_id)).fetchone()
+            old_balance = old["balance"] if old else self._user_defaults["balance"]
+            query = """
+                INSERT INTO users (user_id, guild_id, balance) VALUES (?, ?, MAX(?, 0))
+                ON CONFLICT (user_id, guild_id) DO UPDATE SET balance = MAX(balance + ?, 0)
+                RETURNING balance
+            """
+        else:
+            query = """
+                INSERT INTO users (user_id, guild_id, balance) VALUES (?, ?, ?)
+                ON CONFLICT (user_id, guild_id) DO UPDATE SET balance = balance + ?
+                RETURNING balance
+            """
+        balance = con.execute(query, (user_id, guild_id, delta, delta)).fetchone()["balance"]
+        record_ledger(con, [(guild_id, user_id, balance - old_balance if clamp else delta, reason, ref)])
+        return balance
+
+    def _debit_if_sufficient(self, con: sqlite3.Connection, user_id: int, guild_id: int, amount: int, credit: int = 0,
+                             reason: str = "bet", ref: str = None):
+        row = con.execute(
+            "UPDATE users SET balance = balance - ? + ? WHERE user_id = ? AND guild_id = ? AND balance >= ? RETURNING balance",
+            (amount, credit, user_id, guild_id, amount)
+        ).fetchone()
+        if row:
+            record_ledger(con, [(guild_id, user_id, credit - amount, reason, ref)])
+            return row["balance"]
+        # A user without a row has the default balance, which may still cover a free purchase.
+        if amount <= self._user_defaults["balance"]:
+            exists = con.execute("SELECT 1 FROM users WHERE user_id = ? AND guild_id = ?", (user_id, guild_id)).fetchone()
+            if not exists:
+                return self._add_balance(con, user_id, guild_id, credit - amount, reason=reason, ref=ref)
+        return None
+
+    def _add_balance_sync(self, user_id: int, guild_id: int, delta: int, clamp: bool, reason: str, ref: str, claims: dict):
+        with self._economy_pool.connection() as con, transaction(con):
+            self._apply_claimed_balances(con, claims)
+            return self._add_balance(con, user_id, guild_id, delta, clamp, reason, ref)
+
+    async def add_balance(self, user_id: int, guild_id: int, delta: int, clamp: bool = False, reason: str = "adjust", ref: str = None) -> int:
+        """Adds `delta` (which may be negative) and returns the new balance.
+
+        With clamp=True the balance never drops below zero.
+        """
+        return await self._run_balance_write(
+            [(user_id, guild_id)], self._add_balance_sync, user_id, guild_id, delta, clamp, reason, ref
+        )
+
+    def _debit_if_sufficient_sync(self, user_id: int, guild_id: int, amount: int, credit: int, reason: str, ref: str, claims: dict):
+        with self._economy_pool.connection() as con, transaction(con):
+            self._apply_claimed_balances(con, claims)
+            return self._debit_if_sufficient(con, user_id, guild_id, amount, credit, reason, ref)
+
+    async def debit_if_sufficient(self, user_id: int, guild_id: int, amount: int, credit: int = 0, reason: str = "bet", ref: str = None):
+        """Takes `amount` only if the user can afford it, in a single UPDATE.
+
+        `credit` is paid out in the same statement, which lets games settle a
+        bet and its winnings at once. Returns the new balance, or None if the
+        balance was too low (in which case nothing changes).
+        """
+        return await self._run_balance_write(
+            [(user_id, guild_id)], self._debit_if_sufficient_sync, user_id, guild_id, amount, credit, reason, ref
+        )
+
+    def _transfer_sync(self, from_user_id: int, to_user_id: int, guild_id: int, amount: int, claims: dict):
+        with self._economy_pool.connection() as con, transaction(con):
+            self._apply_claimed_balances(con, claims)
+            sender_balance = self._debit_if_sufficient(con, from_user_id, guild_id, amount, reason="transfer", ref=f"user:{to_user_id}")
+            if sender_balance is None:
+                return None
+            return sender_balance, self._add_balance(con, to_user_id, guild_id, amount, reason="transfer", ref=f"user:{from_user_id}")
+
+    async def transfer(self, from_user_id: int, to_user_id: int, guild_id: int, amount: int):
+        """Moves coins between two users in one transaction.
+
+        Returns (sender_balance, recipient_balance), or None if the sender
+        couldn't afford it.
+        """
+        users = [(from_user_id, guild_id), (to_user_id, guild_id)]
+        return await self._run_balance_write(users, self._transfer_sync, from_user_id, to_user_id, guild_id, amount)
+
+    # --- Open stakes ---
+    # A game that runs across several interactions (blackjack) takes the bet up
+    # front and keeps a row in open_stakes until it settles. The row commits with
+    # the debit, so a restart mid-game can refund exactly the bets it left open.
+    def _open_stake_sync(self, user_id: int, guild_id: int, amount: int, game: str, stake_id: str, claims: dict):
+        with self._economy_pool.connection() as con, transaction(con):
+            self._apply_claimed_balances(con, claims)
+            balance = self._debit_if_sufficient(con, user_id, guild_id, amount, reason=game, ref=stake_id)
+            if balance is not None:
+                con.execute(
+                    "INSERT INTO open_stakes (stake_id, guild_id, user_id, amount, game, ts) VALUES (?, ?, ?, ?, ?, ?)",
+                    (stake_id, guild_id, user_id, amount, game, time.time())
+                )
+            return balance
+
+    async def open_stake(self, user_id: int, guild_id: int, amount: int, game: str, stake_id: str):
+        """Debits a bet and records it as open under `stake_id`.
+
+        Returns the new balance, or None if the user can't afford it.
+        """
+        return await self._run_balance_write(
+            [(user_id, guild_id)], self._open_stake_sync, user_id, guild_id, amount, game, stake_id
+        )
+
+    def _settle_stake_sync(self, stake_id: str, user_id: int, guild_id: int, payout: int, reason: str, claims: dict):
+        with self._economy_pool.connection() as con, transaction(con):
+            self._apply_claimed_balances(con, claims)
+            if con.execute("DELETE FROM open_stakes WHERE stake_id = ? RETURNING 1", (stake_id,)).fetchone() is None:
+                return None
+            if payout:
+                return self._add_balance(con, user_id, guild_id, payout, reason=reason, ref=stake_id)
+            row = con.execute("SELECT balance FROM users WHERE user_id = ? AND guild_id = ?", (user_id, guild_id)).fetchone()
+            return row["balance"] if row else self._user_defaults["balance"]
+
+    async def settle_stake(self, stake_id: str, user_id: int, guild_id: int, payout: int = 0, reason: str = "bet"):
+        """Closes an open stake and pays `payout` (0 for a loss) in one transaction.
+
+        Returns the new balance, or None if the stake was already settled, in
+        which case nothing is paid.
+        """
+        return await self._run_balance_write(
+            [(user_id, guild_id)], self._settle_stake_sync, stake_id, user_id, guild_id, payout, reason
+        )
+
+    def _refund_open_stakes_sync(self, claims: dict) -> int:
+        with self._economy_pool.connection() as con, transaction(con):
+            self._apply_claimed_balances(con, claims)
+            stakes = con.execute("DELETE FROM open_stakes RETURNING stake_id, guild_id, user_id, amount, game").fetchall()
+            for stake in stakes:
+                self._add_balance(con, stake["user_id"], stake["guild_id"], stake["amount"], reason=f"{stake['game']} refund", ref=stake["stake_id"])
+            return len(stakes)
+
+    async def refund_open_stakes(self) -> int:
+        """Refunds every open stake; only safe before any game can be running. Returns how many."""
+        return await self._run_balance_write([], self._refund_open_stakes_sync)
+
+    # --- Units of work ---
+    def transaction(self) -> UnitOfWork:
+        """Queues several operations to run in one writer job and one transaction.
+
+            async with bot.db.transaction() as tx:
+                item = tx.get_item_details(item_id, guild_id, required=True)
+                tx.add_balance(item["creator_id"], guild_id, 10)
+
+        Results are read from the returned TxResults after the block.
+        """
+        return UnitOfWork(self)
+
+    def _transaction_sync(self, unit: UnitOfWork, claims: dict) -> bool:
+        with self._economy_pool.connection() as con, transaction(con):
+            # Claimed chat coins are kept even if the unit itself is rolled back.
+            self._apply_claimed_balances(con, claims)
+            try:
+                with transaction(con):
+                    unit.run(con)
+            except UnitOfWorkAborted:
+                return False
+            return True
+
+    async def _run_unit_of_work(self, unit: UnitOfWork) -> bool:
+        # Users only known once an earlier step has run (an item's creator) can't
+        # be claimed up front; their buffered coins simply flush later.
+        users = list(dict.fromkeys(
+            user for *_, user in unit.steps
+            if user is not None and not any(isinstance(part, TxResult) for part in user)
+        ))
+        return await self._run_balance_write(users, self._transaction_sync, unit, attached=True)
+
+    # --- Write-behind chat rewards ---
+    def queue_chat_reward(self, user_id: int, guild_id: int, balance: int = 0, **fields):
+        """Buffers a chat reward; `balance` is a delta, other fields are new values."""
+        self._rewards.add(user_id, guild_id, balance, **fields)
+
+    def _flush_rewards_sync(self, rows: list, record: list):
+        with self._economy_pool.connection() as con, transaction(con):
+            con.executemany("""
+                INSERT INTO users (user_id, guild_id, balance, xp, level, last_coin_claim, last_xp_claim)
+                VALUES (:user_id, :guild_id, :balance, COALESCE(:xp, 0), COALESCE(:level, 1),
+                        COALESCE(:last_coin_claim, 0), COALESCE(:last_xp_claim, 0))
+                ON CONFLICT (user_id, guild_id) DO UPDATE SET
+                    balance = balance + excluded.balance,
+                    xp = COALESCE(:xp, xp),
+                    level = COALESCE(:level, level),
+                    last_coin_claim = COALESCE(:last_coin_claim, last_coin_claim),
+                    last_xp_claim = COALESCE(:last_xp_claim, last_xp_claim)
+            """, rows)
+            record_ledger(con, ((row["guild_id"], row["user_id"], row["balance"], "chat", None) for row in rows))
+            self._mark_committed([record])
+
+    async def flush_rewards(self):
+        async with self._flush_lock:
+            if not len(self._rewards):
+                return
+            # Taken only once a write slot is free, so a cancelled wait loses nothing.
+            await self._write_slots.acquire()
+            if not len(self._rewards):
+                self._write_slots.release()
+                return
+            rows, record = self._rewards.take()
+            future = self._queue_write(self._flush_rewards_sync, (rows, record))
+
+            def settle(done):
+                error = asyncio.CancelledError() if done.cancelled() else done.exception()
+                if error is None:
+                    self._rewards.prune()
+                    return
+                self._rewards.restore(record)
+                print(f"Failed to flush {len(rows)} buffered chat rewards: {error!r}")
+
+            future.add_done_callback(settle)
+            # Shielded: cancelling the flush loop (e.g. in close()) must not drop queued rows.
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass # settle() has put the rewards back and reported it
+
+    # --- Ledger ---
+    def _get_ledger_sync(self, user_id: int, guild_id: int, limit: int, offset: int):
+        with self._economy_pool.connection() as con:
+            cur = con.cursor()
+            cur.execute(
+                "SELECT * FROM ledger WHERE guild_id = ? AND user_id = ? ORDER BY ts DESC, entry_id DESC LIMIT ? OFFSET ?",
+                (guild_id, user_id, limit, offset)
+            )
+            return [dict(row) for row in cur.fetchall()]
+
+    async def get_ledger(self, user_id: int, guild_id: int, limit: int = 10, offset: int = 0):
+        """A user's balance changes, newest first."""
+        return await self._run_sync(self._get_ledger_sync, user_id, guild_id, limit, offset)
+
+    def _rebuild_balances_sync(self, guild_id, apply: bool):
+        default = self._user_defaults["balance"]
+        guild_filter = "WHERE ledger.guild_id = ?" if guild_id is not None else ""
+        params = (default, guild_id) if guild_id is not None else (default,)
+        with self._economy_pool.connection() as con, transaction(con):
+            # One pass over the ledger in (guild_id, user_id) index order, summing as it goes.
+            drift = [dict(row) for row in con.execute(f"""
+                SELECT ledger.guild_id, ledger.user_id, users.balance AS snapshot, ? + SUM(ledger.delta) AS rebuilt
+                FROM ledger JOIN users ON users.user_id = ledger.user_id AND users.guild_id = ledger.guild_id
+                {guild_filter}
+                GROUP BY ledger.guild_id, ledger.user_id
+                HAVING snapshot != rebuilt
+            """, params)]
+            # Users with no ledger entries at all should be at the default.
+            drift += [dict(row) for row in con.execute(f"""
+                SELECT guild_id, user_id, balance AS snapshot, ? AS rebuilt FROM users
+                WHERE balance != ? {"AND guild_id = ?" if guild_id is not None else ""}
+                AND NOT EXISTS (SELECT 1 FROM ledger WHERE ledger.guild_id = users.guild_id AND ledger.user_id = users.user_id)
+            """, (default, *params))]
+            if apply:
+                con.executemany(
+                    "UPDATE users SET balance = :rebuilt WHERE user_id = :user_id AND guild_id = :guild_id", drift
+                )
+            return drift
+
+    async def rebuild_balances(self, guild_id: int = None, apply: bool = True):
+        """Recomputes users.balance from the ledger, for one guild or all of them.
+
+        Returns the users whose stored balance disagreed, as {"guild_id",
+        "user_id", "snapshot", "rebuilt"}. With apply=False nothing is changed.
+        """
+        # Buffered chat coins are not in either yet; flush them so both sides agree.
+        await self.flush_rewards()
+        return await self._run_write(self._rebuild_balances_sync, guild_id, apply)
+
+    # --- Maintenance ---
+    # Runs on the bot loop; every step executes on a reader thread with its own
+    # connection, never inside the writer's batch transaction.
+    def _checkpoint_sync(self, pool: ConnectionPool, mode: str):
+        with pool.connection() as con:
+            busy, log_frames, checkpointed = con.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        return f"{mode} checkpoint, {checkpointed}/{log_frames} frames" + (" (blocked by readers)" if busy else "")
+
+    def _optimize_sync(self, pool: ConnectionPool):
+        with pool.connection() as con:
+            if con.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+                con.execute("PRAGMA optimize")
+                return "PRAGMA optimize"
+            con.execute("ANALYZE")
+            return "ANALYZE (no statistics yet)"
+
+    def _vacuum_sync(self, pool: ConnectionPool):
+        with pool.connection() as con:
+            if con.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                # Switching needs a full VACUUM, which is left to enable_incremental_vacuum().
+                return None
+            free_pages = con.execute("PRAGMA freelist_count").fetchone()[0]
+            if free_pages < VACUUM_MIN_FREE_PAGES:
+                return None
+            con.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP})").fetchall()
+            return f"incremental vacuum, released {min(free_pages, VACUUM_PAGES_PER_STEP)} of {free_pages} free pages"
+
+    def _enable_incremental_vacuum_sync(self, pool: ConnectionPool):
+        with pool.connection() as con:
+            if con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return None
+            size_before = os.path.getsize(pool.path)
+            con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            con.execute("VACUUM")
+        return f"full VACUUM to enable auto_vacuum=INCREMENTAL, {size_before:,} -> {os.path.getsize(pool.path):,} bytes"
+
+    def _maintenance_step_sync(self, step, pool: ConnectionPool, *args):
+        started = time.perf_counter()
+        detail = step(pool, *args)
+        return detail, time.perf_counter() - started
+
+    def _recent_calls_per_minute(self) -> float:
+        executor = self.get_executor_stats()
+        calls = sum(method["calls"] for side in ("reads", "writes", "shop_writes") for method in executor[side]["methods"].values())
+        now = time.monotonic()
+        since, previous_calls = self._maintenance_calls
+        self._maintenance_calls = (now, calls)
+        return (calls - previous_calls) / max(now - since, 1e-6) * 60
+
+    async def run_maintenance(self):
+        """Checkpoints large WALs, refreshes planner statistics and, when traffic is low, runs an incremental vacuum.
+
+        Returns the steps that ran as {"database", "step", "ms"} entries.
+        """
+        calls_per_minute = self._recent_calls_per_minute()
+        steps = []
+        for pool in (self._economy_pool, self._shop_pool):
+            try:
+                wal_bytes = os.path.getsize(f"{pool.path}-wal")
+            except OSError:
+                wal_bytes = 0
+            if wal_bytes >= WAL_TRUNCATE_BYTES:
+                steps.append((pool, self._checkpoint_sync, ("TRUNCATE",)))
+            elif wal_bytes >= WAL_CHECKPOINT_BYTES:
+                steps.append((pool, self._checkpoint_sync, ("PASSIVE",)))
+            if time.monotonic() - self._last_optimize.get(pool.path, float("-inf")) >= OPTIMIZE_INTERVAL:
+                self._last_optimize[pool.path] = time.monotonic()
+                steps.append((pool, self._optimize_sync, ()))
+            if calls_per_minute < LOW_TRAFFIC_CALLS_PER_MINUTE:
+                steps.append((pool, self._vacuum_sync, ()))
+
+        return await self._run_maintenance_steps(steps)
+
+    async def enable_incremental_vacuum(self):
+        """Converts database files created without auto_vacuum=INCREMENTAL with one full VACUUM each.
+
+        The VACUUM rewrites the whole file and holds the write lock until it is
+        done, so this is never run by background maintenance; /dbvacuum runs it.
+        Files that are already converted are skipped. Returns the report like
+        run_maintenance().
+        """
+        return await self._run_maintenance_steps(
+            [(pool, self._enable_incremental_vacuum_sync, ()) for pool in (self._economy_pool, self._shop_pool)]
+        )
+
+    async def _run_maintenance_steps(self, steps: list):
+        report = []
+        for pool, step, args in steps:
+            detail, seconds = await self._run_sync(self._maintenance_step_sync, step, pool, *args)
+            if detail is None:
+                continue
+            entry = {"database": pool.path, "step": detail, "ms": round(seconds * 1000, 2), "at": time.time()}
+            self.maintenance_log.append(entry)
+            report.append(entry)
+            print(f"DB maintenance {pool.path}: {detail} in {entry['ms']:.1f} ms")
+        return report
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(MAINTENANCE_INTERVAL)
+            try:
+                await self.run_maintenance()
+            except Exception as e:
+                print(f"Database maintenance failed: {e}")
+
+    async def _flush_rewards_loop(self):
+        while True:
+            await asyncio.sleep(self.reward_flush_interval)
+            await self.flush_rewards()
 
     def _add_item_to_shop_sync(self, creator_id, guild_id, item_name, application, category, price, product_link, screenshot_link, screenshot_link_2, screenshot_link_3):
-        with sqlite3.connect(self.shop_db_path) as con:
+        with self._shop_pool.connection() as con, transaction(con):
             cur = con.cursor()
             upload_timestamp = time.time()
             cur.execute("INSERT INTO items (creator_id, guild_id, item_name, application, category, price, product_link, screenshot_link, screenshot_link_2, screenshot_link_3, upload_timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",(creator_id, guild_id, item_name, application, category, price, product_link, screenshot_link, screenshot_link_2, screenshot_link_3, upload_timestamp))
-            con.commit()
 
     async def add_item_to_shop(self, creator_id, guild_id, item_name, application, category, price, product_link, screenshot_link, screenshot_link_2, screenshot_link_3):
-        await self._run_sync(self._add_item_to_shop_sync, creator_id, guild_id, item_name, application, category, price, product_link, screenshot_link, screenshot_link_2, screenshot_link_3)
+        await self._run_shop_write(self._add_item_to_shop_sync, creator_id, guild_id, item_name, application, category, price, product_link, screenshot_link, screenshot_link_2, screenshot_link_3)
 
     # --- NEW: Function to get all items a specific user has created ---
     def _get_items_by_creator_sync(self, creator_id: int, guild_id: int):
-        with sqlite3.connect(self.shop_db_path) as con:
-            con.row_factory = sqlite3.Row
+        with self._shop_pool.connection() as con:
             cur = con.cursor()
             cur.execute("SELECT * FROM items WHERE creator_id = ? AND guild_id = ? ORDER BY upload_timestamp DESC", (creator_id, guild_id))
             return [dict(row) for row in cur.fetchall()]
@@ -117,89 +1821,120 @@ class DatabaseManager:
 
     # --- NEW: Function to update an item's timestamp to now ---
     def _bump_item_sync(self, item_id: int):
-        with sqlite3.connect(self.shop_db_path) as con:
+        with self._shop_pool.connection() as con, transaction(con):
             cur = con.cursor()
             new_timestamp = time.time()
             cur.execute("UPDATE items SET upload_timestamp = ? WHERE item_id = ?", (new_timestamp, item_id))
-            con.commit()
 
     async def bump_item(self, item_id: int):
-        await self._run_sync(self._bump_item_sync, item_id)
+        await self._run_shop_write(self._bump_item_sync, item_id)
         
     # ... (rest of the file is unchanged)
+    def _increment_purchase_count(self, con: sqlite3.Connection, item_id: int, guild_id: int, schema: str = "main"):
+        con.execute(f"UPDATE {schema}.items SET purchase_count = purchase_count + 1 WHERE item_id = ? AND guild_id = ?", (item_id, guild_id))
+
     def _increment_purchase_count_sync(self, item_id: int, guild_id: int):
-        with sqlite3.connect(self.shop_db_path) as con:
-            cur = con.cursor()
-            cur.execute("UPDATE items SET purchase_count = purchase_count + 1 WHERE item_id = ? AND guild_id = ?", (item_id, guild_id))
-            con.commit()
+        with self._shop_pool.connection() as con, transaction(con):
+            self._increment_purchase_count(con, item_id, guild_id)
 
     async def increment_purchase_count(self, item_id: int, guild_id: int):
-        await self._run_sync(self._increment_purchase_count_sync, item_id, guild_id)
+        await self._run_shop_write(self._increment_purchase_count_sync, item_id, guild_id)
         
+    def _item_details(self, con: sqlite3.Connection, item_id, guild_id, schema: str = "main"):
+        item = con.execute(f"SELECT * FROM {schema}.items WHERE item_id = ? AND guild_id = ?", (item_id, guild_id)).fetchone()
+        return dict(item) if item else None
+
     def _get_item_details_sync(self, item_id, guild_id):
-        with sqlite3.connect(self.shop_db_path) as con:
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            cur.execute("SELECT * FROM items WHERE item_id = ? AND guild_id = ?", (item_id, guild_id))
-            item = cur.fetchone()
-            return dict(item) if item else None
+        with self._shop_pool.connection() as con:
+            return self._item_details(con, item_id, guild_id)
 
     async def get_item_details(self, item_id, guild_id):
         return await self._run_sync(self._get_item_details_sync, item_id, guild_id)
 
     def _delete_item_sync(self, item_id, guild_id):
-        with sqlite3.connect(self.shop_db_path) as con:
+        with self._shop_pool.connection() as con, transaction(con):
             cur = con.cursor()
             cur.execute("DELETE FROM items WHERE item_id = ? AND guild_id = ?", (item_id, guild_id))
-            con.commit()
 
     async def delete_item(self, item_id, guild_id):
-        await self._run_sync(self._delete_item_sync, item_id, guild_id)
+        await self._run_shop_write(self._delete_item_sync, item_id, guild_id)
 
     def _get_all_users_in_guild_sync(self, guild_id: int):
-        with sqlite3.connect(self.economy_db_path) as con:
-            con.row_factory = sqlite3.Row
+        with self._economy_snapshot() as (con, seen):
             cur = con.cursor()
             cur.execute("SELECT * FROM users WHERE guild_id = ?", (guild_id,))
-            return [dict(row) for row in cur.fetchall()]
+            return [dict(row) for row in cur.fetchall()], seen
 
     async def get_all_users_in_guild(self, guild_id: int):
-        return await self._run_sync(self._get_all_users_in_guild_sync, guild_id)
+        return await self._read_buffered(self._get_all_users_in_guild_sync, guild_id)
         
-    def _get_shop_items_sync(self, guild_id, order_by, limit=None):
-        with sqlite3.connect(self.shop_db_path) as con:
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            if order_by not in ["purchase_count", "upload_timestamp", "item_name"]: order_by = "upload_timestamp"
-            order_direction = "ASC" if order_by == "item_name" else "DESC"
-            query = f"SELECT * FROM items WHERE guild_id = ? ORDER BY {order_by} {order_direction}"
-            params = [guild_id]
-            if limit:
-                query += " LIMIT ?"
-                params.append(limit)
-            cur.execute(query, tuple(params))
-            return [dict(row) for row in cur.fetchall()]
+    def _get_items_page_sync(self, guild_id, order, after_key, limit):
+        column, direction = ITEM_PAGE_ORDERS[order]
+        comparison = "<" if direction == "DESC" else ">"
+        query = f"SELECT item_id, item_name, price, {column} FROM items WHERE guild_id = ?"
+        params = [guild_id]
+        if after_key is not None:
+            query += f" AND ({column}, item_id) {comparison} (?, ?)"
+            params.extend(after_key)
+        query += f" ORDER BY {column} {direction}, item_id {direction} LIMIT ?"
+        params.append(limit)
+        with self._shop_pool.connection() as con:
+            rows = [dict(row) for row in con.execute(query, params).fetchall()]
+        next_key = (rows[-1][column], rows[-1]["item_id"]) if len(rows) == limit else None
+        return rows, next_key
 
-    async def get_new_arrivals(self, guild_id, limit=5):
-        return await self._run_sync(self._get_shop_items_sync, guild_id, "upload_timestamp", limit)
-    
-    async def get_all_items(self, guild_id):
-        return await self._run_sync(self._get_shop_items_sync, guild_id, "item_name")
+    async def get_items_page(self, guild_id, order="new", after_key=None, limit=25):
+        """Returns one page of lightweight item rows and the key to fetch the next one.
 
-    def _get_leaderboard_sync(self, guild_id: int, limit: int = 10):
-        with sqlite3.connect(self.economy_db_path) as con:
-            con.row_factory = sqlite3.Row
+        `order` is one of ITEM_PAGE_ORDERS. Pass the returned key back as
+        `after_key` to continue; it is None once the last page was reached.
+
+        The cursor is the item's current sort value. "popular" (purchase_count,
+        bumped by every purchase) and "new" (upload_timestamp, reset by
+        /bumpitem) can change while someone pages, so an item that moves across
+        the cursor between two page loads is skipped or shown twice. "name" is
+        stable.
+        """
+        return await self._run_sync(self._get_items_page_sync, guild_id, order, after_key, limit)
+
+    def _count_items_sync(self, guild_id):
+        with self._shop_pool.connection() as con:
+            return con.execute("SELECT COUNT(*) FROM items WHERE guild_id = ?", (guild_id,)).fetchone()[0]
+
+    async def count_items(self, guild_id):
+        return await self._run_sync(self._count_items_sync, guild_id)
+
+    def _get_leaderboard_sync(self, guild_id: int, limit: int = 10, offset: int = 0):
+        with self._economy_pool.connection() as con:
             cur = con.cursor()
-            query = "SELECT user_id, level, xp, balance FROM users WHERE guild_id = ? ORDER BY level DESC, xp DESC LIMIT ?"
-            cur.execute(query, (guild_id, limit))
+            query = "SELECT user_id, level, xp, balance, total_xp FROM users WHERE guild_id = ? ORDER BY total_xp DESC, user_id DESC LIMIT ? OFFSET ?"
+            cur.execute(query, (guild_id, limit, offset))
             return [dict(row) for row in cur.fetchall()]
 
-    async def get_leaderboard(self, guild_id: int, limit: int = 10):
-        return await self._run_sync(self._get_leaderboard_sync, guild_id, limit)
+    async def get_leaderboard(self, guild_id: int, limit: int = 10, offset: int = 0):
+        return await self._run_sync(self._get_leaderboard_sync, guild_id, limit, offset)
+
+    def _count_users_above_sync(self, guild_id: int, total_xp: int):
+        with self._economy_pool.connection() as con:
+            # A range count on idx_users_guild_total_xp; it never touches the table.
+            cur = con.execute("SELECT COUNT(*) FROM users WHERE guild_id = ? AND total_xp > ?", (guild_id, total_xp))
+            return cur.fetchone()[0]
+
+    def _count_ranked_users_sync(self, guild_id: int):
+        with self._economy_pool.connection() as con:
+            return con.execute("SELECT COUNT(*) FROM users WHERE guild_id = ?", (guild_id,)).fetchone()[0]
+
+    async def count_ranked_users(self, guild_id: int):
+        return await self._run_sync(self._count_ranked_users_sync, guild_id)
+
+    async def get_user_rank(self, user_id: int, guild_id: int):
+        """Returns (rank, player) for a user. Users with equal total XP share a rank."""
+        player = await self.get_user_data(user_id, guild_id)
+        above = await self._run_sync(self._count_users_above_sync, guild_id, player["total_xp"])
+        return above + 1, player
 
     def _get_featured_item_sync(self, guild_id):
-        with sqlite3.connect(self.shop_db_path) as con:
-            con.row_factory = sqlite3.Row
+        with self._shop_pool.connection() as con:
             cur = con.cursor()
             cur.execute("SELECT * FROM items WHERE guild_id = ? AND is_featured = 1 LIMIT 1", (guild_id,))
             item = cur.fetchone()
@@ -209,22 +1944,77 @@ class DatabaseManager:
         return await self._run_sync(self._get_featured_item_sync, guild_id)
 
     def _set_featured_item_sync(self, item_id, guild_id):
-        with sqlite3.connect(self.shop_db_path) as con:
+        with self._shop_pool.connection() as con, transaction(con):
             cur = con.cursor()
             cur.execute("UPDATE items SET is_featured = 0 WHERE guild_id = ?", (guild_id,))
             cur.execute("UPDATE items SET is_featured = 1 WHERE item_id = ? AND guild_id = ?", (item_id, guild_id))
-            con.commit()
             
     async def set_featured_item(self, item_id, guild_id):
-        await self._run_sync(self._set_featured_item_sync, item_id, guild_id)
+        await self._run_shop_write(self._set_featured_item_sync, item_id, guild_id)
 
-    def _search_items_sync(self, guild_id, query):
-        with sqlite3.connect(self.shop_db_path) as con:
-            con.row_factory = sqlite3.Row
+    def _search_items_sync(self, guild_id, query, limit):
+        with self._shop_pool.connection() as con:
             cur = con.cursor()
-            cur.execute("SELECT item_id, item_name, price FROM items WHERE guild_id = ? AND item_name LIKE ?", (guild_id, f'%{query}%'))
+            match = fts_prefix_query(query)
+            if self._shop_has_fts and match:
+                # The guild is part of the MATCH, so other guilds' items are never ranked.
+                # bm25 weights name matches above application/category and ignores guild_id.
+                cur.execute("""
+                    SELECT items.item_id, items.item_name, items.price FROM items_fts
+                    JOIN items ON items.item_id = items_fts.rowid
+                    WHERE items_fts MATCH ?
+                    ORDER BY bm25(items_fts, 10.0, 2.0, 2.0, 0.0) LIMIT ?
+                """, (f'guild_id : "{int(guild_id)}" AND {{item_name application category}} : ({match})', limit))
+            else:
+                cur.execute("SELECT item_id, item_name, price FROM items WHERE guild_id = ? AND item_name LIKE ? LIMIT ?", (guild_id, f'%{query}%', limit))
             return [dict(row) for row in cur.fetchall()]
 
-    async def search_items(self, guild_id, query):
-        return await self._run_sync(self._search_items_sync, guild_id, query)
+    async def search_items(self, guild_id, query, limit=25):
+        """Searches item names, applications and categories; every word matches as a prefix."""
+        return await self._run_sync(self._search_items_sync, guild_id, query, limit)
+
+    # --- Guild settings ---
+    # Reads are synchronous on purpose: the settings cache in cogs/channel_config.py
+    # is consulted from plain functions and permission checks, and only reloads
+    # when settings_version says something changed.
+    def _get_settings_version_sync(self) -> int:
+        with self._economy_pool.connection() as con:
+            return con.execute("SELECT version FROM settings_version WHERE id = 0").fetchone()[0]
+
+    async def get_settings_version(self) -> int:
+        return await self._run_sync(self._get_settings_version_sync)
+
+    def _load_guild_settings_sync(self):
+        with self._economy_pool.connection() as con, transaction(con):
+            version = con.execute("SELECT version FROM settings_version WHERE id = 0").fetchone()[0]
+            all_settings = {}
+            for row in con.execute("SELECT guild_id, key, value FROM guild_settings"):
+                all_settings.setdefault(row["guild_id"], {})[row["key"]] = json.loads(row["value"])
+        return version, all_settings
+
+    async def load_guild_settings(self):
+        """Returns (version, {guild_id: {key: value}}) for every guild, read in one snapshot."""
+        return await self._run_sync(self._load_guild_settings_sync)
+
+    def _write_guild_settings_sync(self, changes: list):
+        """Applies (guild_id, key, value) changes, where a value of None deletes the key."""
+        with self._economy_pool.connection() as con, transaction(con):
+            previous_version = con.execute("SELECT version FROM settings_version WHERE id = 0").fetchone()[0]
+            for guild_id, key, value in changes:
+                if value is None:
+                    con.execute("DELETE FROM guild_settings WHERE guild_id = ? AND key = ?", (guild_id, key))
+                else:
+                    con.execute(
+                        "INSERT INTO guild_settings (guild_id, key, value) VALUES (?, ?, ?) "
+                        "ON CONFLICT (guild_id, key) DO UPDATE SET value = excluded.value",
+                        (guild_id, key, json.dumps(value))
+                    )
+            return previous_version, con.execute("SELECT version FROM settings_version WHERE id = 0").fetchone()[0]
+
+    async def write_guild_settings(self, changes: list):
+        """Writes only the given keys.
 
+        Returns (version before, version after) the write, which tells the
+        cache whether anything else changed in between.
+        """
+        return await self._run_write(self._write_guild_settings_sync, changes)
@@ -0,0 +1,35 @@
+# tests/conftest.py
+#
+# Run from the repository root:  python -m pytest tests
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+@pytest.fixture
+def run():
+    """Runs a coroutine to completion; every call in a test shares one event loop."""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+@pytest.fixture
+def db(tmp_path, monkeypatch, run):
+    """A DatabaseManager on fresh economy.db/shop.db files in a temporary directory."""
+    monkeypatch.chdir(tmp_path)
+    manager = database.DatabaseManager(None)
+    yield manager
+    run(manager.close())
+
+@pytest.fixture
+def add_item(db, run):
+    """Adds a shop item (to guild 1 unless told otherwise) and returns its item_id."""
+    def add(creator_id=10, price=50, name="Galaxy", application="After Effects", category="Presets", guild_id=1):
+        run(db.add_item_to_shop(creator_id, guild_id, name, application, category, price, "https://example.com", None, None, None))
+        return max(item["item_id"] for item in run(db.get_items_by_creator(creator_id, guild_id)))
+    return add
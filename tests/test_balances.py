@@ -0,0 +1,93 @@
+# tests/test_balances.py
+#
+# Atomic balance changes: increments, conditional debits, transfers, guarded
+# claims and open stakes.
+
+import asyncio
+
+GUILD_ID = 1
+
+def balance(db, run, user_id):
+    return run(db.get_user_data(user_id, GUILD_ID))["balance"]
+
+def test_add_balance_concurrent_changes_all_land(db, run):
+    async def scenario():
+        return await asyncio.gather(*(db.add_balance(1, GUILD_ID, 5, reason="test") for _ in range(50)))
+    results = run(scenario())
+    assert sorted(results) == list(range(5, 255, 5))
+    assert balance(db, run, 1) == 250
+    assert len(run(db.get_ledger(1, GUILD_ID, limit=100))) == 50
+
+def test_add_balance_clamp_records_the_applied_change(db, run):
+    run(db.add_balance(1, GUILD_ID, 30))
+    assert run(db.add_balance(1, GUILD_ID, -100, clamp=True)) == 0
+    assert [entry["delta"] for entry in run(db.get_ledger(1, GUILD_ID))] == [-30, 30]
+
+def test_debit_if_sufficient_never_overdraws(db, run):
+    run(db.add_balance(1, GUILD_ID, 100))
+    async def scenario():
+        return await asyncio.gather(*(db.debit_if_sufficient(1, GUILD_ID, 30) for _ in range(10)))
+    results = run(scenario())
+    assert sorted(r for r in results if r is not None) == [10, 40, 70]
+    assert results.count(None) == 7
+    assert balance(db, run, 1) == 10
+
+def test_debit_if_sufficient_pays_credit_in_the_same_update(db, run):
+    run(db.add_balance(1, GUILD_ID, 100))
+    assert run(db.debit_if_sufficient(1, GUILD_ID, 40, credit=100, reason="slots")) == 160
+    assert run(db.get_ledger(1, GUILD_ID))[0]["delta"] == 60
+
+def test_transfer_moves_coins_atomically(db, run):
+    run(db.add_balance(1, GUILD_ID, 100))
+    assert run(db.transfer(1, 2, GUILD_ID, 150)) is None
+    assert (balance(db, run, 1), balance(db, run, 2)) == (100, 0)
+    assert run(db.get_ledger(2, GUILD_ID)) == []
+
+    assert run(db.transfer(1, 2, GUILD_ID, 60)) == (40, 60)
+    sender, recipient = run(db.get_ledger(1, GUILD_ID))[0], run(db.get_ledger(2, GUILD_ID))[0]
+    assert (sender["delta"], sender["ref"]) == (-60, "user:2")
+    assert (recipient["delta"], recipient["ref"]) == (60, "user:1")
+
+def test_concurrent_transfers_keep_the_total(db, run):
+    run(db.add_balance(1, GUILD_ID, 100))
+    run(db.add_balance(2, GUILD_ID, 100))
+    async def scenario():
+        await asyncio.gather(*(
+            db.transfer(1, 2, GUILD_ID, 15) if i % 2 else db.transfer(2, 1, GUILD_ID, 20) for i in range(40)
+        ))
+    run(scenario())
+    first, second = balance(db, run, 1), balance(db, run, 2)
+    assert first >= 0 and second >= 0
+    assert first + second == 200
+
+def test_guarded_claim_pays_once_when_raced(db, run):
+    data = {"last_daily": "2026-01-02T00:00:00+00:00", "daily_streak": 1}
+    async def scenario():
+        return await asyncio.gather(*(
+            db.update_user_data_if(1, GUILD_ID, {"last_daily": None}, data, credit=50, reason="daily") for _ in range(5)
+        ))
+    results = run(scenario())
+    assert results.count(50) == 1 and results.count(None) == 4
+    user = run(db.get_user_data(1, GUILD_ID))
+    assert (user["balance"], user["daily_streak"]) == (50, 1)
+    assert len(run(db.get_ledger(1, GUILD_ID))) == 1
+
+def test_guarded_claim_changes_nothing_when_the_guard_fails(db, run):
+    run(db.update_user_data(1, GUILD_ID, {"last_daily": "2026-01-02", "daily_stream_coins": 100}))
+    assert run(db.update_user_data_if(1, GUILD_ID, {"last_daily": None}, {"daily_stream_coins": 0}, credit=20)) is None
+    assert run(db.update_user_data_if(1, GUILD_ID, {"daily_stream_coins": 100}, {"daily_stream_coins": 120}, credit=20)) == 20
+    user = run(db.get_user_data(1, GUILD_ID))
+    assert (user["balance"], user["daily_stream_coins"]) == (20, 120)
+
+def test_open_stakes_settle_once_and_refund_on_start(db, run):
+    run(db.add_balance(1, GUILD_ID, 100))
+    assert run(db.open_stake(1, GUILD_ID, 60, "blackjack", "blackjack:1")) == 40
+    assert run(db.open_stake(1, GUILD_ID, 60, "blackjack", "blackjack:2")) is None
+    assert run(db.settle_stake("blackjack:1", 1, GUILD_ID, 120, reason="blackjack")) == 160
+    assert run(db.settle_stake("blackjack:1", 1, GUILD_ID, 120, reason="blackjack")) is None
+
+    assert run(db.open_stake(1, GUILD_ID, 30, "blackjack", "blackjack:3")) == 130
+    assert run(db.refund_open_stakes()) == 1
+    assert balance(db, run, 1) == 160
+    assert run(db.get_ledger(1, GUILD_ID))[0]["reason"] == "blackjack refund"
+    assert run(db.rebuild_balances(apply=False)) == []
@@ -0,0 +1,45 @@
+# tests/test_cooldowns.py
+#
+# The in-memory cooldown gate in front of chat rewards.
+
+from cogs.economy import COIN_COOLDOWN, XP_COOLDOWN, CooldownIndex
+
+GUILD_ID = 1
+NOW = 10000.0
+
+def test_unknown_users_are_never_blocked():
+    assert not CooldownIndex().is_blocked(GUILD_ID, 1, NOW)
+
+def test_blocked_only_while_both_cooldowns_run():
+    index = CooldownIndex()
+    index.record(GUILD_ID, 1, last_coin_claim=NOW, last_xp_claim=NOW, now=NOW)
+    assert index.is_blocked(GUILD_ID, 1, NOW + min(COIN_COOLDOWN, XP_COOLDOWN))
+    # As soon as either reward is available again the message has to reach the database.
+    assert not index.is_blocked(GUILD_ID, 1, NOW + min(COIN_COOLDOWN, XP_COOLDOWN) + 1)
+
+def test_one_running_cooldown_does_not_block():
+    index = CooldownIndex()
+    index.record(GUILD_ID, 1, last_coin_claim=NOW, last_xp_claim=NOW - XP_COOLDOWN - 1, now=NOW)
+    assert not index.is_blocked(GUILD_ID, 1, NOW)
+
+def test_entries_are_per_guild():
+    index = CooldownIndex()
+    index.record(GUILD_ID, 1, NOW, NOW, now=NOW)
+    assert not index.is_blocked(2, 1, NOW)
+
+def test_idle_entries_are_evicted_first():
+    index = CooldownIndex(max_entries=10)
+    index.record(GUILD_ID, 1, NOW, NOW, now=NOW)
+    index.record(GUILD_ID, 2, NOW, NOW, now=NOW)
+    later = NOW + max(COIN_COOLDOWN, XP_COOLDOWN) + 1
+    index.record(GUILD_ID, 3, later, later, now=later)
+    assert len(index) == 1
+    assert index.is_blocked(GUILD_ID, 3, later)
+
+def test_size_is_capped_even_when_everyone_is_active():
+    index = CooldownIndex(max_entries=3)
+    for user_id in range(5):
+        index.record(GUILD_ID, user_id, NOW, NOW, now=NOW)
+    assert len(index) == 3
+    assert not index.is_blocked(GUILD_ID, 0, NOW)
+    assert index.is_blocked(GUILD_ID, 4, NOW)
@@ -0,0 +1,51 @@
+# tests/test_executor.py
+#
+# How database calls are queued: read and write slots, and the metrics they feed.
+
+import asyncio
+
+GUILD_ID = 1
+
+def test_shop_writes_are_not_counted_as_reads(db, run, add_item):
+    item_id = add_item()
+    run(db.bump_item(item_id))
+    run(db.get_item_details(item_id, GUILD_ID))
+    executor = db.get_executor_stats()
+    assert set(executor["shop_writes"]["methods"]) == {"add_item_to_shop", "bump_item"}
+    assert set(executor["reads"]["methods"]) >= {"get_item_details"}
+    assert not set(executor["reads"]["methods"]) & set(executor["shop_writes"]["methods"])
+
+def test_writes_wait_for_a_free_slot(db, run, monkeypatch):
+    async def scenario():
+        slots = asyncio.Semaphore(1)
+        monkeypatch.setattr(db, "_write_slots", slots)
+        await slots.acquire()
+        write = asyncio.ensure_future(db.update_user_data(1, GUILD_ID, {"xp": 5}))
+        await asyncio.sleep(0.05)
+        # Nothing has reached the writer thread's queue yet.
+        waiting = (write.done(), db.get_executor_stats()["writes"]["queued"])
+        slots.release()
+        await write
+        return waiting, slots.locked()
+    waiting, still_held = run(scenario())
+    assert waiting == (False, 0)
+    assert not still_held
+    assert run(db.get_user_data(1, GUILD_ID))["xp"] == 5
+
+def test_a_flush_cancelled_while_waiting_keeps_the_rewards(db, run, monkeypatch):
+    before = run(db.get_user_data(1, GUILD_ID))["balance"]
+    db.queue_chat_reward(1, GUILD_ID, balance=7)
+    async def scenario():
+        slots = asyncio.Semaphore(1)
+        monkeypatch.setattr(db, "_write_slots", slots)
+        await slots.acquire()
+        flush = asyncio.ensure_future(db.flush_rewards())
+        await asyncio.sleep(0.01)
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+        slots.release()
+        await db.flush_rewards()
+    run(scenario())
+    # Written by the second flush, not just still buffered.
+    assert not len(db._rewards)
+    assert run(db.get_user_data(1, GUILD_ID))["balance"] == before + 7
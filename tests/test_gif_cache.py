@@ -0,0 +1,77 @@
+# tests/test_gif_cache.py
+#
+# GifCache against a local aiohttp server standing in for Tenor.
+
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from cogs import channel_config
+from cogs.channel_config import GifCache
+
+@pytest.fixture
+def tenor(run, monkeypatch):
+    """Serves /search; `tenor["results"]` and `tenor["delay"]` control the reply, `tenor["calls"]` counts requests."""
+    state = {"results": ["a", "b"], "delay": 0, "calls": 0}
+
+    async def search(request):
+        state["calls"] += 1
+        await asyncio.sleep(state["delay"])
+        return web.json_response({"results": [{"media_formats": {"gif": {"url": url}}} for url in state["results"]]})
+
+    async def start():
+        app = web.Application()
+        app.router.add_get("/v2/search", search)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        return runner, aiohttp.ClientSession()
+
+    runner, state["session"] = run(start())
+    port = runner.addresses[0][1]
+    monkeypatch.setattr(channel_config, "TENOR_BASE_URL", f"http://127.0.0.1:{port}/v2")
+    monkeypatch.setattr(channel_config, "TENOR_API_KEY", "test-key")
+    yield state
+    run(state["session"].close())
+    run(runner.cleanup())
+
+def test_results_are_cached_per_term(run, tenor):
+    cache = GifCache()
+    assert run(cache.get(tenor["session"], "wave")) in ("a", "b")
+    assert run(cache.get(tenor["session"], "wave")) in ("a", "b")
+    assert tenor["calls"] == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_expired_entry_is_served_while_it_refreshes(run, tenor):
+    cache = GifCache(ttl=0)
+    run(cache.get(tenor["session"], "wave"))
+    tenor["results"] = ["c"]
+
+    async def scenario():
+        stale = await cache.get(tenor["session"], "wave")
+        await asyncio.gather(*cache._refreshing.values())
+        return stale, await cache.get(tenor["session"], "wave")
+    stale, fresh = run(scenario())
+    assert stale in ("a", "b") and fresh == "c"
+
+def test_a_timeout_is_remembered_instead_of_retried(run, tenor):
+    cache = GifCache(timeout=0.2, negative_ttl=60)
+    tenor["delay"] = 1
+    assert run(cache.get(tenor["session"], "wave")) is None
+    started = time.perf_counter()
+    assert run(cache.get(tenor["session"], "wave")) is None
+    assert time.perf_counter() - started < 0.1
+    assert tenor["calls"] == 1 and cache.errors == 1
+
+def test_empty_results_are_remembered_until_the_negative_ttl(run, tenor):
+    cache = GifCache(negative_ttl=0.2)
+    tenor["results"] = []
+    assert run(cache.get(tenor["session"], "nothing")) is None
+    assert run(cache.get(tenor["session"], "nothing")) is None
+    assert tenor["calls"] == 1
+    time.sleep(0.25)
+    tenor["results"] = ["a"]
+    assert run(cache.get(tenor["session"], "nothing")) == "a"
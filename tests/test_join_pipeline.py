@@ -0,0 +1,140 @@
+# tests/test_join_pipeline.py
+#
+# Join roles and welcome messages handed out through JoinPipeline.
+
+import asyncio
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from cogs import channel_config
+from cogs.channel_config import JoinPipeline, SettingsCache
+
+GUILD_ID = 1
+JOIN_ROLE = SimpleNamespace(id=100)
+WELCOME_CHANNEL = SimpleNamespace(id=200)
+
+class FakeMember:
+    def __init__(self, member_id, guild, failures=()):
+        self.id = member_id
+        self.guild = guild
+        self.mention = f"<@{member_id}>"
+        self.roles = []
+        self.failures = list(failures) # exceptions raised by the next add_roles calls
+
+    async def add_roles(self, role, reason=None):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.roles.append(role)
+
+class FakeGuild:
+    def __init__(self):
+        self.id = GUILD_ID
+        self.name = "Test Guild"
+        self.icon = None
+        self.members = {}
+
+    @property
+    def member_count(self):
+        return len(self.members)
+
+    def join(self, member_id, **kwargs):
+        member = self.members[member_id] = FakeMember(member_id, self, **kwargs)
+        return member
+
+    def get_role(self, role_id):
+        return JOIN_ROLE if role_id == JOIN_ROLE.id else None
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+    def get_channel(self, channel_id):
+        return WELCOME_CHANNEL if channel_id == WELCOME_CHANNEL.id else None
+
+class FakeCog:
+    def __init__(self):
+        self.welcomes = [] # description of every welcome embed sent
+
+    async def send_welcome(self, channel, embed):
+        self.welcomes.append(embed.description)
+
+@pytest.fixture
+def guild(db, run, monkeypatch):
+    cache = SettingsCache()
+    run(cache.bind(db))
+    run(cache.apply([(GUILD_ID, "JOIN_ROLE_ID", JOIN_ROLE.id), (GUILD_ID, "WELCOME_CHANNEL_ID", WELCOME_CHANNEL.id)]))
+    monkeypatch.setattr(channel_config, "_settings_cache", cache)
+    monkeypatch.setattr(channel_config, "WELCOME_BATCH_DELAY", 0.05)
+    return FakeGuild()
+
+def test_join_role_is_assigned_and_lag_recorded(run, guild):
+    cog = FakeCog()
+    pipeline = JoinPipeline(cog)
+    async def join():
+        pipeline.submit(guild.join(1))
+        stats = pipeline.stats()
+        await asyncio.sleep(0.1)
+        return stats
+    queued = run(join())
+    assert (queued["role_queue_depth"], queued["pending_welcomes"]) == (1, 1)
+    assert guild.members[1].roles == [JOIN_ROLE]
+    stats = pipeline.stats()
+    assert (stats["role_queue_depth"], stats["pending_welcomes"]) == (0, 0)
+    assert stats["roles_assigned"] == 1 and stats["max_role_lag"] >= 0
+    assert stats["members_welcomed"] == 1 and stats["max_welcome_lag"] >= 0
+
+def test_rate_limited_role_requests_are_retried(run, guild):
+    pipeline = JoinPipeline(FakeCog())
+    member = guild.join(1, failures=[discord.RateLimited(0.01)])
+    async def join():
+        pipeline.submit(member)
+        await asyncio.sleep(0.1)
+    run(join())
+    assert member.roles == [JOIN_ROLE]
+    assert (pipeline.rate_limited, pipeline.roles_assigned, pipeline.role_failures) == (1, 1, 0)
+
+def test_members_who_left_while_queued_are_skipped(run, guild):
+    pipeline = JoinPipeline(FakeCog())
+    async def join_and_leave():
+        member = guild.join(1)
+        pipeline.submit(member)
+        del guild.members[1]
+        await asyncio.sleep(0.1)
+        return member
+    assert run(join_and_leave()).roles == []
+    assert pipeline.roles_assigned == 0
+
+def test_sparse_joins_are_welcomed_one_by_one(run, guild):
+    cog = FakeCog()
+    pipeline = JoinPipeline(cog)
+    async def join(member_id):
+        pipeline.submit(guild.join(member_id))
+        await asyncio.sleep(0.01)
+    run(join(1))
+    run(join(2))
+    assert len(cog.welcomes) == 2
+    assert pipeline.stats()["welcome_messages"] == 2
+
+def test_a_burst_is_welcomed_in_one_message(run, guild):
+    cog = FakeCog()
+    pipeline = JoinPipeline(cog)
+    threshold = channel_config.JOIN_BURST_THRESHOLD
+    async def burst():
+        # Welcomed one by one until the joins add up to a burst.
+        for member_id in range(1, threshold):
+            pipeline.submit(guild.join(member_id))
+            await asyncio.sleep(0.01)
+        for member_id in range(threshold, threshold + 5):
+            pipeline.submit(guild.join(member_id))
+        await asyncio.sleep(0.01)
+        # The burst is held back for WELCOME_BATCH_DELAY.
+        pending = pipeline.stats()["pending_welcomes"]
+        await asyncio.sleep(0.1)
+        return pending
+    assert run(burst()) == 5
+    assert len(cog.welcomes) == threshold
+    assert all(f"<@{member_id}>" in cog.welcomes[-1] for member_id in range(threshold, threshold + 5))
+    stats = pipeline.stats()
+    assert stats["members_welcomed"] == threshold + 4
+    assert stats["max_welcome_lag"] >= 0.05
@@ -0,0 +1,35 @@
+# tests/test_leaderboard_cache.py
+
+import time
+
+from cogs.economy import LeaderboardCache
+
+GUILD_ID = 1
+
+def page(*total_xps):
+    return [{"user_id": index, "total_xp": xp} for index, xp in enumerate(total_xps)]
+
+def test_cached_page_is_served_until_the_ttl():
+    now = 1000.0
+    cache = LeaderboardCache(top_n=3, ttl=300)
+    assert cache.get(GUILD_ID, now) is None
+    cache.put(GUILD_ID, page(30, 20, 10), "text", now)
+    assert cache.get(GUILD_ID, now + 299)[2] == "text"
+    assert cache.get(GUILD_ID, now + 300) is None
+    assert cache.stats() == {"guilds": 1, "hits": 1, "misses": 2, "invalidations": 0, "hit_rate": 1 / 3}
+
+def test_xp_below_the_page_keeps_it():
+    cache = LeaderboardCache(top_n=3)
+    cache.put(GUILD_ID, page(30, 20, 10), "text", 0)
+    cache.xp_changed(GUILD_ID, 99, 5)
+    assert cache._entries
+    cache.xp_changed(GUILD_ID, 99, 15)
+    assert not cache._entries and cache.invalidations == 1
+
+def test_settle_window_applies_without_a_cached_page():
+    cache = LeaderboardCache(top_n=3)
+    cache.xp_changed(GUILD_ID, 1, 50, settle=5)
+    # A page built now reads economy.db before the XP is flushed, so it must not be stored.
+    cache.put(GUILD_ID, page(30, 20, 10), "stale", time.time())
+    assert cache._entries == {}
+    assert cache.invalidations == 0
@@ -0,0 +1,37 @@
+# tests/test_ledger.py
+#
+# The append-only coin ledger and rebuilding balances from it.
+
+import sqlite3
+
+GUILD_ID = 1
+
+def balance(db, run, user_id):
+    return run(db.get_user_data(user_id, GUILD_ID))["balance"]
+
+def test_rebuild_balances_matches_after_mixed_writes(db, run, add_item):
+    item_id = add_item()
+    run(db.add_balance(1, GUILD_ID, 200))
+    run(db.add_balance(2, GUILD_ID, 50))
+    run(db.debit_if_sufficient(1, GUILD_ID, 30, credit=10))
+    run(db.transfer(1, 2, GUILD_ID, 25))
+    run(db.add_balance(2, GUILD_ID, -500, clamp=True))
+    async def purchase():
+        async with db.transaction() as tx:
+            tx.debit_if_sufficient(1, GUILD_ID, 50, reason="purchase", ref=f"item:{item_id}", required=True)
+            tx.add_balance(10, GUILD_ID, 40, reason="commission", ref=f"item:{item_id}")
+    run(purchase())
+    db.queue_chat_reward(3, GUILD_ID, balance=7)
+    assert run(db.rebuild_balances(apply=False)) == []
+
+def test_rebuild_balances_repairs_drift(db, run):
+    run(db.add_balance(1, GUILD_ID, 100))
+    con = sqlite3.connect(db.economy_db_path)
+    with con:
+        con.execute("UPDATE users SET balance = 999 WHERE user_id = 1")
+    con.close()
+    assert run(db.rebuild_balances(apply=False)) == [{"guild_id": GUILD_ID, "user_id": 1, "snapshot": 999, "rebuilt": 100}]
+    assert balance(db, run, 1) == 999
+    assert len(run(db.rebuild_balances())) == 1
+    assert balance(db, run, 1) == 100
+    assert run(db.rebuild_balances(apply=False)) == []
@@ -0,0 +1,58 @@
+# tests/test_maintenance.py
+#
+# Background maintenance and the one-time switch to incremental vacuum.
+
+import sqlite3
+
+import pytest
+
+import database
+
+def auto_vacuum(path):
+    con = sqlite3.connect(path)
+    try:
+        return con.execute("PRAGMA auto_vacuum").fetchone()[0]
+    finally:
+        con.close()
+
+@pytest.fixture
+def old_db(tmp_path, monkeypatch, run):
+    """A DatabaseManager on an economy.db created before auto_vacuum=INCREMENTAL was set."""
+    monkeypatch.chdir(tmp_path)
+    con = sqlite3.connect("economy.db")
+    con.execute("CREATE TABLE filler (data BLOB)")
+    con.close()
+    manager = database.DatabaseManager(None)
+    yield manager
+    run(manager.close())
+
+def test_new_files_use_incremental_vacuum(db):
+    assert auto_vacuum(db.economy_db_path) == 2
+    assert auto_vacuum(db.shop_db_path) == 2
+
+def test_maintenance_never_runs_a_full_vacuum(old_db, run):
+    report = run(old_db.run_maintenance())
+    assert not [entry for entry in report if "VACUUM" in entry["step"]]
+    assert auto_vacuum(old_db.economy_db_path) == 0
+
+def test_enabling_incremental_vacuum_converts_old_files_once(old_db, run):
+    report = run(old_db.enable_incremental_vacuum())
+    assert [entry["database"] for entry in report] == [old_db.economy_db_path]
+    assert auto_vacuum(old_db.economy_db_path) == 2
+    assert run(old_db.enable_incremental_vacuum()) == []
+
+def test_free_pages_are_released_incrementally(db, run, monkeypatch):
+    monkeypatch.setattr(database, "VACUUM_MIN_FREE_PAGES", 1)
+    con = sqlite3.connect(db.economy_db_path)
+    with con:
+        con.execute("CREATE TABLE filler (data BLOB)")
+        con.executemany("INSERT INTO filler VALUES (zeroblob(4096))", [()] * 50)
+    with con:
+        con.execute("DROP TABLE filler")
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    free_before = con.execute("PRAGMA freelist_count").fetchone()[0]
+    report = run(db.run_maintenance())
+    free_after = con.execute("PRAGMA freelist_count").fetchone()[0]
+    con.close()
+    assert any(entry["step"].startswith("incremental vacuum") for entry in report)
+    assert free_before > 0 and free_after < free_before
@@ -0,0 +1,118 @@
+# tests/test_migrations.py
+#
+# Upgrading databases written by the pre-migration code, and migrate() itself.
+
+import json
+import sqlite3
+
+import pytest
+
+import database
+
+GUILD_ID = 1
+
+def create_legacy_databases():
+    """economy.db, shop.db and channel_config.json as the old _init_sync left them."""
+    con = sqlite3.connect("economy.db")
+    con.execute("""
+        CREATE TABLE users (
+            user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL,
+            balance INTEGER DEFAULT 0, xp INTEGER DEFAULT 0, level INTEGER DEFAULT 1,
+            last_daily TEXT, daily_streak INTEGER DEFAULT 0,
+            last_coin_claim REAL DEFAULT 0, last_xp_claim REAL DEFAULT 0,
+            daily_spam_count INTEGER DEFAULT 0,
+            daily_stream_coins INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, guild_id)
+        )
+    """)
+    con.execute("ALTER TABLE users ADD COLUMN last_bump_timestamp REAL DEFAULT 0")
+    con.execute("INSERT INTO users (user_id, guild_id, balance, xp, level) VALUES (1, ?, 120, 30, 4)", (GUILD_ID,))
+    con.execute("INSERT INTO users (user_id, guild_id) VALUES (2, ?)", (GUILD_ID,)) # Created by a read, never written
+    con.commit()
+    con.close()
+
+    con = sqlite3.connect("shop.db")
+    con.execute("""
+        CREATE TABLE items (
+            item_id INTEGER PRIMARY KEY AUTOINCREMENT, creator_id INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL, item_name TEXT NOT NULL, application TEXT NOT NULL,
+            category TEXT NOT NULL, price INTEGER NOT NULL, product_link TEXT NOT NULL,
+            screenshot_link TEXT, screenshot_link_2 TEXT, screenshot_link_3 TEXT
+        )
+    """)
+    con.execute("ALTER TABLE items ADD COLUMN purchase_count INTEGER DEFAULT 0")
+    con.execute("ALTER TABLE items ADD COLUMN upload_timestamp REAL DEFAULT 0")
+    con.execute("ALTER TABLE items ADD COLUMN is_featured INTEGER DEFAULT 0")
+    con.execute(
+        "INSERT INTO items (creator_id, guild_id, item_name, application, category, price, product_link) VALUES (10, ?, 'Neon Overlay', 'OBS', 'Overlays', 40, 'x')",
+        (GUILD_ID,)
+    )
+    con.commit()
+    con.close()
+
+    with open(database.LEGACY_SETTINGS_FILE, "w") as f:
+        json.dump({str(GUILD_ID): {"ADMIN_ROLES": [5], "LEVEL_UP_CHANNEL_ID": 7}}, f)
+
+def schema_version(path):
+    con = sqlite3.connect(path)
+    try:
+        return con.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        con.close()
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch, run):
+    monkeypatch.chdir(tmp_path)
+    create_legacy_databases()
+    manager = database.DatabaseManager(None)
+    yield manager
+    run(manager.close())
+
+def test_legacy_databases_reach_the_latest_version(legacy_db):
+    assert schema_version("economy.db") == database.ECONOMY_MIGRATIONS[-1][0]
+    assert schema_version("shop.db") == database.SHOP_MIGRATIONS[-1][0]
+
+def test_legacy_data_survives_the_upgrade(legacy_db, run):
+    user = run(legacy_db.get_user_data(1, GUILD_ID))
+    assert (user["balance"], user["xp"], user["level"], user["total_xp"]) == (120, 30, 4, database.total_xp(4, 30))
+    # The opening ledger entry accounts for the existing balance.
+    assert run(legacy_db.rebuild_balances(apply=False)) == []
+    assert [item["item_name"] for item in run(legacy_db.search_items(GUILD_ID, "neon"))] == ["Neon Overlay"]
+    version, settings = run(legacy_db.load_guild_settings())
+    assert settings == {GUILD_ID: {"ADMIN_ROLES": [5], "LEVEL_UP_CHANNEL_ID": 7}}
+
+def test_rows_created_by_reads_are_pruned(legacy_db):
+    con = sqlite3.connect("economy.db")
+    try:
+        assert con.execute("SELECT user_id FROM users").fetchall() == [(1,)]
+    finally:
+        con.close()
+
+def test_indexes_are_created(legacy_db):
+    con = sqlite3.connect("economy.db")
+    try:
+        indexes = {row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    finally:
+        con.close()
+    assert {"idx_users_guild_total_xp", "idx_ledger_guild_user_ts"} <= indexes
+    assert "idx_users_guild_level_xp" not in indexes
+
+def test_an_upgraded_database_has_nothing_left_to_apply(legacy_db):
+    for path, migrations in (("economy.db", database.ECONOMY_MIGRATIONS), ("shop.db", database.SHOP_MIGRATIONS)):
+        con = sqlite3.connect(path, isolation_level=None)
+        try:
+            assert database.migrate(con, migrations) == []
+        finally:
+            con.close()
+
+def test_a_failing_migration_leaves_the_previous_version(tmp_path):
+    con = sqlite3.connect(tmp_path / "test.db", isolation_level=None)
+    migrations = [
+        (1, "create t", ["CREATE TABLE t (x INTEGER)"]),
+        (2, "broken", ["ALTER TABLE t ADD COLUMN y INTEGER", "INSERT INTO missing VALUES (1)"]),
+    ]
+    with pytest.raises(sqlite3.OperationalError):
+        database.migrate(con, migrations)
+    assert con.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert [row[1] for row in con.execute("PRAGMA table_info(t)")] == ["x"]
+    con.close()
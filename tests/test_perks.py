@@ -0,0 +1,61 @@
+# tests/test_perks.py
+#
+# Rank perks resolved from a member's roles.
+
+from types import SimpleNamespace
+
+import pytest
+
+from cogs import channel_config
+from cogs.channel_config import PERKS, PerkResolver, SettingsCache
+
+GUILD_ID = 1
+ELITE, MASTER, SUPREME = 100, 200, 300
+
+def member(member_id, *role_ids, guild_id=GUILD_ID):
+    return SimpleNamespace(id=member_id, guild=SimpleNamespace(id=guild_id), roles=[SimpleNamespace(id=role_id) for role_id in role_ids])
+
+@pytest.fixture
+def settings(db, run, monkeypatch):
+    cache = SettingsCache()
+    run(cache.bind(db))
+    run(cache.apply([(GUILD_ID, "ELITE_ROLE_ID", ELITE), (GUILD_ID, "MASTER_ROLE_ID", MASTER), (GUILD_ID, "SUPREME_ROLE_ID", SUPREME)]))
+    monkeypatch.setattr(channel_config, "_settings_cache", cache)
+    return cache
+
+def test_the_best_tier_wins(settings):
+    resolver = PerkResolver()
+    assert resolver.resolve(member(1)) is PERKS["default"]
+    assert resolver.resolve(member(2, ELITE)) is PERKS["elite"]
+    assert resolver.resolve(member(3, ELITE, SUPREME, MASTER)) is PERKS["supreme"]
+    assert resolver.resolve(member(4, MASTER, guild_id=2)) is PERKS["default"]
+
+def test_repeat_lookups_are_cache_hits(settings):
+    resolver = PerkResolver()
+    resolver.resolve(member(1, MASTER))
+    # The cached perks are returned even though the roles passed in changed;
+    # on_member_update calls forget() for that.
+    assert resolver.resolve(member(1)) is PERKS["master"]
+    assert (resolver.hits, resolver.misses) == (1, 1)
+
+def test_forget_drops_the_cached_member(settings):
+    resolver = PerkResolver()
+    resolver.resolve(member(1, MASTER))
+    resolver.forget(GUILD_ID, 1)
+    assert resolver.resolve(member(1)) is PERKS["default"]
+    assert resolver.misses == 2
+
+def test_least_recently_used_members_are_evicted(settings):
+    resolver = PerkResolver(max_members=2)
+    resolver.resolve(member(1, ELITE))
+    resolver.resolve(member(2, ELITE))
+    resolver.resolve(member(1, ELITE))
+    resolver.resolve(member(3, ELITE))
+    assert resolver.resolve(member(1)) is PERKS["elite"]
+    assert resolver.resolve(member(2)) is PERKS["default"]
+
+def test_a_settings_write_invalidates_cached_perks(settings, run):
+    resolver = PerkResolver()
+    assert resolver.resolve(member(1, ELITE)) is PERKS["elite"]
+    run(settings.apply([(GUILD_ID, "MASTER_ROLE_ID", ELITE)]))
+    assert resolver.resolve(member(1, ELITE)) is PERKS["master"]
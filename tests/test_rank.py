@@ -0,0 +1,57 @@
+# tests/test_rank.py
+#
+# total_xp and rank lookups.
+
+import sqlite3
+
+import database
+
+GUILD_ID = 1
+
+def set_level(db, run, user_id, level, xp, guild_id=GUILD_ID):
+    run(db.update_user_data(user_id, guild_id, {"level": level, "xp": xp}))
+
+def test_total_xp_matches_the_level_curve():
+    # Level L costs 100 + 50 * L XP to finish.
+    assert database.total_xp(1, 0) == 0
+    assert database.total_xp(2, 0) == 150
+    assert database.total_xp(3, 10) == 150 + 200 + 10
+
+def test_generated_column_agrees_with_total_xp(db, run):
+    set_level(db, run, 1, 7, 33)
+    assert run(db.get_user_data(1, GUILD_ID))["total_xp"] == database.total_xp(7, 33)
+
+def test_rank_counts_users_strictly_above(db, run):
+    set_level(db, run, 1, 5, 0)
+    set_level(db, run, 2, 3, 50)
+    set_level(db, run, 3, 3, 50)
+    set_level(db, run, 4, 1, 10)
+    set_level(db, run, 5, 9, 0, guild_id=2)
+    assert [run(db.get_user_rank(user_id, GUILD_ID))[0] for user_id in (1, 2, 3, 4)] == [1, 2, 2, 4]
+    assert run(db.count_ranked_users(GUILD_ID)) == 4
+
+def test_buffered_xp_counts_towards_the_rank(db, run):
+    set_level(db, run, 1, 2, 0)
+    db.queue_chat_reward(2, GUILD_ID, xp=10, level=3)
+    rank, player = run(db.get_user_rank(2, GUILD_ID))
+    assert player["total_xp"] == database.total_xp(3, 10)
+    assert rank == 1
+
+def test_leaderboard_pages_follow_total_xp(db, run):
+    for user_id in range(1, 8):
+        set_level(db, run, user_id, user_id, 0)
+    first = run(db.get_leaderboard(GUILD_ID, limit=3))
+    second = run(db.get_leaderboard(GUILD_ID, limit=3, offset=3))
+    assert [row["user_id"] for row in first + second] == [7, 6, 5, 4, 3, 2]
+
+def test_rank_count_is_a_range_search_on_the_index(db):
+    con = sqlite3.connect(db.economy_db_path)
+    try:
+        plan = " ".join(row[3] for row in con.execute(
+            "EXPLAIN QUERY PLAN SELECT COUNT(*) FROM users WHERE guild_id = ? AND total_xp > ?", (GUILD_ID, 0)
+        ))
+    finally:
+        con.close()
+    # SQLite doesn't call an index on a virtual column "covering", but the row
+    # lookup it plans is deferred and COUNT(*) never needs it.
+    assert "USING INDEX idx_users_guild_total_xp (guild_id=? AND total_xp>?)" in plan
@@ -0,0 +1,76 @@
+# tests/test_retry.py
+#
+# Retrying calls that hit a locked database.
+
+import sqlite3
+import threading
+
+import pytest
+
+import database
+from database import RetryPolicy
+
+def flaky(failures, error=None):
+    """A call that raises `error` (a locked-database error by default) `failures` times, then returns "ok"."""
+    calls = []
+    def call():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error or sqlite3.OperationalError("database is locked")
+        return "ok"
+    return call, calls
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(database.time, "sleep", delays.append)
+    return delays
+
+def test_locked_calls_are_retried_until_they_succeed(sleeps):
+    policy = RetryPolicy(max_attempts=5)
+    call, calls = flaky(2)
+    assert policy.run("get_user_data", call) == "ok"
+    assert len(calls) == 3 and len(sleeps) == 2
+    assert policy.snapshot() == {"get_user_data": {"retries": 2, "recovered": 1, "give_ups": 0}}
+
+def test_giving_up_raises_the_last_error(sleeps):
+    policy = RetryPolicy(max_attempts=3)
+    call, calls = flaky(10)
+    with pytest.raises(sqlite3.OperationalError):
+        policy.run("get_user_data", call)
+    assert len(calls) == 3
+    assert policy.snapshot() == {"get_user_data": {"retries": 2, "recovered": 0, "give_ups": 1}}
+
+def test_other_errors_are_not_retried(sleeps):
+    policy = RetryPolicy()
+    call, calls = flaky(1, sqlite3.OperationalError("no such table: users"))
+    with pytest.raises(sqlite3.OperationalError):
+        policy.run("get_user_data", call)
+    call, _ = flaky(1, ValueError("bad input"))
+    with pytest.raises(ValueError):
+        policy.run("get_user_data", call)
+    assert len(calls) == 1 and sleeps == []
+    assert policy.snapshot() == {}
+
+def test_delays_are_jittered_and_capped():
+    policy = RetryPolicy(base_delay=0.01, max_delay=0.05)
+    for attempt in range(8):
+        delays = [policy.delay(attempt) for _ in range(50)]
+        assert all(0 <= delay <= min(0.05, 0.01 * 2 ** attempt) for delay in delays)
+        assert len(set(delays)) > 1
+
+def test_a_real_lock_is_recognised_and_waited_out(tmp_path):
+    path = tmp_path / "locked.db"
+    holder = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    holder.execute("CREATE TABLE t (x)")
+    holder.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.05, holder.execute, ("COMMIT",)).start()
+    con = sqlite3.connect(path, isolation_level=None, timeout=0)
+    policy = RetryPolicy(max_attempts=50, base_delay=0.01, max_delay=0.02)
+    try:
+        policy.run("insert", con.execute, "INSERT INTO t VALUES (1)")
+    finally:
+        con.close()
+        holder.close()
+    counts = policy.snapshot()["insert"]
+    assert counts["retries"] >= 1 and counts["recovered"] == 1
@@ -0,0 +1,56 @@
+# tests/test_rewards.py
+#
+# Write-behind chat rewards: merging buffered values into reads, and flushing them.
+
+import asyncio
+import sqlite3
+
+import database
+
+GUILD_ID = 1
+
+def balance(db, run, user_id):
+    return run(db.get_user_data(user_id, GUILD_ID))["balance"]
+
+def stored_user(path, user_id):
+    """The users row as stored, bypassing the reward buffer."""
+    con = sqlite3.connect(path)
+    try:
+        return con.execute("SELECT balance, xp FROM users WHERE user_id = ? AND guild_id = ?", (user_id, GUILD_ID)).fetchone()
+    finally:
+        con.close()
+
+def test_buffered_rewards_merge_after_a_flush(db, run):
+    db.queue_chat_reward(1, GUILD_ID, balance=5, xp=10)
+    assert balance(db, run, 1) == 5
+    run(db.flush_rewards())
+    assert stored_user(db.economy_db_path, 1) == (5, 10)
+
+    db.queue_chat_reward(1, GUILD_ID, balance=3, xp=20)
+    user = run(db.get_user_data(1, GUILD_ID))
+    assert (user["balance"], user["xp"]) == (8, 20)
+    run(db.flush_rewards())
+    user = run(db.get_user_data(1, GUILD_ID))
+    assert (user["balance"], user["xp"]) == (8, 20)
+    assert stored_user(db.economy_db_path, 1) == (8, 20)
+
+def test_balance_write_folds_in_buffered_rewards_once(db, run):
+    db.queue_chat_reward(1, GUILD_ID, balance=5)
+    assert run(db.add_balance(1, GUILD_ID, 10)) == 15
+    assert balance(db, run, 1) == 15
+    run(db.flush_rewards())
+    assert balance(db, run, 1) == 15
+    assert sorted((e["reason"], e["delta"]) for e in run(db.get_ledger(1, GUILD_ID))) == [("adjust", 10), ("chat", 5)]
+
+def test_close_keeps_a_flush_that_was_waiting_to_commit(tmp_path, monkeypatch, run):
+    monkeypatch.chdir(tmp_path)
+    db = database.DatabaseManager(None, write_max_latency=0.2, reward_flush_interval=0.01)
+
+    async def scenario():
+        await db.start()
+        db.queue_chat_reward(1, GUILD_ID, balance=50, xp=10)
+        # The flush loop has queued its write; the writer is still inside its latency window.
+        await asyncio.sleep(0.05)
+        await db.close()
+    run(scenario())
+    assert stored_user(db.economy_db_path, 1) == (50, 10)
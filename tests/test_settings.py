@@ -0,0 +1,68 @@
+# tests/test_settings.py
+#
+# Guild settings stored in SQLite and served from SettingsCache.
+
+import pytest
+
+from cogs.channel_config import SettingsCache
+
+GUILD_ID = 1
+
+@pytest.fixture
+def cache(db, run):
+    cache = SettingsCache()
+    run(cache.bind(db))
+    return cache
+
+def test_settings_persist_across_caches(db, run, cache):
+    run(cache.apply([(GUILD_ID, "ADMIN_ROLES", [5, 6]), (GUILD_ID, "LEVEL_UP_CHANNEL_ID", 7)]))
+    fresh = SettingsCache()
+    run(fresh.bind(db))
+    assert dict(fresh.guild(GUILD_ID)) == {"ADMIN_ROLES": (5, 6), "LEVEL_UP_CHANNEL_ID": 7}
+
+def test_snapshots_are_frozen_and_reused(run, cache):
+    run(cache.apply([(GUILD_ID, "ADMIN_ROLES", [5])]))
+    snapshot = cache.guild(GUILD_ID)
+    assert cache.guild(GUILD_ID) is snapshot
+    with pytest.raises(TypeError):
+        snapshot["ADMIN_ROLES"] = [6]
+    assert cache.guild(2) == {}
+
+def test_a_write_replaces_the_snapshot(run, cache):
+    run(cache.apply([(GUILD_ID, "ADMIN_ROLES", [5])]))
+    before = cache.guild(GUILD_ID)
+    run(cache.apply([(GUILD_ID, "ADMIN_ROLES", [5, 6])]))
+    assert cache.guild(GUILD_ID) is not before
+    assert before["ADMIN_ROLES"] == (5,)
+
+def test_none_removes_a_setting(run, cache):
+    run(cache.apply([(GUILD_ID, "ADMIN_ROLES", [5]), (GUILD_ID, "LEVEL_UP_CHANNEL_ID", 7)]))
+    run(cache.apply([(GUILD_ID, "ADMIN_ROLES", None)]))
+    assert dict(cache.guild(GUILD_ID)) == {"LEVEL_UP_CHANNEL_ID": 7}
+
+def test_reads_never_touch_the_database(db, run, cache, monkeypatch):
+    run(cache.apply([(GUILD_ID, "ADMIN_ROLES", [5])]))
+    def fail(*args, **kwargs):
+        raise AssertionError("settings read hit the database")
+    monkeypatch.setattr(db, "_run_sync", fail)
+    assert cache.guild(GUILD_ID)["ADMIN_ROLES"] == (5,)
+    assert cache.all() == {str(GUILD_ID): {"ADMIN_ROLES": [5]}}
+
+def test_refresh_picks_up_writes_from_elsewhere_only_once(db, run, cache):
+    loads = cache.loads
+    run(cache.refresh())
+    assert cache.loads == loads
+    async def write_elsewhere():
+        await db.write_guild_settings([(GUILD_ID, "LEVEL_UP_CHANNEL_ID", 9)])
+    run(write_elsewhere())
+    assert cache.guild(GUILD_ID) == {}
+    run(cache.refresh())
+    assert dict(cache.guild(GUILD_ID)) == {"LEVEL_UP_CHANNEL_ID": 9}
+    run(cache.refresh())
+    assert cache.loads == loads + 1
+
+def test_own_writes_do_not_trigger_a_reload(run, cache):
+    loads = cache.loads
+    run(cache.apply([(GUILD_ID, "ADMIN_ROLES", [5])]))
+    run(cache.refresh())
+    assert cache.loads == loads
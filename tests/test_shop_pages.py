@@ -0,0 +1,65 @@
+# tests/test_shop_pages.py
+#
+# Keyset-paginated shop listings.
+
+import sqlite3
+
+import pytest
+
+import database
+
+GUILD_ID = 1
+
+def all_pages(db, run, order, limit):
+    pages, key = [], None
+    while True:
+        rows, key = run(db.get_items_page(GUILD_ID, order, after_key=key, limit=limit))
+        pages.append([row["item_id"] for row in rows])
+        if key is None:
+            return pages
+
+@pytest.fixture
+def items(db, run, add_item):
+    """Seven items in guild 1 (two of them bought) and one in guild 2."""
+    ids = [add_item(name=name) for name in ("delta", "alpha", "golf", "charlie", "echo", "bravo", "foxtrot")]
+    add_item(name="hotel", guild_id=2)
+    for item_id in (ids[2], ids[2], ids[4]):
+        run(db.increment_purchase_count(item_id, GUILD_ID))
+    return ids
+
+@pytest.mark.parametrize("order", sorted(database.ITEM_PAGE_ORDERS))
+def test_pages_cover_every_item_once_in_order(db, run, items, order):
+    pages = all_pages(db, run, order, limit=3)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    column, direction = database.ITEM_PAGE_ORDERS[order]
+    con = sqlite3.connect(db.shop_db_path)
+    try:
+        expected = [row[0] for row in con.execute(
+            f"SELECT item_id FROM items WHERE guild_id = ? ORDER BY {column} {direction}, item_id {direction}", (GUILD_ID,)
+        )]
+    finally:
+        con.close()
+    assert [item_id for page in pages for item_id in page] == expected
+
+def test_popular_breaks_ties_by_item_id(db, run, items):
+    first_page, _ = run(db.get_items_page(GUILD_ID, "popular", limit=3))
+    assert [row["item_id"] for row in first_page] == [items[2], items[4], max(set(items) - {items[2], items[4]})]
+
+def test_a_full_last_page_is_followed_by_an_empty_one(db, run, items):
+    pages = all_pages(db, run, "name", limit=7)
+    assert [len(page) for page in pages] == [7, 0]
+
+@pytest.mark.parametrize("order", sorted(database.ITEM_PAGE_ORDERS))
+def test_pages_are_read_from_an_index_without_sorting(db, order):
+    column, direction = database.ITEM_PAGE_ORDERS[order]
+    comparison = "<" if direction == "DESC" else ">"
+    con = sqlite3.connect(db.shop_db_path)
+    try:
+        plan = " ".join(row[3] for row in con.execute(
+            f"EXPLAIN QUERY PLAN SELECT item_id, item_name, price, {column} FROM items WHERE guild_id = ? "
+            f"AND ({column}, item_id) {comparison} (?, ?) ORDER BY {column} {direction}, item_id {direction} LIMIT ?",
+            (GUILD_ID, 0, 0, 25)
+        ))
+    finally:
+        con.close()
+    assert "USING INDEX" in plan and "TEMP B-TREE" not in plan
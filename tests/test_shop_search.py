@@ -0,0 +1,61 @@
+# tests/test_shop_search.py
+#
+# Shop search through the items_fts index.
+
+import sqlite3
+
+import database
+
+GUILD_ID = 1
+
+def names(results):
+    return sorted(item["item_name"] for item in results)
+
+def test_every_word_matches_as_a_prefix(db, run, add_item):
+    add_item(name="Galaxy Transitions", application="Premiere Pro", category="Transitions")
+    add_item(name="Neon Glow", application="After Effects", category="Presets")
+    assert names(run(db.search_items(GUILD_ID, "gal"))) == ["Galaxy Transitions"]
+    assert names(run(db.search_items(GUILD_ID, "gal prem"))) == ["Galaxy Transitions"]
+    assert names(run(db.search_items(GUILD_ID, "gal after"))) == []
+    assert names(run(db.search_items(GUILD_ID, "after eff"))) == ["Neon Glow"]
+
+def test_search_only_returns_the_guilds_items(db, run, add_item):
+    add_item(name="Galaxy Pack", guild_id=GUILD_ID)
+    add_item(name="Galaxy Pack Deluxe", guild_id=2)
+    assert names(run(db.search_items(GUILD_ID, "galaxy"))) == ["Galaxy Pack"]
+    assert names(run(db.search_items(2, "galaxy"))) == ["Galaxy Pack Deluxe"]
+
+def test_words_never_match_the_guild_id(db, run, add_item):
+    add_item(name="Galaxy Pack", guild_id=123)
+    assert run(db.search_items(123, "123")) == []
+    assert names(run(db.search_items(123, "galaxy"))) == ["Galaxy Pack"]
+
+def test_name_matches_rank_above_category_matches(db, run, add_item):
+    add_item(name="Plain Pack", category="Glow")
+    add_item(name="Glow Pack", category="Overlays")
+    assert [item["item_name"] for item in run(db.search_items(GUILD_ID, "glow"))] == ["Glow Pack", "Plain Pack"]
+
+def test_index_follows_renames_and_deletes(db, run, add_item):
+    item_id = add_item(name="Galaxy Pack")
+    con = sqlite3.connect(db.shop_db_path)
+    with con:
+        con.execute("UPDATE items SET item_name = 'Nebula Pack' WHERE item_id = ?", (item_id,))
+    con.close()
+    assert run(db.search_items(GUILD_ID, "galaxy")) == []
+    assert names(run(db.search_items(GUILD_ID, "nebula"))) == ["Nebula Pack"]
+    run(db.delete_item(item_id, GUILD_ID))
+    assert run(db.search_items(GUILD_ID, "nebula")) == []
+
+def test_punctuation_only_queries_fall_back_to_like(db, run, add_item):
+    add_item(name="C++ Pack")
+    assert names(run(db.search_items(GUILD_ID, "++"))) == ["C++ Pack"]
+
+def test_a_missing_index_is_created_at_startup(tmp_path):
+    con = sqlite3.connect(tmp_path / "shop.db", isolation_level=None)
+    con.row_factory = sqlite3.Row
+    database.migrate(con, database.SHOP_MIGRATIONS)
+    # As if the migrations had run on a SQLite without FTS5.
+    con.execute("DROP TABLE items_fts")
+    assert database.ensure_items_search_index(con)
+    assert database.has_items_search_index(con)
+    con.close()
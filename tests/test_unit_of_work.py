@@ -0,0 +1,49 @@
+# tests/test_unit_of_work.py
+#
+# `async with db.transaction()` units spanning economy.db and shop.db.
+
+GUILD_ID = 1
+
+def balance(db, run, user_id):
+    return run(db.get_user_data(user_id, GUILD_ID))["balance"]
+
+def buy(db, run, item_id, buyer_id, price, commission):
+    async def scenario():
+        async with db.transaction() as tx:
+            found = tx.get_item_details(item_id, GUILD_ID, required=True)
+            paid = tx.debit_if_sufficient(buyer_id, GUILD_ID, price, reason="purchase", ref=f"item:{item_id}", required=True)
+            tx.add_balance(found["creator_id"], GUILD_ID, commission, reason="commission", ref=f"item:{item_id}")
+            tx.increment_purchase_count(item_id, GUILD_ID)
+        return tx.committed, paid
+    return run(scenario())
+
+def test_purchase_commits_every_step(db, run, add_item):
+    item_id = add_item()
+    run(db.add_balance(1, GUILD_ID, 100))
+    committed, paid = buy(db, run, item_id, 1, 50, 40)
+    assert committed and paid.value == 50
+    assert (balance(db, run, 1), balance(db, run, 10)) == (50, 40)
+    assert run(db.get_item_details(item_id, GUILD_ID))["purchase_count"] == 1
+
+def test_purchase_rolls_back_when_the_buyer_cannot_pay(db, run, add_item):
+    item_id = add_item()
+    run(db.add_balance(1, GUILD_ID, 20))
+    committed, paid = buy(db, run, item_id, 1, 50, 40)
+    assert not committed and paid.value is None
+    assert (balance(db, run, 1), balance(db, run, 10)) == (20, 0)
+    assert run(db.get_item_details(item_id, GUILD_ID))["purchase_count"] == 0
+    assert run(db.get_ledger(10, GUILD_ID)) == []
+
+def test_purchase_rolls_back_steps_that_already_ran(db, run, add_item):
+    item_id = add_item()
+    run(db.add_balance(1, GUILD_ID, 100))
+    async def scenario():
+        async with db.transaction() as tx:
+            tx.debit_if_sufficient(1, GUILD_ID, 50, reason="purchase", required=True)
+            tx.increment_purchase_count(item_id, GUILD_ID)
+            tx.get_item_details(item_id + 1, GUILD_ID, required=True)
+        return tx.committed
+    assert run(scenario()) is False
+    assert balance(db, run, 1) == 100
+    assert run(db.get_item_details(item_id, GUILD_ID))["purchase_count"] == 0
+    assert len(run(db.get_ledger(1, GUILD_ID))) == 1
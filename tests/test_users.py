@@ -0,0 +1,38 @@
+# tests/test_users.py
+#
+# User rows: virtual defaults on read, created by the first write's upsert.
+
+import asyncio
+import sqlite3
+
+GUILD_ID = 1
+
+def stored_rows(db):
+    con = sqlite3.connect(db.economy_db_path)
+    try:
+        return con.execute("SELECT user_id, guild_id, balance, xp, level, daily_streak FROM users ORDER BY user_id").fetchall()
+    finally:
+        con.close()
+
+def test_reading_an_unknown_user_creates_no_row(db, run):
+    user = run(db.get_user_data(1, GUILD_ID))
+    assert (user["user_id"], user["guild_id"], user["balance"], user["level"], user["total_xp"]) == (1, GUILD_ID, 0, 1, 0)
+    assert stored_rows(db) == []
+
+def test_first_write_creates_the_row_with_defaults(db, run):
+    run(db.update_user_data(1, GUILD_ID, {"daily_streak": 3}))
+    assert stored_rows(db) == [(1, GUILD_ID, 0, 0, 1, 3)]
+
+def test_later_writes_update_only_their_columns(db, run):
+    run(db.update_user_data(1, GUILD_ID, {"daily_streak": 3, "xp": 40}))
+    run(db.update_user_data(1, GUILD_ID, {"xp": 70}))
+    assert stored_rows(db) == [(1, GUILD_ID, 0, 70, 1, 3)]
+
+def test_racing_first_writes_create_one_row(db, run):
+    async def scenario():
+        await asyncio.gather(
+            *(db.update_user_data(1, GUILD_ID, {"daily_streak": 2}) for _ in range(10)),
+            *(db.add_balance(1, GUILD_ID, 5) for _ in range(10)),
+        )
+    run(scenario())
+    assert stored_rows(db) == [(1, GUILD_ID, 50, 0, 1, 2)]